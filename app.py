@@ -6,8 +6,8 @@ import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Now import the utility modules
-from utils.auth import check_authentication, login_user, logout_user
-from utils.db import initialize_database
+from utils.auth import check_authentication, login_user, logout_user, restore_session, sync_session_cookies, save_server_session
+from utils.db import initialize_database, rerun_connection
 from utils.ui import set_page_config, render_login_form
 import streamlit as st
 
@@ -73,8 +73,11 @@ def render_login_page():
 
 # Main application
 def main():
-    # Check if user is authenticated
-    if not st.session_state.authenticated:
+    # Write the session cookies set or cleared by the last login/logout
+    sync_session_cookies()
+    
+    # Check if user is authenticated, restoring a remembered session first
+    if not st.session_state.authenticated and not restore_session():
         # Use the new enhanced login page
         render_login_page()
     else:
@@ -96,4 +99,10 @@ def main():
             render_employee_dashboard()
 
 if __name__ == "__main__":
-    main()
+    # Every db call in this script run shares one pooled connection
+    with rerun_connection():
+        try:
+            main()
+        finally:
+            # Keep the server-side session, if any, in step with this run (also on st.rerun)
+            save_server_session()
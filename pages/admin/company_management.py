@@ -1,6 +1,6 @@
 import streamlit as st
 from utils.ui import render_page_title, user_status_indicator, clean_url
-from utils.db import get_companies, create_company, toggle_company_status, get_branches, get_employees
+from utils.db import get_companies, get_company_stats, create_company, toggle_company_status, get_branches, get_employees
 from utils.auth import check_admin
 
 def render_company_management():
@@ -47,6 +47,7 @@ def render_company_management():
     st.write("### Company List")
     
     companies = get_companies()
+    company_stats = get_company_stats()
     
     if companies:
         for company in companies:
@@ -70,14 +71,13 @@ def render_company_management():
                     st.write(f"### {company_name}")
                     st.caption(f"Username: {username}")
                     
-                    branches = get_branches(company_id)
-                    employees = get_employees(company_id=company_id)
+                    stats = company_stats.get(company_id, {})
                     
                     col_a, col_b = st.columns(2)
                     with col_a:
-                        st.write(f"**Branches:** {len(branches)}")
+                        st.write(f"**Branches:** {stats.get('branches', 0)}")
                     with col_b:
-                        st.write(f"**Employees:** {len(employees)}")
+                        st.write(f"**Employees:** {stats.get('employees', 0)}")
                 
                 with col3:
                     st.markdown(user_status_indicator(is_active), unsafe_allow_html=True)
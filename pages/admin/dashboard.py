@@ -1,7 +1,9 @@
 import streamlit as st
-from utils.ui import render_navigation, render_page_title, user_status_indicator
-from utils.db import get_companies, get_branches, get_employees
-from utils.auth import check_admin
+from utils.ui import render_navigation, render_page_title, user_status_indicator, render_freshness
+from utils.db import get_cache_stats
+from utils.passwords import get_login_stats
+from utils.dashboard_data import load_dashboard, load_admin_dashboard, request_refresh
+from utils.auth import check_admin, get_limiter_stats
 
 def render_admin_dashboard():
     """Render admin dashboard."""
@@ -37,25 +39,24 @@ def render_dashboard():
     """Render admin dashboard homepage."""
     render_page_title("Admin Dashboard", "Overview of system statistics", "🏠")
     
+    # Last known figures, refreshed in the background once they are stale
+    dashboard = load_dashboard("admin_dashboard", load_admin_dashboard)
+    render_freshness(dashboard, request_refresh, ("admin_dashboard",))
+    if dashboard.data is None:
+        return
+    
     # Get data for statistics
-    companies = get_companies()
+    companies = dashboard.data["companies"]
     
     # Initialize counts
     total_companies = len(companies)
     active_companies = sum(1 for company in companies if company[4])  # is_active
     inactive_companies = total_companies - active_companies
     
-    total_branches = 0
-    total_employees = 0
-    
     # Count branches and employees
-    for company in companies:
-        company_id = company[0]
-        branches = get_branches(company_id)
-        total_branches += len(branches)
-        
-        employees = get_employees(company_id=company_id)
-        total_employees += len(employees)
+    company_stats = dashboard.data["company_stats"]
+    total_branches = sum(stats["branches"] for stats in company_stats.values())
+    total_employees = sum(stats["employees"] for stats in company_stats.values())
     
     # Display statistics
     st.write("### System Overview")
@@ -78,6 +79,23 @@ def render_dashboard():
         with st.container(border=True):
             st.metric("Total Employees", total_employees)
     
+    # Counters of the server process serving this page; each replica keeps its own
+    cache_stats = get_cache_stats()
+    st.caption(
+        f"Query cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+        f"{cache_stats['invalidations']} invalidations, {cache_stats['cached_results']} cached results"
+    )
+    login_stats = get_login_stats()
+    st.caption(
+        f"Logins: {login_stats['logins']} ({login_stats['failures']} failed), "
+        f"latency avg {login_stats['avg_ms']} ms, p95 {login_stats['p95_ms']} ms, max {login_stats['max_ms']} ms"
+    )
+    limiter_stats = get_limiter_stats()
+    st.caption(
+        f"Login attempts refused: {limiter_stats['username']} per username, {limiter_stats['client']} per client, "
+        f"{limiter_stats['busy']} while busy"
+    )
+    
     # Display recent companies
     st.write("### Recent Companies")
     
@@ -96,10 +114,9 @@ def render_dashboard():
                     st.caption(f"Username: {username}")
                 
                 with col2:
-                    branches = get_branches(company_id)
-                    employees = get_employees(company_id=company_id)
-                    st.write(f"Branches: {len(branches)}")
-                    st.write(f"Employees: {len(employees)}")
+                    stats = company_stats.get(company_id, {})
+                    st.write(f"Branches: {stats.get('branches', 0)}")
+                    st.write(f"Employees: {stats.get('employees', 0)}")
                 
                 with col3:
                     st.markdown(user_status_indicator(is_active), unsafe_allow_html=True)
@@ -1,6 +1,6 @@
 import streamlit as st
-from utils.ui import render_page_title, render_message_card
-from utils.db import get_companies, send_message, get_messages, delete_message
+from utils.ui import render_page_title, render_message_card, get_page_cursor, render_pagination, PAGE_SIZE
+from utils.db import get_companies, send_message, get_conversation, message_cursor, delete_message
 from utils.auth import check_admin
 
 def render_messages():
@@ -63,11 +63,14 @@ def render_messages():
     # Message list
     st.write("### Message History")
     
-    # Get sent messages
-    sent_messages = get_messages(sender_type="admin", sender_id=st.session_state.user_id)
-    
-    # Get received messages (replies from companies)
-    received_messages = get_messages(receiver_type="admin", receiver_id=st.session_state.user_id)
+    # Get one page of sent and received messages (replies from companies) in one query
+    # (one extra row tells whether older messages exist)
+    all_messages = get_conversation("admin", st.session_state.user_id,
+                                    limit=PAGE_SIZE + 1, after=get_page_cursor("admin_messages"))
+    has_older_messages = len(all_messages) > PAGE_SIZE
+    all_messages = all_messages[:PAGE_SIZE]
+    sent_messages = [message for message in all_messages if message[1] == "admin"]
+    received_messages = [message for message in all_messages if message[1] != "admin"]
     
     tab1, tab2 = st.tabs(["Sent Messages", "Received Messages"])
     
@@ -75,7 +78,7 @@ def render_messages():
         if sent_messages:
             for message in sent_messages:
                 # Get company name for display
-                company_id = message[3]  # receiver_id
+                company_id = message[4]  # receiver_id
                 company_name = next((company[1] for company in companies if company[0] == company_id), f"Company {company_id}")
                 
                 render_message_card(
@@ -91,7 +94,7 @@ def render_messages():
         if received_messages:
             for message in received_messages:
                 # Get company name for display
-                company_id = message[1]  # sender_id
+                company_id = message[2]  # sender_id
                 company_name = next((company[1] for company in companies if company[0] == company_id), f"Company {company_id}")
                 
                 render_message_card(
@@ -102,3 +105,7 @@ def render_messages():
                 )
         else:
             st.info("No received messages found")
+    
+    if all_messages:
+        render_pagination("admin_messages", has_older_messages, message_cursor(all_messages[-1]),
+                          previous_label="← Newer", next_label="Older →")
@@ -1,6 +1,6 @@
 import streamlit as st
-from utils.ui import render_navigation, render_page_title, user_status_indicator, task_status_indicator
-from utils.db import get_employees, get_tasks
+from utils.ui import render_navigation, render_page_title, user_status_indicator, task_status_indicator, render_freshness
+from utils.dashboard_data import load_dashboard, load_branch_dashboard, request_refresh
 from utils.auth import check_asst_manager
 
 def render_asst_manager_dashboard():
@@ -45,21 +45,26 @@ def render_dashboard():
     """Render assistant manager dashboard homepage."""
     render_page_title("Assistant Manager Dashboard", "Overview of your branch activities", "🏠")
     
+    # Last known figures, refreshed in the background once they are stale
+    dashboard = load_dashboard("asst_manager_dashboard", load_branch_dashboard, st.session_state.branch_id, st.session_state.user_id)
+    render_freshness(dashboard, request_refresh, ("asst_manager_dashboard",))
+    if dashboard.data is None:
+        return
+    
     # Get data for statistics
-    branch_employees = get_employees(branch_id=st.session_state.branch_id)
+    branch_employees = dashboard.data["branch_employees"]
     
     # Filter out managers and assistant managers (including self)
     general_employees = [e for e in branch_employees if e[4] == "employee"]
     
-    # Get tasks assigned to this branch
-    branch_tasks = get_tasks(branch_id=st.session_state.branch_id)
-    completed_tasks = [t for t in branch_tasks if t[7]]  # is_completed
-    pending_tasks = [t for t in branch_tasks if not t[7]]  # is_completed
+    # Completed/total task counts for every employee in the branch
+    employee_task_stats = dashboard.data["employee_task_stats"]
+    
+    # Count tasks assigned to this branch
+    branch_task_counts = dashboard.data["branch_task_counts"]
     
-    # Get personal tasks assigned to assistant manager
-    asst_manager_tasks = get_tasks(employee_id=st.session_state.user_id)
-    asst_manager_completed_tasks = [t for t in asst_manager_tasks if t[7]]  # is_completed
-    asst_manager_pending_tasks = [t for t in asst_manager_tasks if not t[7]]  # is_completed
+    # Get the 5 newest personal tasks assigned to assistant manager
+    asst_manager_tasks = dashboard.data["own_tasks"]
     
     # Display statistics
     st.write("### Branch Overview")
@@ -72,15 +77,15 @@ def render_dashboard():
     
     with col2:
         with st.container(border=True):
-            st.metric("Branch Tasks", len(branch_tasks))
+            st.metric("Branch Tasks", branch_task_counts["total"])
     
     with col3:
         with st.container(border=True):
-            st.metric("Completed Tasks", len(completed_tasks))
+            st.metric("Completed Tasks", branch_task_counts["completed"])
     
     with col4:
         with st.container(border=True):
-            st.metric("Pending Tasks", len(pending_tasks))
+            st.metric("Pending Tasks", branch_task_counts["pending"])
     
     # Display employee information
     st.write("### General Employees")
@@ -100,11 +105,10 @@ def render_dashboard():
                     st.caption(f"Username: {employee_username}")
                 
                 with col2:
-                    # Get tasks for this employee
-                    employee_tasks = get_tasks(employee_id=employee_id)
-                    completed = sum(1 for t in employee_tasks if t[7])
+                    # Task counts for this employee
+                    task_stats = employee_task_stats.get(employee_id, {"completed": 0, "total": 0})
                     
-                    st.write(f"Tasks: {completed}/{len(employee_tasks)} completed")
+                    st.write(f"Tasks: {task_stats['completed']}/{task_stats['total']} completed")
                 
                 with col3:
                     st.markdown(user_status_indicator(employee_active), unsafe_allow_html=True)
@@ -118,11 +122,11 @@ def render_dashboard():
     
     if asst_manager_tasks:
         with st.container(border=True):
-            for task in asst_manager_tasks[:5]:
+            for task in asst_manager_tasks:
                 task_id = task[0]
                 task_title = task[1]
                 task_description = task[2]
-                is_completed = task[7]
+                is_completed = task[9]  # Your own completion status
                 
                 col1, col2 = st.columns([3, 1])
                 
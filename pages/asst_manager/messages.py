@@ -1,6 +1,6 @@
 import streamlit as st
-from utils.ui import render_page_title, render_message_card
-from utils.db import get_employees, send_message, get_messages, delete_message
+from utils.ui import render_page_title, render_message_card, get_page_cursor, render_pagination
+from utils.db import get_employees, send_message, get_messages, get_conversation, message_cursor, delete_message
 from utils.auth import check_asst_manager
 
 def render_messages():
@@ -119,17 +119,15 @@ def render_messages():
         with col2:
             st.write("### Message History")
             
-            # Get sent messages to employees
-            sent_messages = get_messages(sender_type="asst_manager", sender_id=st.session_state.user_id)
+            # Get 10 messages exchanged with employees at a time, in both directions
+            # (one extra row tells whether older messages exist)
+            all_messages = get_conversation("asst_manager", st.session_state.user_id, other_type="employee",
+                                            limit=11, after=get_page_cursor("asst_manager_messages"))
+            has_older_messages = len(all_messages) > 10
+            all_messages = all_messages[:10]
             
-            # Get received messages from employees
-            received_messages = get_messages(receiver_type="asst_manager", receiver_id=st.session_state.user_id, sender_type="employee")
-            
-            if sent_messages or received_messages:
-                # Combine and sort by date
-                all_messages = sorted(sent_messages + received_messages, key=lambda x: x[8], reverse=True)
-                
-                for message in all_messages[:10]:  # Show only latest 10 messages
+            if all_messages:
+                for message in all_messages:
                     sender_type = message[1]  # sender_type
                     sender_id = message[2]  # sender_id
                     receiver_type = message[3]  # receiver_type
@@ -157,5 +155,8 @@ def render_messages():
                             receiver_info="You (Assistant Manager)",
                             can_delete=False
                         )
+                
+                render_pagination("asst_manager_messages", has_older_messages, message_cursor(all_messages[-1]),
+                                  previous_label="← Newer", next_label="Older →")
             else:
                 st.info("No messages found")
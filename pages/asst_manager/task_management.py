@@ -1,6 +1,6 @@
 import streamlit as st
-from utils.ui import render_page_title, task_status_indicator
-from utils.db import get_employees, create_task, get_tasks, complete_task
+from utils.ui import render_page_title, task_status_indicator, get_page_cursor, render_pagination, PAGE_SIZE
+from utils.db import get_employees, create_task, get_tasks, task_cursor, get_task_inbox, complete_task
 from utils.auth import check_asst_manager
 
 def render_task_management():
@@ -63,7 +63,10 @@ def render_task_management():
     # Assigned Tasks Tab
     with tab1:
         # Get tasks assigned by this assistant manager
-        assigned_tasks = get_tasks(assigned_by="asst_manager", assigned_by_id=st.session_state.user_id)
+        assigned_tasks = get_tasks(assigned_by="asst_manager", assigned_by_id=st.session_state.user_id,
+                                   limit=PAGE_SIZE + 1, after=get_page_cursor("asst_manager_assigned_tasks"))
+        has_more_assigned_tasks = len(assigned_tasks) > PAGE_SIZE
+        assigned_tasks = assigned_tasks[:PAGE_SIZE]
         
         if assigned_tasks:
             for task in assigned_tasks:
@@ -89,13 +92,15 @@ def render_task_management():
                     
                     with col2:
                         st.markdown(task_status_indicator(is_completed), unsafe_allow_html=True)
+            
+            render_pagination("asst_manager_assigned_tasks", has_more_assigned_tasks, task_cursor(assigned_tasks[-1]))
         else:
             st.info("No assigned tasks found")
     
     # Your Tasks Tab
     with tab2:
         # Get tasks assigned to assistant manager
-        asst_manager_tasks = get_tasks(employee_id=st.session_state.user_id)
+        asst_manager_tasks = get_task_inbox(st.session_state.user_id)
         
         if asst_manager_tasks:
             for task in asst_manager_tasks:
@@ -104,7 +109,7 @@ def render_task_management():
                 task_description = task[2]
                 assigned_by = task[5]
                 assigned_by_id = task[6]
-                is_completed = task[7]
+                is_completed = task[9]  # Your own completion status
                 
                 with st.container(border=True):
                     col1, col2 = st.columns([3, 1])
@@ -1,6 +1,6 @@
 import streamlit as st
-from utils.ui import render_navigation, render_page_title, user_status_indicator, task_status_indicator
-from utils.db import get_branches, get_employees, get_tasks
+from utils.ui import render_navigation, render_page_title, user_status_indicator, task_status_indicator, render_freshness
+from utils.dashboard_data import load_dashboard, load_company_dashboard, request_refresh
 from utils.auth import check_company
 
 def render_company_dashboard():
@@ -49,17 +49,22 @@ def render_dashboard():
     """Render company dashboard homepage."""
     render_page_title("Company Dashboard", "Overview of your company", "🏠")
     
+    # Last known figures, refreshed in the background once they are stale
+    dashboard = load_dashboard("company_dashboard", load_company_dashboard, st.session_state.company_id)
+    render_freshness(dashboard, request_refresh, ("company_dashboard",))
+    if dashboard.data is None:
+        return
+    
     # Get data for statistics
-    branches = get_branches(st.session_state.company_id)
+    branches = dashboard.data["branches"]
     
-    employees = get_employees(company_id=st.session_state.company_id)
+    employees = dashboard.data["employees"]
     managers = [e for e in employees if e[4] == "manager"]
     asst_managers = [e for e in employees if e[4] == "asst_manager"]
     general_employees = [e for e in employees if e[4] == "employee"]
     
-    tasks = get_tasks(company_id=st.session_state.company_id)
-    completed_tasks = [t for t in tasks if t[7]]  # is_completed
-    pending_tasks = [t for t in tasks if not t[7]]  # is_completed
+    task_counts = dashboard.data["task_counts"]
+    tasks = dashboard.data["recent_tasks"]
     
     # Display statistics
     st.write("### Company Overview")
@@ -76,11 +81,11 @@ def render_dashboard():
     
     with col3:
         with st.container(border=True):
-            st.metric("Completed Tasks", len(completed_tasks))
+            st.metric("Completed Tasks", task_counts["completed"])
     
     with col4:
         with st.container(border=True):
-            st.metric("Pending Tasks", len(pending_tasks))
+            st.metric("Pending Tasks", task_counts["pending"])
     
     # Display branch information
     st.write("### Branch Information")
@@ -126,7 +131,7 @@ def render_dashboard():
     
     if tasks:
         with st.container(border=True):
-            for task in tasks[:5]:
+            for task in tasks:
                 task_id = task[0]
                 task_title = task[1]
                 task_description = task[2]
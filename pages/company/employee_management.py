@@ -1,8 +1,9 @@
 # Fix for pages/company/employee_management.py
 import streamlit as st
-from utils.ui import render_page_title, user_status_indicator, clean_url
-from utils.db import get_branches, get_employees, create_employee, toggle_employee_status, update_employee_role, update_employee_branch
+from utils.ui import render_page_title, user_status_indicator, clean_url, get_page_cursor, render_pagination, PAGE_SIZE
+from utils.db import get_branches, get_employees, employee_cursor, create_employee, toggle_employee_status, update_employee_role, update_employee_branch, transaction
 from utils.auth import check_company
+from utils.employee_import import import_employees, report_to_csv, REQUIRED_COLUMNS, IMPORT_MAX_ROWS_PAGE
 
 def render_employee_management():
     """Render employee management page for company."""
@@ -76,6 +77,49 @@ def render_employee_management():
                     else:
                         st.error("Failed to create employee")
     
+    # Bulk import from CSV
+    with st.expander("Import Employees from CSV"):
+        st.caption(
+            f"Columns: {', '.join(REQUIRED_COLUMNS)} and optionally profile_pic. "
+            "The branch column holds the branch name; role is manager, asst_manager or employee. "
+            f"Up to {IMPORT_MAX_ROWS_PAGE} employees per file."
+        )
+        csv_file = st.file_uploader("CSV File", type=["csv"], key="employee_import_file")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            validate_button = st.button("Validate", key="employee_import_validate", use_container_width=True, disabled=csv_file is None)
+        with col2:
+            import_button = st.button("Import", key="employee_import_run", type="primary", use_container_width=True, disabled=csv_file is None)
+        
+        if csv_file is not None and (validate_button or import_button):
+            try:
+                with st.spinner("Importing employees..." if import_button else "Validating..."):
+                    report, created = import_employees(
+                        csv_file.getvalue().decode("utf-8-sig"), st.session_state.company_id,
+                        "company", st.session_state.user_id, dry_run=not import_button,
+                        max_rows=IMPORT_MAX_ROWS_PAGE
+                    )
+            except (ValueError, UnicodeDecodeError) as e:
+                st.error(f"Could not read the file: {e}")
+            else:
+                errors = [entry for entry in report if entry["status"] == "error"]
+                if import_button:
+                    if created:
+                        st.success(f"Created {created} of {len(report)} employees.")
+                    else:
+                        st.error("No employees were created.")
+                elif not errors:
+                    st.success(f"All {len(report)} rows are ready to import.")
+                
+                if errors:
+                    st.warning(f"{len(errors)} row(s) could not be imported:")
+                    st.dataframe(errors, use_container_width=True, hide_index=True)
+                st.download_button(
+                    "Download Report", report_to_csv(report), file_name="employee_import_report.csv",
+                    mime="text/csv", key="employee_import_report"
+                )
+    
     # List employees
     st.write("### Employee List")
     
@@ -98,15 +142,25 @@ def render_employee_management():
             index=0
         )
     
-    # Get employees based on filters
+    # Get one page of employees based on filters (one extra row tells whether another page exists)
+    page_key = f"company_employees_{filter_branch[0]}_{filter_role[0]}"
+    page_cursor = get_page_cursor(page_key)
+    
     if filter_branch[0] == "all" and filter_role[0] == "all":
-        employees = get_employees(company_id=st.session_state.company_id)
+        employees = get_employees(company_id=st.session_state.company_id,
+                                  limit=PAGE_SIZE + 1, after=page_cursor)
     elif filter_branch[0] == "all":
-        employees = get_employees(company_id=st.session_state.company_id, role=filter_role[0])
+        employees = get_employees(company_id=st.session_state.company_id, role=filter_role[0],
+                                  limit=PAGE_SIZE + 1, after=page_cursor)
     elif filter_role[0] == "all":
-        employees = get_employees(company_id=st.session_state.company_id, branch_id=filter_branch[0])
+        employees = get_employees(company_id=st.session_state.company_id, branch_id=filter_branch[0],
+                                  limit=PAGE_SIZE + 1, after=page_cursor)
     else:
-        employees = get_employees(company_id=st.session_state.company_id, branch_id=filter_branch[0], role=filter_role[0])
+        employees = get_employees(company_id=st.session_state.company_id, branch_id=filter_branch[0], role=filter_role[0],
+                                  limit=PAGE_SIZE + 1, after=page_cursor)
+    
+    has_more_employees = len(employees) > PAGE_SIZE
+    employees = employees[:PAGE_SIZE]
     
     if employees:
         for employee in employees:
@@ -163,13 +217,6 @@ def render_employee_management():
                             index=["manager", "asst_manager", "employee"].index(st.session_state.edit_employee_role),
                             key=f"role_{employee_id}"
                         )
-                        
-                        if st.button("Update Role", key=f"update_role_{employee_id}"):
-                            if update_employee_role(employee_id, new_role):
-                                st.success(f"Role updated to {new_role.capitalize()} successfully!")
-                                st.rerun()
-                            else:
-                                st.error("Failed to update role")
                     
                     with col2:
                         new_branch = st.selectbox(
@@ -179,12 +226,21 @@ def render_employee_management():
                             index=next((i for i, branch in enumerate(active_branches) if branch[1] == branch_name), 0),
                             key=f"branch_{employee_id}"
                         )
-                        
-                        if st.button("Update Branch", key=f"update_branch_{employee_id}"):
-                            if update_employee_branch(employee_id, new_branch[0]):
-                                st.success(f"Employee transferred to {new_branch[1]} successfully!")
-                                st.rerun()
-                            else:
-                                st.error("Failed to update branch")
+                    
+                    if st.button("Save Changes", key=f"update_employee_{employee_id}"):
+                        try:
+                            # Role and branch change together or not at all
+                            with transaction() as conn:
+                                if new_role != employee_role:
+                                    update_employee_role(employee_id, new_role, conn=conn)
+                                if new_branch[1] != branch_name:
+                                    update_employee_branch(employee_id, new_branch[0], conn=conn)
+                        except Exception as e:
+                            st.error(f"Failed to update employee: {e}")
+                        else:
+                            st.success(f"{employee_name} updated successfully!")
+                            st.rerun()
+        
+        render_pagination(page_key, has_more_employees, employee_cursor(employees[-1]))
     else:
         st.info("No employees found. Create your first employee using the form above.")
@@ -1,6 +1,6 @@
 import streamlit as st
 from utils.ui import render_page_title, render_message_card
-from utils.db import get_branches, get_employees, send_message, get_messages, delete_message
+from utils.db import get_branches, get_employees, send_message, send_broadcast_message, get_messages, delete_message
 from utils.auth import check_company
 
 def render_messages():
@@ -110,40 +110,33 @@ def render_messages():
                         branch_employees = [e for e in employees if e[6] == branch_name and e[5]]  # active employees
                         
                         if branch_employees:
-                            for employee in branch_employees:
-                                send_message("company", st.session_state.user_id, "employee", employee[0], branch_message, branch_attachment)
+                            message_id = send_broadcast_message(
+                                "company", st.session_state.user_id, "branch", branch_id,
+                                [employee[0] for employee in branch_employees], branch_message, branch_attachment
+                            )
                             
-                            st.success(f"Message sent to all employees in {branch_name} successfully!")
-                            st.rerun()
+                            if message_id:
+                                st.success(f"Message sent to all employees in {branch_name} successfully!")
+                                st.rerun()
+                            else:
+                                st.error("Failed to send message")
                         else:
                             st.warning(f"No active employees found in {branch_name}")
         
         with col2:
             st.write("### Branch Message History")
             
-            # Get sent messages to branches (actually to employees in branches)
-            branch_messages = []
-            for branch in branches:
-                branch_id = branch[0]
-                branch_name = branch[1]
-                
-                branch_employees = [e for e in employees if e[6] == branch_name]
-                
-                for employee in branch_employees:
-                    employee_id = employee[0]
-                    messages = get_messages(sender_type="company", sender_id=st.session_state.user_id, receiver_type="employee", receiver_id=employee_id)
-                    
-                    for message in messages:
-                        # Add to list if not already added (avoid duplicates)
-                        if not any(msg[0] == message[0] for msg in branch_messages):
-                            branch_messages.append(message)
+            # Get the latest 5 broadcasts sent to any branch
+            branch_messages = get_messages(sender_type="company", sender_id=st.session_state.user_id, receiver_type="branch", limit=5)
             
             if branch_messages:
-                for message in branch_messages[:5]:  # Show only latest 5 messages
+                for message in branch_messages:
+                    branch_name = next((branch[1] for branch in branches if branch[0] == message[4]), "Branch")
+                    
                     render_message_card(
                         message=message,
                         sender_info="You (Company)",
-                        receiver_info="Branch Employees",
+                        receiver_info=f"{branch_name} Employees",
                         can_delete=True
                     )
             else:
@@ -188,20 +181,11 @@ def render_messages():
         with col2:
             st.write("### Employee Message History")
             
-            # Get sent messages to individual employees
-            employee_messages = []
-            for employee in employees:
-                employee_id = employee[0]
-                
-                messages = get_messages(sender_type="company", sender_id=st.session_state.user_id, receiver_type="employee", receiver_id=employee_id)
-                
-                for message in messages:
-                    # Only add direct messages, not branch messages
-                    if not any(msg[0] == message[0] for msg in employee_messages):
-                        employee_messages.append(message)
+            # Get the latest 5 direct messages sent to any employee (branch broadcasts are listed separately)
+            employee_messages = get_messages(sender_type="company", sender_id=st.session_state.user_id, receiver_type="employee", limit=5)
             
             if employee_messages:
-                for message in employee_messages[:5]:  # Show only latest 5 messages
+                for message in employee_messages:
                     employee_id = message[4]  # receiver_id
                     employee_name = next((employee[1] for employee in employees if employee[0] == employee_id), f"Employee {employee_id}")
                     
@@ -1,6 +1,6 @@
 import streamlit as st
-from utils.ui import render_page_title, task_status_indicator
-from utils.db import get_branches, get_employees, create_task, get_tasks
+from utils.ui import render_page_title, task_status_indicator, get_page_cursor, render_pagination, PAGE_SIZE
+from utils.db import get_branches, get_employees, create_task, get_tasks, task_cursor, get_task_progress
 from utils.auth import check_company
 
 def render_task_management():
@@ -134,17 +134,30 @@ def render_task_management():
             index=0
         )
     
-    # Get tasks based on filters
+    # Get one page of tasks based on filters (one extra row tells whether another page exists)
+    page_key = f"company_tasks_{filter_status[0]}_{filter_assigned[0]}"
+    page_cursor = get_page_cursor(page_key)
+    
     if filter_status[0] == "all" and filter_assigned[0] == "all":
-        tasks = get_tasks(assigned_by="company", assigned_by_id=st.session_state.user_id)
+        tasks = get_tasks(assigned_by="company", assigned_by_id=st.session_state.user_id,
+                          limit=PAGE_SIZE + 1, after=page_cursor)
     elif filter_status[0] == "all":
-        tasks = get_tasks(assigned_by="company", assigned_by_id=st.session_state.user_id, assigned_to=filter_assigned[0])
+        tasks = get_tasks(assigned_by="company", assigned_by_id=st.session_state.user_id, assigned_to=filter_assigned[0],
+                          limit=PAGE_SIZE + 1, after=page_cursor)
     elif filter_assigned[0] == "all":
-        tasks = get_tasks(assigned_by="company", assigned_by_id=st.session_state.user_id, is_completed=filter_status[0])
+        tasks = get_tasks(assigned_by="company", assigned_by_id=st.session_state.user_id, is_completed=filter_status[0],
+                          limit=PAGE_SIZE + 1, after=page_cursor)
     else:
-        tasks = get_tasks(assigned_by="company", assigned_by_id=st.session_state.user_id, is_completed=filter_status[0], assigned_to=filter_assigned[0])
+        tasks = get_tasks(assigned_by="company", assigned_by_id=st.session_state.user_id, is_completed=filter_status[0], assigned_to=filter_assigned[0],
+                          limit=PAGE_SIZE + 1, after=page_cursor)
+    
+    has_more_tasks = len(tasks) > PAGE_SIZE
+    tasks = tasks[:PAGE_SIZE]
     
     if tasks:
+        # Completion progress for every branch task on the page in a single query
+        task_progress = get_task_progress([task[0] for task in tasks if task[3] == "branch"])
+        
         for task in tasks:
             task_id = task[0]
             task_title = task[1]
@@ -166,11 +179,11 @@ def render_task_management():
                         branch_name = next((branch[1] for branch in branches if branch[0] == task_assigned_id), f"Branch {task_assigned_id}")
                         st.write(f"**Assigned to Branch:** {branch_name}")
                         
-                        # Get employees in this branch
-                        branch_employees = [e for e in employees if e[6] == branch_name]
-                        completed_count = sum(1 for e in branch_employees if any(t[7] for t in get_tasks(employee_id=e[0], assigned_by="company", assigned_by_id=st.session_state.user_id) if t[0] == task_id))
-                        st.progress(completed_count / len(branch_employees) if branch_employees else 0)
-                        st.write(f"**Progress:** {completed_count}/{len(branch_employees)} employees completed")
+                        # Progress across the branch's active employees
+                        completed_count = task_progress[task_id]["completed"]
+                        total_count = task_progress[task_id]["total"]
+                        st.progress(completed_count / total_count if total_count else 0)
+                        st.write(f"**Progress:** {completed_count}/{total_count} employees completed")
                     else:  # employee
                         employee_name = next((employee[1] for employee in employees if employee[0] == task_assigned_id), f"Employee {task_assigned_id}")
                         employee_role = next((employee[4] for employee in employees if employee[0] == task_assigned_id), "")
@@ -192,8 +205,8 @@ def render_task_management():
                     st.write(f"**Status:** {'Completed' if is_completed else 'Pending'}")
                     
                     if task_assigned_to == "branch":
-                        branch_name = next((branch[1] for branch in branches if branch[0] == task_assigned_id), f"Branch {task_assigned_id}")
-                        branch_employees = [e for e in employees if e[6] == branch_name]
+                        employee_status = task_progress[task_id]["employees"]
+                        branch_employees = [e for e in employees if e[0] in employee_status]
                         
                         st.write("#### Employee Status")
                         
@@ -204,10 +217,7 @@ def render_task_management():
                                 employee_role = employee[4]
                                 
                                 # Check if employee has completed this task
-                                employee_tasks = get_tasks(employee_id=employee_id)
-                                employee_task = next((t for t in employee_tasks if t[0] == task_id), None)
-                                
-                                employee_completed = employee_task and employee_task[7]
+                                employee_completed = employee_status[employee_id]
                                 
                                 col1, col2 = st.columns([3, 1])
                                 
@@ -220,5 +230,7 @@ def render_task_management():
                                 st.divider()
                         else:
                             st.info("No employees found in this branch")
+        
+        render_pagination(page_key, has_more_tasks, task_cursor(tasks[-1]))
     else:
         st.info("No tasks found. Create your first task using the forms above.")
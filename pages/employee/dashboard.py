@@ -1,6 +1,6 @@
 import streamlit as st
-from utils.ui import render_navigation, render_page_title, task_status_indicator
-from utils.db import get_tasks, get_reports
+from utils.ui import render_navigation, render_page_title, task_status_indicator, render_freshness
+from utils.dashboard_data import load_dashboard, load_employee_dashboard, request_refresh
 from utils.auth import check_employee
 
 def render_employee_dashboard():
@@ -41,13 +41,19 @@ def render_dashboard():
     """Render employee dashboard homepage."""
     render_page_title("Employee Dashboard", "Your activity overview", "🏠")
     
-    # Get tasks assigned to employee
-    employee_tasks = get_tasks(employee_id=st.session_state.user_id)
-    completed_tasks = [t for t in employee_tasks if t[7]]  # is_completed
-    pending_tasks = [t for t in employee_tasks if not t[7]]  # is_completed
+    # Last known figures, refreshed in the background once they are stale
+    dashboard = load_dashboard("employee_dashboard", load_employee_dashboard, st.session_state.user_id)
+    render_freshness(dashboard, request_refresh, ("employee_dashboard",))
+    if dashboard.data is None:
+        return
+    
+    # Task counts and summaries of the top 5 pending tasks
+    task_counts = dashboard.data["task_counts"]
+    pending_tasks = dashboard.data["pending_tasks"]
     
-    # Get reports submitted by employee
-    employee_reports = get_reports(employee_id=st.session_state.user_id)
+    # Report count and summaries of the 3 most recent reports
+    report_count = dashboard.data["report_count"]
+    employee_reports = dashboard.data["recent_reports"]
     
     # Display statistics
     st.write("### Your Activity Summary")
@@ -56,26 +62,26 @@ def render_dashboard():
     
     with col1:
         with st.container(border=True):
-            st.metric("Total Tasks", len(employee_tasks))
+            st.metric("Total Tasks", task_counts["total"])
     
     with col2:
         with st.container(border=True):
-            st.metric("Completed Tasks", len(completed_tasks))
+            st.metric("Completed Tasks", task_counts["completed"])
     
     with col3:
         with st.container(border=True):
-            st.metric("Pending Tasks", len(pending_tasks))
+            st.metric("Pending Tasks", task_counts["pending"])
     
     with col4:
         with st.container(border=True):
-            st.metric("Reports Submitted", len(employee_reports))
+            st.metric("Reports Submitted", report_count)
     
     # Display pending tasks
     st.write("### Pending Tasks")
     
     if pending_tasks:
         with st.container(border=True):
-            for task in pending_tasks[:5]:  # Show top 5 pending tasks
+            for task in pending_tasks:
                 task_id = task[0]
                 task_title = task[1]
                 task_description = task[2]
@@ -110,7 +116,7 @@ def render_dashboard():
     
     if employee_reports:
         with st.container(border=True):
-            for report in employee_reports[:3]:  # Show top 3 recent reports
+            for report in employee_reports:
                 report_id = report[0]
                 report_date = report[4]
                 content = report[5]
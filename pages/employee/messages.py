@@ -1,6 +1,6 @@
 import streamlit as st
-from utils.ui import render_page_title, render_message_card
-from utils.db import get_employees, send_message, get_messages, delete_message
+from utils.ui import render_page_title, render_message_card, get_page_cursor, render_pagination
+from utils.db import get_employees, send_message, get_messages, message_cursor, delete_message
 from utils.auth import check_employee
 
 def render_messages():
@@ -157,11 +157,14 @@ def render_messages():
         # Message history
         st.write("### Sent Messages History")
         
-        # Get sent messages
-        sent_messages = get_messages(sender_type="employee", sender_id=st.session_state.user_id)
+        # Get sent messages 5 at a time (one extra row tells whether older messages exist)
+        sent_messages = get_messages(sender_type="employee", sender_id=st.session_state.user_id,
+                                     limit=6, after=get_page_cursor("employee_sent_messages"))
+        has_more_sent = len(sent_messages) > 5
+        sent_messages = sent_messages[:5]
         
         if sent_messages:
-            for message in sent_messages[:5]:  # Show only latest 5 messages
+            for message in sent_messages:
                 receiver_type = message[3]  # receiver_type
                 receiver_id = message[4]  # receiver_id
                 
@@ -184,5 +187,7 @@ def render_messages():
                     receiver_info=receiver_info,
                     can_delete=True
                 )
+            
+            render_pagination("employee_sent_messages", has_more_sent, message_cursor(sent_messages[-1]))
         else:
             st.info("No sent messages found")
@@ -1,6 +1,6 @@
 import streamlit as st
 from utils.ui import render_page_title, task_status_indicator
-from utils.db import get_tasks, complete_task, get_connection
+from utils.db import get_task_inbox, complete_task
 from utils.auth import check_employee
 
 def render_tasks():
@@ -11,61 +11,17 @@ def render_tasks():
     
     render_page_title("Tasks", "View and complete your assigned tasks", "📋")
     
-    # Get tasks assigned to employee
-    employee_tasks = get_tasks(employee_id=st.session_state.user_id)
-    
-    # Get the employee's personal completion status for each task
-    conn = get_connection()
-    task_completion_status = {}
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("""
-            SELECT task_id, is_completed FROM task_completion
-            WHERE employee_id = %s
-            """, (st.session_state.user_id,))
-            
-            completions = cur.fetchall()
-            for completion in completions:
-                task_completion_status[completion[0]] = completion[1]
-            
-            cur.close()
-        except Exception as e:
-            st.error(f"Failed to get task completion status: {e}")
-        finally:
-            conn.close()
-    
-    # Check for task completion action
+    # Check for task completion action before loading, so the list already reflects it
     if "complete_task_id" in st.session_state and st.session_state.complete_task_id:
         task_id = st.session_state.complete_task_id
         if complete_task(task_id, st.session_state.user_id):
             st.success("Task marked as completed!")
-            # Clear the task ID and refresh the page data
-            st.session_state.complete_task_id = None
-            # Refresh tasks list after completion
-            employee_tasks = get_tasks(employee_id=st.session_state.user_id)
-            # Refresh completion status
-            if conn:
-                try:
-                    cur = conn.cursor()
-                    cur.execute("""
-                    SELECT task_id, is_completed FROM task_completion
-                    WHERE employee_id = %s
-                    """, (st.session_state.user_id,))
-                    
-                    completions = cur.fetchall()
-                    task_completion_status = {}
-                    for completion in completions:
-                        task_completion_status[completion[0]] = completion[1]
-                    
-                    cur.close()
-                except Exception as e:
-                    st.error(f"Failed to refresh task completion status: {e}")
-                finally:
-                    conn.close()
         else:
             st.error("Failed to complete task")
-            st.session_state.complete_task_id = None
+        st.session_state.complete_task_id = None
+    
+    # Get tasks assigned to employee with the employee's own completion status
+    employee_tasks = get_task_inbox(st.session_state.user_id)
     
     # Filter tasks by status
     tab1, tab2 = st.tabs(["Pending Tasks", "Completed Tasks"])
@@ -73,7 +29,7 @@ def render_tasks():
     # Pending Tasks Tab
     with tab1:
         # Tasks that the employee hasn't personally completed
-        pending_tasks = [t for t in employee_tasks if not task_completion_status.get(t[0], False)]
+        pending_tasks = [t for t in employee_tasks if not t[9]]
         
         if pending_tasks:
             for task in pending_tasks:
@@ -115,11 +71,7 @@ def render_tasks():
     # Completed Tasks Tab
     with tab2:
         # Tasks that the employee has personally completed
-        completed_tasks = []
-        for task in employee_tasks:
-            task_id = task[0]
-            if task_completion_status.get(task_id, False):
-                completed_tasks.append(task)
+        completed_tasks = [t for t in employee_tasks if t[9]]
         
         if completed_tasks:
             for task in completed_tasks:
@@ -131,6 +83,7 @@ def render_tasks():
                 assigned_by_id = task[6]
                 is_completed = task[7]  # Overall task completion status
                 created_at = task[8]
+                completed_at = task[10]  # When the employee completed it
                 
                 with st.container(border=True):
                     col1, col2 = st.columns([3, 1])
@@ -148,6 +101,8 @@ def render_tasks():
                             st.caption("Assigned by: Assistant Manager")
                         
                         st.caption(f"Assigned on: {created_at}")
+                        if completed_at:
+                            st.caption(f"Completed on: {completed_at}")
                         
                         # For branch tasks that are not fully completed
                         if assigned_to == "branch" and not is_completed:
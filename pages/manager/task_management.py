@@ -1,6 +1,6 @@
 import streamlit as st
-from utils.ui import render_page_title, task_status_indicator
-from utils.db import get_employees, create_task, get_tasks, complete_task, manager_complete_task
+from utils.ui import render_page_title, task_status_indicator, get_page_cursor, render_pagination, PAGE_SIZE
+from utils.db import get_employees, create_task, get_tasks, task_cursor, get_task_inbox, get_task_progress, complete_task, manager_complete_task
 from utils.auth import check_manager
 
 def render_task_management():
@@ -70,9 +70,16 @@ def render_task_management():
     
     # Branch Tasks Tab
     with tab1:
-        branch_tasks = get_tasks(assigned_to="branch", assigned_id=st.session_state.branch_id)
+        # One page of branch tasks (one extra row tells whether another page exists)
+        branch_tasks = get_tasks(assigned_to="branch", assigned_id=st.session_state.branch_id,
+                                 limit=PAGE_SIZE + 1, after=get_page_cursor("manager_branch_tasks"))
+        has_more_branch_tasks = len(branch_tasks) > PAGE_SIZE
+        branch_tasks = branch_tasks[:PAGE_SIZE]
         
         if branch_tasks:
+            # Completion progress for every branch task in a single query
+            task_progress = get_task_progress([task[0] for task in branch_tasks])
+            
             for task in branch_tasks:
                 task_id = task[0]
                 task_title = task[1]
@@ -103,15 +110,8 @@ def render_task_management():
                         st.markdown(task_status_indicator(is_completed), unsafe_allow_html=True)
                         
                         # Check employee completion status
-                        employee_tasks = []
-                        for employee in branch_employees:
-                            employee_id = employee[0]
-                            employee_task = next((t for t in get_tasks(employee_id=employee_id) if t[0] == task_id), None)
-                            if employee_task:
-                                employee_tasks.append(employee_task)
-                        
-                        completed_count = sum(1 for t in employee_tasks if t[7])
-                        total_count = len(employee_tasks)
+                        completed_count = task_progress[task_id]["completed"]
+                        total_count = task_progress[task_id]["total"]
                         
                         if not is_completed:
                             st.progress(completed_count / total_count if total_count > 0 else 0)
@@ -124,13 +124,18 @@ def render_task_management():
                                     st.rerun()
                                 else:
                                     st.error("Failed to complete task")
+            
+            render_pagination("manager_branch_tasks", has_more_branch_tasks, task_cursor(branch_tasks[-1]))
         else:
             st.info("No branch tasks found")
     
     # Employee Tasks Tab
     with tab2:
         # Get all tasks assigned to employees in branch by this manager
-        employee_tasks = get_tasks(assigned_by="manager", assigned_by_id=st.session_state.user_id, assigned_to="employee")
+        employee_tasks = get_tasks(assigned_by="manager", assigned_by_id=st.session_state.user_id, assigned_to="employee",
+                                   limit=PAGE_SIZE + 1, after=get_page_cursor("manager_employee_tasks"))
+        has_more_employee_tasks = len(employee_tasks) > PAGE_SIZE
+        employee_tasks = employee_tasks[:PAGE_SIZE]
         
         if employee_tasks:
             for task in employee_tasks:
@@ -154,13 +159,15 @@ def render_task_management():
                     
                     with col2:
                         st.markdown(task_status_indicator(is_completed), unsafe_allow_html=True)
+            
+            render_pagination("manager_employee_tasks", has_more_employee_tasks, task_cursor(employee_tasks[-1]))
         else:
             st.info("No employee tasks found")
     
     # Your Tasks Tab
     with tab3:
         # Get tasks assigned to manager
-        manager_tasks = get_tasks(employee_id=st.session_state.user_id)
+        manager_tasks = get_task_inbox(st.session_state.user_id)
         
         if manager_tasks:
             for task in manager_tasks:
@@ -169,7 +176,7 @@ def render_task_management():
                 task_description = task[2]
                 assigned_by = task[5]
                 assigned_by_id = task[6]
-                is_completed = task[7]
+                is_completed = task[9]  # Your own completion status
                 
                 with st.container(border=True):
                     col1, col2 = st.columns([3, 1])
@@ -0,0 +1,88 @@
+"""Tests for CSV validation in utils/employee_import.py. No database is needed.
+
+    python -m unittest tests.test_employee_import
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.employee_import import import_employees, read_employee_csv
+
+HEADER = "employee_name,username,password,role,branch\n"
+# (id, branch_name, company_id, is_active) as far as the import reads get_branches() rows
+BRANCHES = [(10, "North", 1, True), (20, "Closed", 1, False)]
+
+def dry_run(text, taken=()):
+    with mock.patch("utils.employee_import.get_branches", return_value=BRANCHES), \
+         mock.patch("utils.employee_import.get_existing_usernames", return_value=set(taken)):
+        report, created = import_employees(text, 1, "company", 1, dry_run=True)
+    return [(entry["line"], entry["status"], entry["message"]) for entry in report], created
+
+class ReadEmployeeCsvTest(unittest.TestCase):
+
+    def test_missing_columns_are_rejected(self):
+        with self.assertRaisesRegex(ValueError, "role, branch"):
+            read_employee_csv("employee_name,username,password\nAnn,ann,pw\n")
+
+    def test_header_is_case_insensitive_and_blank_lines_are_skipped(self):
+        rows = read_employee_csv("\ufeffEmployee_Name, Username ,PASSWORD,Role,Branch\n\nAnn,ann,pw,employee,North\n")
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0]["username"], rows[0]["line"]), ("ann", 3))
+
+    def test_too_many_rows_are_rejected(self):
+        text = HEADER + "".join(f"E{n},e{n},pw,employee,North\n" for n in range(3))
+
+        self.assertEqual(len(read_employee_csv(text, max_rows=3)), 3)
+        with self.assertRaisesRegex(ValueError, "at most 2"):
+            read_employee_csv(text, max_rows=2)
+
+class ValidateEmployeeCsvTest(unittest.TestCase):
+
+    def test_valid_rows_are_ready(self):
+        report, created = dry_run(HEADER + "Ann,ann,pw,employee,north\nBob,bob,pw,Manager,North\n")
+
+        self.assertEqual(report, [(2, "valid", "Ready to import"), (3, "valid", "Ready to import")])
+        self.assertEqual(created, 0)
+
+    def test_repeated_username_is_an_error_after_its_first_row(self):
+        report, _created = dry_run(HEADER + "Ann,ann,pw,employee,North\nAnn Two,ann,pw,employee,North\n")
+
+        self.assertEqual(report, [(2, "valid", "Ready to import"),
+                                  (3, "error", "Username appears more than once in the file")])
+
+    def test_usernames_differing_only_in_case_are_distinct(self):
+        report, _created = dry_run(HEADER + "Ann,ann,pw,employee,North\nAnn,Ann,pw,employee,North\n")
+
+        self.assertEqual([status for _line, status, _message in report], ["valid", "valid"])
+
+    def test_invalid_rows_report_why(self):
+        report, _created = dry_run(HEADER + "\n".join([
+            "Ann,ann,,employee,North",
+            "Bob,bob,pw,owner,North",
+            "Cid,cid,pw,employee,South",
+            "Dee,dee,pw,employee,Closed",
+            f"{'x' * 101},eve,pw,employee,North",
+            f"Fay,{'f' * 51},pw,employee,North",
+        ]) + "\n")
+
+        self.assertEqual(report, [
+            (2, "error", "Please fill all required fields"),
+            (3, "error", "Role must be one of: manager, asst_manager, employee"),
+            (4, "error", "Branch 'South' not found"),
+            (5, "error", "Branch 'Closed' is inactive"),
+            (6, "error", "Employee name is longer than 100 characters"),
+            (7, "error", "Username is longer than 50 characters"),
+        ])
+
+    def test_username_taken_in_the_database_is_an_error(self):
+        report, _created = dry_run(HEADER + "Ann,ann,pw,employee,North\nBob,bob,pw,employee,North\n",
+                                   taken={"bob"})
+
+        self.assertEqual(report, [(2, "valid", "Ready to import"), (3, "error", "Username already exists")])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+"""Tests for the keyset pagination filter in utils/db.py. No database is needed.
+
+    python -m unittest tests.test_keyset
+"""
+import os
+import sys
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.db import EMPLOYEE_SORT_KEYS, MESSAGE_SORT_KEYS, REPORT_SORT_KEYS, keyset_filter
+
+CREATED_AT = datetime(2024, 1, 1, 12, 0)
+
+class KeysetFilterTest(unittest.TestCase):
+
+    def test_uniform_direction_uses_a_row_comparison(self):
+        sql, params = keyset_filter(MESSAGE_SORT_KEYS, (CREATED_AT, 42))
+
+        self.assertEqual(sql, " AND (m.created_at, m.id) < (%s, %s)")
+        self.assertEqual(params, [CREATED_AT, 42])
+
+    def test_uniform_ascending_direction_compares_greater(self):
+        sql, params = keyset_filter([("a", False), ("b", False)], (1, 2))
+
+        self.assertEqual(sql, " AND (a, b) > (%s, %s)")
+        self.assertEqual(params, [1, 2])
+
+    def test_mixed_direction_expands_column_by_column(self):
+        sql, params = keyset_filter(EMPLOYEE_SORT_KEYS, ("manager", CREATED_AT, 42))
+
+        self.assertEqual(sql, (
+            " AND ((e.role > %s)"
+            " OR (e.role = %s AND e.created_at < %s)"
+            " OR (e.role = %s AND e.created_at = %s AND e.id < %s))"
+        ))
+        self.assertEqual(params, ["manager", "manager", CREATED_AT, "manager", CREATED_AT, 42])
+
+    def test_mixed_direction_with_descending_first_key(self):
+        sql, params = keyset_filter(REPORT_SORT_KEYS, ("2024-01-01", "employee", 7))
+
+        self.assertEqual(sql, (
+            " AND ((r.report_date < %s)"
+            " OR (r.report_date = %s AND e.role > %s)"
+            " OR (r.report_date = %s AND e.role = %s AND r.id < %s))"
+        ))
+        self.assertEqual(params, ["2024-01-01", "2024-01-01", "employee", "2024-01-01", "employee", 7])
+
+    def test_placeholders_match_params(self):
+        for sort_keys, cursor in ((MESSAGE_SORT_KEYS, (CREATED_AT, 1)),
+                                  (EMPLOYEE_SORT_KEYS, ("employee", CREATED_AT, 1))):
+            sql, params = keyset_filter(sort_keys, cursor)
+            self.assertEqual(sql.count("%s"), len(params))
+
+    def test_no_cursor_adds_no_condition(self):
+        self.assertEqual(keyset_filter(MESSAGE_SORT_KEYS, None), ("", []))
+
+    def test_none_value_in_cursor_is_rejected(self):
+        with self.assertRaises(ValueError):
+            keyset_filter(MESSAGE_SORT_KEYS, (None, 42))
+        with self.assertRaises(ValueError):
+            keyset_filter(EMPLOYEE_SORT_KEYS, ("employee", None, 42))
+
+    def test_cursor_of_the_wrong_length_is_rejected(self):
+        with self.assertRaises(ValueError):
+            keyset_filter(EMPLOYEE_SORT_KEYS, (CREATED_AT, 42))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+"""Tests for the login rate limiter in utils/auth.py. No database is needed.
+
+    python -m unittest tests.test_login_limiter
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.auth import LoginLimiter
+
+USER_BURST, USER_REFILL = 3, 10
+CLIENT_BURST, CLIENT_REFILL = 5, 2
+
+def limits(username, client="10.0.0.1"):
+    return [("username", ("username", "employee", username), USER_BURST, USER_REFILL),
+            ("client", ("client", client), CLIENT_BURST, CLIENT_REFILL)]
+
+class LoginLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.limiter = LoginLimiter(max_keys=100, max_in_flight=2)
+        self.now = 1000.0
+        patcher = mock.patch("utils.auth.time.monotonic", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def take(self, username, client="10.0.0.1"):
+        return self.limiter.take(limits(username, client))
+
+    def test_username_burst_then_refusal_with_retry_after(self):
+        for _ in range(USER_BURST):
+            self.assertEqual(self.take("ann"), (True, 0))
+
+        allowed, retry_after = self.take("ann")
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, USER_REFILL)
+        self.assertEqual(self.limiter.stats()["username"], 1)
+
+    def test_bucket_refills_one_token_per_refill_period(self):
+        for _ in range(USER_BURST):
+            self.take("ann")
+
+        self.now += USER_REFILL / 2
+        allowed, retry_after = self.take("ann")
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, USER_REFILL / 2)
+
+        self.now += USER_REFILL / 2
+        self.assertTrue(self.take("ann")[0])
+        self.assertFalse(self.take("ann")[0])
+
+    def test_refill_stops_at_the_burst_size(self):
+        self.take("ann")
+        self.now += USER_REFILL * 100
+
+        for _ in range(USER_BURST):
+            self.assertTrue(self.take("ann")[0])
+        self.assertFalse(self.take("ann")[0])
+
+    def test_client_limit_spans_usernames(self):
+        # Each username stays within its own burst, but the client runs out
+        for attempt in range(CLIENT_BURST):
+            self.assertTrue(self.take(f"user{attempt}")[0])
+
+        allowed, _retry_after = self.take("someone-else")
+        self.assertFalse(allowed)
+        self.assertEqual(self.limiter.stats()["client"], 1)
+        self.assertTrue(self.take("someone-else", client="10.0.0.2")[0])
+
+    def test_username_limit_spans_clients(self):
+        for attempt in range(USER_BURST):
+            self.assertTrue(self.take("ann", client=f"10.0.0.{attempt}")[0])
+
+        self.assertFalse(self.take("ann", client="10.0.0.99")[0])
+        self.assertEqual(self.limiter.stats()["username"], 1)
+
+    def test_refused_attempt_takes_no_token_from_the_other_bucket(self):
+        for _ in range(USER_BURST):
+            self.take("ann")
+        for _ in range(10):
+            self.take("ann")
+
+        # The client spent USER_BURST tokens on ann, none on the refused attempts
+        for attempt in range(CLIENT_BURST - USER_BURST):
+            self.assertTrue(self.take(f"user{attempt}")[0])
+        self.assertFalse(self.take("bob")[0])
+
+    def test_reset_refills_a_username(self):
+        for _ in range(USER_BURST):
+            self.take("ann")
+
+        self.limiter.reset(("username", "employee", "ann"))
+        self.assertTrue(self.take("ann")[0])
+
+    def test_least_recently_used_buckets_are_dropped(self):
+        limiter = LoginLimiter(max_keys=2, max_in_flight=1)
+        limiter.take([("username", "a", 1, 60)])
+        limiter.take([("username", "b", 1, 60)])
+        limiter.take([("username", "c", 1, 60)])
+
+        # "a" was forgotten, so it starts again from a full bucket
+        self.assertTrue(limiter.take([("username", "a", 1, 60)])[0])
+        self.assertFalse(limiter.take([("username", "c", 1, 60)])[0])
+
+    def test_admit_refuses_once_every_slot_is_taken(self):
+        self.assertTrue(self.limiter.admit(timeout=0))
+        self.assertTrue(self.limiter.admit(timeout=0))
+        self.assertFalse(self.limiter.admit(timeout=0))
+        self.assertEqual(self.limiter.stats()["busy"], 1)
+
+        self.limiter.leave()
+        self.assertTrue(self.limiter.admit(timeout=0))
+
+if __name__ == "__main__":
+    unittest.main()
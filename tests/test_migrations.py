@@ -0,0 +1,169 @@
+"""Tests for the data-moving schema migrations.
+
+They need a PostgreSQL database, given as a libpq connection string in TEST_DATABASE_URL,
+and are skipped without one. Everything runs in a scratch schema inside one transaction
+that is rolled back.
+
+    TEST_DATABASE_URL="dbname=postgres" python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.migrations import MIGRATIONS
+
+SCRATCH_SCHEMA = "migration_test"
+DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+def apply_migrations(cur, versions):
+    for version, _description, statements in MIGRATIONS:
+        if version in versions:
+            for statement in statements:
+                cur.execute(statement)
+
+@unittest.skipUnless(DATABASE_URL, "TEST_DATABASE_URL is not set")
+class BranchBroadcastMigrationTest(unittest.TestCase):
+    """Migration 4 collapses legacy company branch broadcasts and nothing else."""
+
+    def setUp(self):
+        import psycopg2
+        self.conn = psycopg2.connect(DATABASE_URL)
+        self.cur = self.conn.cursor()
+        self.cur.execute(f"DROP SCHEMA IF EXISTS {SCRATCH_SCHEMA} CASCADE")
+        self.cur.execute(f"CREATE SCHEMA {SCRATCH_SCHEMA}")
+        self.cur.execute(f"SET search_path TO {SCRATCH_SCHEMA}")
+        apply_migrations(self.cur, {1, 2, 3})
+
+        self.cur.execute("""
+        INSERT INTO company (id, company_name, username, password_hash, created_by)
+        VALUES (1, 'Acme', 'acme', 'x', 1)
+        """)
+        self.cur.execute("""
+        INSERT INTO branch (id, branch_name, company_id) VALUES (10, 'North', 1), (20, 'South', 1)
+        """)
+        # Employees 101-103 work in North, 201 in South
+        self.cur.execute("""
+        INSERT INTO employee (id, employee_name, username, password_hash, role, company_id, branch_id,
+                              created_by, created_by_id)
+        VALUES (100, 'Manager', 'manager', 'x', 'manager', 1, 10, 'company', 1),
+               (101, 'Ann', 'ann', 'x', 'employee', 1, 10, 'company', 1),
+               (102, 'Bob', 'bob', 'x', 'employee', 1, 10, 'company', 1),
+               (103, 'Cid', 'cid', 'x', 'employee', 1, 10, 'company', 1),
+               (201, 'Dee', 'dee', 'x', 'employee', 1, 20, 'company', 1)
+        """)
+
+    def tearDown(self):
+        self.conn.rollback()
+        self.conn.close()
+
+    def send(self, sender_type, sender_id, receiver_id, text, sent_at):
+        self.cur.execute("""
+        INSERT INTO message (sender_type, sender_id, receiver_type, receiver_id, message_text, created_at)
+        VALUES (%s, %s, 'employee', %s, %s, %s)
+        RETURNING id
+        """, (sender_type, sender_id, receiver_id, text, sent_at))
+        return self.cur.fetchone()[0]
+
+    def messages(self, text):
+        self.cur.execute("""
+        SELECT m.receiver_type, m.receiver_id,
+               ARRAY(SELECT employee_id FROM message_recipient r WHERE r.message_id = m.id ORDER BY employee_id)
+        FROM message m
+        WHERE m.message_text = %s
+        ORDER BY m.receiver_type, m.receiver_id
+        """, (text,))
+        return self.cur.fetchall()
+
+    def test_company_branch_broadcast_is_collapsed_across_a_minute_boundary(self):
+        for receiver_id, second in ((101, "59.8"), (102, "59.9"), (103, "00.1")):
+            minute = "12:00" if second != "00.1" else "12:01"
+            self.send("company", 1, receiver_id, "Branch meeting", f"2024-01-01 {minute}:{second}")
+        apply_migrations(self.cur, {4})
+
+        self.assertEqual(self.messages("Branch meeting"), [("branch", 10, [101, 102, 103])])
+
+    def test_manager_multi_send_survives(self):
+        self.send("manager", 100, 101, "See me", "2024-01-01 12:00:00")
+        self.send("manager", 100, 102, "See me", "2024-01-01 12:00:00")
+        apply_migrations(self.cur, {4})
+
+        self.assertEqual(self.messages("See me"), [("employee", 101, []), ("employee", 102, [])])
+
+    def test_repeated_company_message_far_apart_survives(self):
+        self.send("company", 1, 101, "Reminder", "2024-01-01 09:00:00")
+        self.send("company", 1, 102, "Reminder", "2024-01-01 09:10:00")
+        apply_migrations(self.cur, {4})
+
+        self.assertEqual(self.messages("Reminder"), [("employee", 101, []), ("employee", 102, [])])
+
+    def test_burst_across_branches_is_left_alone(self):
+        # 201 has since moved to South, so the burst's branch cannot be told reliably
+        self.send("company", 1, 101, "Old news", "2024-01-01 12:00:00")
+        self.send("company", 1, 201, "Old news", "2024-01-01 12:00:01")
+        apply_migrations(self.cur, {4})
+
+        self.assertEqual(self.messages("Old news"), [("employee", 101, []), ("employee", 201, [])])
+
+@unittest.skipUnless(DATABASE_URL, "TEST_DATABASE_URL is not set")
+class TaskCompletionMigrationTest(unittest.TestCase):
+    """Migration 8 leaves one completion row per task and employee, preferring a completed one."""
+
+    def setUp(self):
+        import psycopg2
+        self.conn = psycopg2.connect(DATABASE_URL)
+        self.cur = self.conn.cursor()
+        self.cur.execute(f"DROP SCHEMA IF EXISTS {SCRATCH_SCHEMA} CASCADE")
+        self.cur.execute(f"CREATE SCHEMA {SCRATCH_SCHEMA}")
+        self.cur.execute(f"SET search_path TO {SCRATCH_SCHEMA}")
+        apply_migrations(self.cur, {1, 2, 3, 4, 5, 6, 7})
+
+        self.cur.execute("""
+        INSERT INTO company (id, company_name, username, password_hash, created_by)
+        VALUES (1, 'Acme', 'acme', 'x', 1)
+        """)
+        self.cur.execute("INSERT INTO branch (id, branch_name, company_id) VALUES (10, 'North', 1)")
+        self.cur.execute("""
+        INSERT INTO employee (id, employee_name, username, password_hash, role, company_id, branch_id,
+                              created_by, created_by_id)
+        VALUES (101, 'Ann', 'ann', 'x', 'employee', 1, 10, 'company', 1),
+               (102, 'Bob', 'bob', 'x', 'employee', 1, 10, 'company', 1)
+        """)
+        self.cur.execute("""
+        INSERT INTO task (id, title, assigned_to, assigned_id, assigned_by, assigned_by_id)
+        VALUES (1, 'Stocktake', 'branch', 10, 'company', 1)
+        """)
+
+    def tearDown(self):
+        self.conn.rollback()
+        self.conn.close()
+
+    def completions(self):
+        self.cur.execute("""
+        SELECT employee_id, is_completed, completed_at::text FROM task_completion ORDER BY employee_id
+        """)
+        return self.cur.fetchall()
+
+    def test_duplicates_collapse_onto_the_completed_row(self):
+        self.cur.execute("""
+        INSERT INTO task_completion (task_id, employee_id, is_completed, completed_at)
+        VALUES (1, 101, FALSE, NULL),
+               (1, 101, TRUE, '2024-01-01 12:00:00'),
+               (1, 101, FALSE, NULL),
+               (1, 102, FALSE, NULL)
+        """)
+        apply_migrations(self.cur, {8})
+
+        self.assertEqual(self.completions(), [(101, True, "2024-01-01 12:00:00"), (102, False, None)])
+
+    def test_second_completion_row_is_rejected(self):
+        import psycopg2
+        apply_migrations(self.cur, {8})
+        self.cur.execute("INSERT INTO task_completion (task_id, employee_id) VALUES (1, 101)")
+
+        with self.assertRaises(psycopg2.errors.UniqueViolation):
+            self.cur.execute("INSERT INTO task_completion (task_id, employee_id) VALUES (1, 101)")
+
+if __name__ == "__main__":
+    unittest.main()
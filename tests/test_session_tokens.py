@@ -0,0 +1,67 @@
+"""Tests for the remembered-session tokens in utils/auth.py. No database is needed.
+
+    python -m unittest tests.test_session_tokens
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import auth
+
+USER = {"id": 7, "role": "employee"}
+PASSWORD_HASH = "$2b$12$abcdefghijklmnopqrstuv"
+
+class SessionTokenTest(unittest.TestCase):
+
+    def setUp(self):
+        self.secret = b"first secret"
+        patcher = mock.patch("utils.auth._session_key", side_effect=lambda: self.secret)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_valid_token_round_trips(self):
+        claims = auth.read_session_token(auth.issue_session_token(USER, PASSWORD_HASH, days=1))
+
+        self.assertEqual((claims["id"], claims["role"]), (7, "employee"))
+        self.assertEqual(claims["cred"], auth._credential_tag(PASSWORD_HASH))
+
+    def test_tampered_payload_is_refused(self):
+        token = auth.issue_session_token(USER, PASSWORD_HASH, days=1)
+        payload, signature = token.split(".")
+        forged = auth._b64encode(auth._b64decode(payload).replace(b'"id":7', b'"id":1'))
+
+        self.assertIsNone(auth.read_session_token(f"{forged}.{signature}"))
+
+    def test_tampered_signature_is_refused(self):
+        token = auth.issue_session_token(USER, PASSWORD_HASH, days=1)
+        payload, signature = token.split(".")
+        flipped = auth._b64encode(bytes([auth._b64decode(signature)[0] ^ 1]) + auth._b64decode(signature)[1:])
+
+        self.assertIsNone(auth.read_session_token(f"{payload}.{flipped}"))
+
+    def test_malformed_tokens_are_refused(self):
+        for token in ("", "no-dot", "a.b.c", "!!!.???"):
+            self.assertIsNone(auth.read_session_token(token))
+
+    def test_expired_token_is_refused(self):
+        token = auth.issue_session_token(USER, PASSWORD_HASH, days=1)
+
+        with mock.patch("utils.auth.time.time", return_value=auth.time.time() + 86400 + 1):
+            self.assertIsNone(auth.read_session_token(token))
+
+    def test_token_signed_with_another_secret_is_refused(self):
+        token = auth.issue_session_token(USER, PASSWORD_HASH, days=1)
+        self.secret = b"rotated secret"
+
+        self.assertIsNone(auth.read_session_token(token))
+
+    def test_changed_password_changes_the_credential_tag(self):
+        claims = auth.read_session_token(auth.issue_session_token(USER, PASSWORD_HASH, days=1))
+
+        self.assertNotEqual(claims["cred"], auth._credential_tag(PASSWORD_HASH + "x"))
+
+if __name__ == "__main__":
+    unittest.main()
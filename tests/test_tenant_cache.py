@@ -0,0 +1,67 @@
+"""Tests for the versioned tenant cache in utils/db.py. No database is needed.
+
+    python -m unittest tests.test_tenant_cache
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.db import TenantCache
+
+COMPANY = ("company", 1)
+BRANCH = ("branch", 10)
+
+class TenantCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = TenantCache(ttl=60, max_entries=2)
+
+    def test_stored_rows_are_served_until_invalidated(self):
+        rows, version = self.cache.lookup(COMPANY, "branches")
+        self.assertIsNone(rows)
+        self.cache.store(COMPANY, "branches", version, [("North",)])
+
+        self.assertEqual(self.cache.lookup(COMPANY, "branches"), ([("North",)], None))
+        self.cache.invalidate(COMPANY)
+        self.assertIsNone(self.cache.lookup(COMPANY, "branches")[0])
+
+    def test_stale_write_loses_to_an_invalidation(self):
+        # A reader misses and queries; a writer commits and invalidates before the reader stores
+        _rows, version = self.cache.lookup(COMPANY, "branches")
+        self.cache.invalidate(COMPANY)
+        self.cache.store(COMPANY, "branches", version, [("Old",)])
+
+        rows, fresh_version = self.cache.lookup(COMPANY, "branches")
+        self.assertIsNone(rows)
+        self.assertNotEqual(fresh_version, version)
+
+    def test_invalidation_leaves_other_scopes_alone(self):
+        _rows, company_version = self.cache.lookup(COMPANY, "branches")
+        _rows, branch_version = self.cache.lookup(BRANCH, "employees")
+        self.cache.invalidate(BRANCH)
+        self.cache.store(COMPANY, "branches", company_version, [("North",)])
+        self.cache.store(BRANCH, "employees", branch_version, [("Ann",)])
+
+        self.assertEqual(self.cache.lookup(COMPANY, "branches")[0], [("North",)])
+        self.assertIsNone(self.cache.lookup(BRANCH, "employees")[0])
+
+    def test_entries_expire_after_ttl(self):
+        with mock.patch("utils.db.time.monotonic", return_value=1000.0):
+            _rows, version = self.cache.lookup(COMPANY, "branches")
+            self.cache.store(COMPANY, "branches", version, [("North",)])
+        with mock.patch("utils.db.time.monotonic", return_value=1061.0):
+            self.assertIsNone(self.cache.lookup(COMPANY, "branches")[0])
+
+    def test_oldest_result_of_a_scope_is_evicted(self):
+        for key in ("a", "b", "c"):
+            _rows, version = self.cache.lookup(COMPANY, key)
+            self.cache.store(COMPANY, key, version, [key])
+
+        self.assertIsNone(self.cache.lookup(COMPANY, "a")[0])
+        self.assertEqual(self.cache.lookup(COMPANY, "c")[0], ["c"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,33 +1,407 @@
+# utils/auth.py
+"""Login, logout and session restore for admins, companies and employees.
+
+Streamlit cannot set response headers, so the session cookies (cms_session for "remember me",
+cms_sid for a server-side session) are written by a script in the page. That means they can
+never be HttpOnly: any script running on the app's origin can read them, and a stolen
+cms_session token logs its holder in until it expires. It is signed and bound to the
+account's password hash, so changing the password or deactivating the account revokes it,
+but logging out only deletes it from the browser it was issued to. Keep remember_days
+short (the default is REMEMBER_ME_DAYS), set a fixed session_secret so tokens are not all
+revoked on restart, and rotate session_secret to revoke every remembered session at once.
+
+[auth] settings read from the Streamlit secrets:
+
+    session_secret       key signing remembered-session tokens (random per process if unset)
+    remember_days        lifetime of a remembered session, in days
+    login_user_burst     login attempts a username may make at once
+    login_client_burst   login attempts a client address may make at once
+    login_max_in_flight  logins verified at once
+    trust_forwarded_for  take the client address from X-Forwarded-For (behind a proxy only)
+
+bcrypt_rounds and hash_workers are described in utils/passwords.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
 import streamlit as st
-from utils.db import verify_admin, verify_company, verify_employee
-
-def login_user(username, password, role):
-    """Login user based on role."""
-    if role == "admin":
-        user = verify_admin(username, password)
-    elif role == "company":
-        user = verify_company(username, password)
-    else:  # employee, manager, asst_manager
-        user = verify_employee(username, password)
+import streamlit.components.v1 as components
+from utils.db import verify_admin, verify_company, verify_employee, get_session_user, connection_released
+from utils.passwords import record_login, get_auth_setting
+from utils.sessions import (
+    SESSION_KEYS, get_session_store, get_session_ttl, new_session_id, is_valid_session_id
+)
+
+# Login rate limits (override via [auth] login_user_burst / login_client_burst / login_max_in_flight in secrets)
+LOGIN_USER_BURST = 5  # attempts a username may make at once
+LOGIN_USER_REFILL = 12  # seconds to regain one attempt for a username
+LOGIN_CLIENT_BURST = 20  # attempts a client address may make at once, across usernames
+LOGIN_CLIENT_REFILL = 3  # seconds to regain one attempt for a client address
+LOGIN_MAX_IN_FLIGHT = 16  # logins being verified at once; further attempts wait for a slot
+LOGIN_ADMISSION_TIMEOUT = 5  # seconds an attempt may wait for a slot before it is turned away
+LOGIN_LIMITER_MAX_KEYS = 10000  # buckets kept, least recently used dropped first
+
+# "Remember me" sessions (override via [auth] remember_days / session_secret in secrets)
+SESSION_COOKIE = "cms_session"
+REMEMBER_ME_DAYS = 7  # days a remembered session lasts; its cookie is readable by page scripts
+
+# Server-side sessions (see utils/sessions)
+SESSION_ID_COOKIE = "cms_sid"
+SESSION_SAVE_INTERVAL = 300  # seconds before an unchanged session is saved again to extend its expiry
+
+class LoginLimiter:
+    """Process-wide token buckets throttling login attempts per username and per client.
+
+    Every attempt takes one token from its username's bucket and one from its client's;
+    buckets refill at a steady rate up to their burst size. An attempt is refused before
+    any database or bcrypt work if either bucket is empty, or if too many logins are
+    already being verified, so a flood of bad attempts cannot slow down everyone else.
+
+    The buckets live in this server process only, so every limit is per replica: behind a
+    load balancer without sticky sessions a username or client gets up to the burst on each
+    replica, and each replica admits its own max_in_flight logins.
+    """
+
+    def __init__(self, max_keys, max_in_flight):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self.rejected = {"username": 0, "client": 0, "busy": 0}
+
+    def _tokens(self, key, burst, refill, now):
+        tokens, updated = self._buckets.get(key, (burst, now))
+        return min(burst, tokens + (now - updated) / refill)
+
+    def take(self, limits):
+        """Take a token from each (kind, key, burst, refill) bucket, all or none.
+
+        Returns (allowed, seconds until the emptiest bucket has a token again).
+        """
+        now = time.monotonic()
+        with self._lock:
+            levels = [(kind, key, burst, refill, self._tokens(key, burst, refill, now))
+                      for kind, key, burst, refill in limits]
+            empty = [(kind, (1 - tokens) * refill) for kind, key, burst, refill, tokens in levels if tokens < 1]
+            if empty:
+                kind, retry_after = max(empty, key=lambda e: e[1])
+                self.rejected[kind] += 1
+                return False, retry_after
+            for kind, key, burst, refill, tokens in levels:
+                self._buckets[key] = (tokens - 1, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return True, 0
+
+    def reset(self, key):
+        """Refill a bucket, e.g. a username's after it logged in successfully."""
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def admit(self, timeout):
+        """Wait up to timeout for a verification slot; release it with leave()."""
+        if self._slots.acquire(timeout=timeout):
+            return True
+        with self._lock:
+            self.rejected["busy"] += 1
+        return False
+
+    def leave(self):
+        self._slots.release()
+
+    def stats(self):
+        """Rejected attempt counters since the server process started."""
+        with self._lock:
+            return dict(self.rejected, tracked_keys=len(self._buckets))
+
+@st.cache_resource(show_spinner=False)
+def get_login_limiter():
+    """Create the shared login limiter once per Streamlit server process."""
+    return LoginLimiter(LOGIN_LIMITER_MAX_KEYS, get_auth_setting("login_max_in_flight", LOGIN_MAX_IN_FLIGHT))
+
+def get_limiter_stats():
+    """Get the login limiter's rejection counters."""
+    return get_login_limiter().stats()
+
+def get_client_id():
+    """Address of the browser making this request, or None if it is not known.
+    
+    X-Forwarded-For is only trusted when trust_forwarded_for is set in [auth], i.e. when
+    the app sits behind a reverse proxy that sets it; otherwise clients could forge it.
+    """
+    try:
+        if get_auth_setting("trust_forwarded_for", 0):
+            forwarded = st.context.headers.get("X-Forwarded-For")
+            if forwarded:
+                return forwarded.split(",")[0].strip()
+        return st.context.ip_address
+    except Exception:
+        return None
+
+@st.cache_resource(show_spinner=False)
+def _process_session_key():
+    # Used when no session_secret is configured; remembered sessions then end on restart
+    return secrets.token_bytes(32)
+
+def _session_key():
+    try:
+        configured = st.secrets.get("auth", {}).get("session_secret")
+    except Exception:
+        configured = None
+    return configured.encode('utf-8') if configured else _process_session_key()
+
+def _sign(data):
+    return hmac.new(_session_key(), data, hashlib.sha256).digest()
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode('ascii')
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def _credential_tag(credential):
+    """Short fingerprint of the stored password, so changing it revokes remembered sessions."""
+    return _b64encode(_sign(credential.encode('utf-8'))[:12])
+
+def issue_session_token(user, credential, days=None):
+    """Create a signed token that restores user's session until it expires."""
+    days = days if days is not None else get_auth_setting("remember_days", REMEMBER_ME_DAYS)
+    payload = _b64encode(json.dumps({
+        "id": user["id"],
+        "role": user["role"],
+        "exp": int(time.time() + days * 86400),
+        "cred": _credential_tag(credential)
+    }, separators=(",", ":")).encode('utf-8'))
+    return f"{payload}.{_b64encode(_sign(payload.encode('ascii')))}"
+
+def read_session_token(token):
+    """Check a token's signature and expiry; return its claims, or None if it is not valid."""
+    try:
+        payload, signature = token.split(".")
+        if not hmac.compare_digest(_b64decode(signature), _sign(payload.encode('ascii'))):
+            return None
+        claims = json.loads(_b64decode(payload))
+    except Exception:
+        return None
+    if claims.get("exp", 0) < time.time():
+        return None
+    return claims
+
+def _set_cookie(name, value, max_age=None):
+    """Queue a cookie to be written to the browser on the next render.
+    
+    Without max_age it lasts until the browser is closed; max_age 0 deletes it.
+    """
+    st.session_state.setdefault("pending_cookies", {})[name] = (value, max_age)
+
+def sync_session_cookies():
+    """Write or clear the session cookies queued by login or logout.
+    
+    Streamlit cannot set cookies itself, so a zero-height component sets them from the browser.
+    """
+    pending = st.session_state.pop("pending_cookies", None)
+    if not pending:
+        return
+    statements = []
+    for name, (value, max_age) in pending.items():
+        expiry = f"; Max-Age={max_age}" if max_age is not None else ""
+        statements.append(
+            f'window.parent.document.cookie = "{name}={value}{expiry}; Path=/; SameSite=Strict" + secure;'
+        )
+    components.html(
+        "<script>"
+        'const secure = window.parent.location.protocol === "https:" ? "; Secure" : "";'
+        + "".join(statements) +
+        "</script>",
+        height=0
+    )
+
+def _open_server_session():
+    """Start a server-side session for the logged-in user, if a session store is configured."""
+    store = get_session_store()
+    if store is None:
+        return
+    store.purge_if_due()
+    session_id = new_session_id()
+    st.session_state.server_session_id = session_id
+    st.session_state.server_session_saved = None
+    save_server_session()
+    _set_cookie(SESSION_ID_COOKIE, session_id)
+
+def save_server_session():
+    """Save the session's auth and navigation state to the session store, if there is one.
+    
+    Called at the end of every script run; the write is skipped while nothing has changed
+    and the stored copy is still fresh.
+    """
+    store = get_session_store()
+    session_id = st.session_state.get("server_session_id")
+    if store is None or not session_id:
+        return
+    data = {key: st.session_state.get(key) for key in SESSION_KEYS}
+    saved = st.session_state.get("server_session_saved")
+    if saved and saved[0] == data and time.monotonic() - saved[1] < SESSION_SAVE_INTERVAL:
+        return
+    if store.save(session_id, data, get_session_ttl()):
+        st.session_state.server_session_saved = (data, time.monotonic())
+
+def _restore_server_session(session_id):
+    """Load the session state saved by another run or replica; return True if it was logged in.
+    
+    The account is looked up again before the stored state is trusted: a session whose user,
+    company or branch has since been deleted or deactivated is deleted from the store, and
+    the user's details are refreshed from the database. Raises ConnectionError if the
+    lookup failed, in which case nothing is restored.
+    """
+    store = get_session_store()
+    if store is None or not is_valid_session_id(session_id):
+        return False
+    data = store.load(session_id)
+    if not data or not data.get("authenticated"):
+        return False
+    found = get_session_user(data.get("user_role"), data.get("user_id"))
+    if not found:
+        store.delete(session_id)
+        return False
+    for key in SESSION_KEYS:
+        st.session_state[key] = data.get(key)
+    _set_session_user(found[0])
+    st.session_state.server_session_id = session_id
+    st.session_state.server_session_saved = (data, time.monotonic())
+    return True
+
+def _start_session(user):
+    """Log user in for this browser session and open a server-side session for it."""
+    _set_session_user(user)
+    _open_server_session()
+
+def _set_session_user(user):
+    """Store an authenticated user in the session state."""
+    st.session_state.authenticated = True
+    st.session_state.user_id = user["id"]
+    st.session_state.username = user["username"]
+    st.session_state.user_role = user["role"]
+    st.session_state.profile_pic = user["profile_pic"]
+    
+    if "company_id" in user:
+        st.session_state.company_id = user["company_id"]
+    
+    if "branch_id" in user:
+        st.session_state.branch_id = user["branch_id"]
+
+def restore_session():
+    """Log in from the session cookies, once per browser session.
+    
+    A server-side session (see utils/sessions) is picked up as it was left, including the
+    current page. Otherwise a remembered session token is checked, which costs one indexed
+    lookup instead of a bcrypt check. The token is refused if it has expired, was not signed
+    by this server, or the account's password has changed or the account was deactivated
+    since it was issued; only then is the cookie cleared. If the account cannot be looked up
+    (e.g. the database is down) the user stays logged out, the cookies are kept and the
+    restore is retried on the next run.
+    """
+    if st.session_state.get("session_restore_attempted"):
+        return False
+    st.session_state.session_restore_attempted = True
+    
+    try:
+        cookies = st.context.cookies
+        session_id = cookies.get(SESSION_ID_COOKIE)
+        token = cookies.get(SESSION_COOKIE)
+    except Exception:
+        session_id = token = None
+    try:
+        if _restore_server_session(session_id):
+            return True
+    except ConnectionError:
+        st.session_state.session_restore_attempted = False
+        return False
+    if not token:
+        return False
+    
+    claims = read_session_token(token)
+    try:
+        found = get_session_user(claims["role"], claims["id"]) if claims else None
+    except ConnectionError:
+        # The token may well be valid, so keep the cookie and try again on the next run
+        st.session_state.session_restore_attempted = False
+        return False
+    if not found or not hmac.compare_digest(_credential_tag(found[1]), claims["cred"]):
+        _set_cookie(SESSION_COOKIE, "", 0)
+        return False
+    
+    _start_session(found[0])
+    return True
+
+def login_user(username, password, role, remember=False):
+    """Login user based on role.
+    
+    With remember, a signed session token is stored in a cookie so later visits are
+    restored by restore_session() without the password.
+    Returns (success, error message shown when the login failed).
+    """
+    limiter = get_login_limiter()
+    user_key = ("username", role, username.strip().lower())
+    limits = [("username", user_key,
+               get_auth_setting("login_user_burst", LOGIN_USER_BURST), LOGIN_USER_REFILL)]
+    client_id = get_client_id()
+    if client_id:
+        limits.append(("client", ("client", client_id),
+                       get_auth_setting("login_client_burst", LOGIN_CLIENT_BURST), LOGIN_CLIENT_REFILL))
+    
+    allowed, retry_after = limiter.take(limits)
+    if not allowed:
+        return False, f"Too many login attempts. Please try again in {int(retry_after) + 1} seconds."
+    # Nobody else can use this run's connection while it waits for a slot, so give it back
+    with connection_released():
+        admitted = limiter.admit(LOGIN_ADMISSION_TIMEOUT)
+    if not admitted:
+        return False, "The server is busy. Please try again in a moment."
+    
+    try:
+        started = time.monotonic()
+        if role == "admin":
+            user = verify_admin(username, password)
+        elif role == "company":
+            user = verify_company(username, password)
+        else:  # employee, manager, asst_manager
+            user = verify_employee(username, password)
+        record_login(started, user is not None)
+    finally:
+        limiter.leave()
     
     if user:
-        st.session_state.authenticated = True
-        st.session_state.user_id = user["id"]
-        st.session_state.username = user["username"]
-        st.session_state.user_role = user["role"]
-        st.session_state.profile_pic = user["profile_pic"]
-        
-        if "company_id" in user:
-            st.session_state.company_id = user["company_id"]
+        # A successful login clears the username's earlier failed attempts
+        limiter.reset(user_key)
+        _start_session(user)
         
-        if "branch_id" in user:
-            st.session_state.branch_id = user["branch_id"]
+        if remember:
+            try:
+                found = get_session_user(user["role"], user["id"])
+            except ConnectionError:
+                found = None  # Logged in all the same, just not remembered
+            if found:
+                max_age = get_auth_setting("remember_days", REMEMBER_ME_DAYS) * 86400
+                _set_cookie(SESSION_COOKIE, issue_session_token(found[0], found[1]), max_age)
         
-        return True
-    return False
+        return True, None
+    return False, "Invalid username or password"
 
 def logout_user():
     """Logout current user."""
+    # Forget the remembered session too, and don't restore it from this page's cookies
+    _set_cookie(SESSION_COOKIE, "", 0)
+    st.session_state.session_restore_attempted = True
+    session_id = st.session_state.pop("server_session_id", None)
+    if session_id and get_session_store() is not None:
+        get_session_store().delete(session_id)
+        _set_cookie(SESSION_ID_COOKIE, "", 0)
     st.session_state.authenticated = False
     st.session_state.user_id = None
     st.session_state.username = None
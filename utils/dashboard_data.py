@@ -0,0 +1,156 @@
+# utils/dashboard_data.py
+"""Stale-while-revalidate data for the dashboard homepages.
+
+Each dashboard gathers its figures with one loader function. The result is kept
+per tenant/user in a process-wide cache and served immediately on later visits;
+once it is older than the refresh TTL a background thread reloads it while the
+page keeps showing the last known figures. If the database is unavailable or a
+query fails, the previous figures stay on screen, marked as stale, instead of
+dropping to zero.
+
+The TTL can be set with refresh_ttl (seconds) in the [dashboard] section of the
+Streamlit secrets.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import streamlit as st
+
+from utils.db import (
+    rerun_connection, rerun_failed, load_concurrently, get_companies, get_company_stats, get_branches, get_employees,
+    get_tasks, get_task_inbox, get_task_counts, get_employee_task_stats, get_reports, get_report_count
+)
+
+DASHBOARD_REFRESH_TTL = 30  # seconds before cached dashboard figures are refreshed in the background
+DASHBOARD_MAX_ENTRIES = 1000  # dashboards kept in memory, least recently viewed dropped first
+
+# data is None only if the very first load failed; error holds the last refresh failure, if any
+DashboardData = namedtuple("DashboardData", ["data", "loaded_at", "refreshing", "error"])
+
+class DashboardCache:
+    """Process-wide store of the last figures loaded for each dashboard.
+
+    Each replica keeps and refreshes its own copy, so two replicas may show figures up to
+    one refresh TTL apart; a forced refresh only reloads the replica that serves it.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def _load(self, loader, args):
+        """Run a loader in one read-only snapshot; raise if any of its queries failed."""
+        with rerun_connection(snapshot=True):
+            data = loader(*args)
+            if rerun_failed():
+                # A query failed or found no connection, so some figures are empty
+                raise ConnectionError("database query failed")
+        return data
+
+    def _store(self, key, data, error):
+        with self._lock:
+            entry = self._entries.get(key)
+            if error is None:
+                entry = {"data": data, "loaded_at": time.time(), "refreshing": False, "error": None}
+            elif entry is not None:
+                entry = dict(entry, refreshing=False, error=error)
+            else:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _refresh(self, key, loader, args):
+        """Reload one dashboard, keeping the previous figures if the load fails."""
+        try:
+            self._store(key, self._load(loader, args), None)
+        except Exception as e:
+            self._store(key, None, str(e))
+
+    def get(self, key, loader, args, ttl, force=False):
+        """Return the cached DashboardData for key, loading or refreshing it as needed.
+
+        Only the first load (or a forced one) blocks; stale figures are returned at once
+        and refreshed by a background thread.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                start_refresh = not entry["refreshing"] and time.time() - entry["loaded_at"] >= ttl
+                if start_refresh and not force:
+                    entry["refreshing"] = True
+
+        if entry is None or force:
+            self._refresh(key, loader, args)
+        elif start_refresh:
+            threading.Thread(target=self._refresh, args=(key, loader, args), daemon=True).start()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return DashboardData(None, None, False, "database unavailable")
+            return DashboardData(entry["data"], entry["loaded_at"], entry["refreshing"], entry["error"])
+
+@st.cache_resource(show_spinner=False)
+def get_dashboard_cache():
+    """Create the shared dashboard cache once per Streamlit server process."""
+    return DashboardCache(DASHBOARD_MAX_ENTRIES)
+
+def get_refresh_ttl():
+    """Seconds after which dashboard figures are refreshed, from secrets or the default."""
+    try:
+        return float(st.secrets.get("dashboard", {}).get("refresh_ttl", DASHBOARD_REFRESH_TTL))
+    except Exception:
+        return DASHBOARD_REFRESH_TTL
+
+def request_refresh(name):
+    """Helper function to make the next load of a dashboard bypass the cache."""
+    st.session_state[f"refresh_{name}"] = True
+
+def load_dashboard(name, loader, *args):
+    """Get a dashboard's figures, serving the last known ones while they are refreshed.
+
+    args identify the tenant/user and are passed to loader, which must not touch
+    st.session_state since it may run on a background thread.
+    """
+    force = st.session_state.pop(f"refresh_{name}", False)
+    return get_dashboard_cache().get((name,) + args, loader, args, get_refresh_ttl(), force)
+
+# Loaders (the queries of each dashboard are independent, so they run concurrently)
+def load_admin_dashboard():
+    """Figures for the admin dashboard."""
+    return load_concurrently({
+        "companies": (get_companies, ()),
+        "company_stats": (get_company_stats, ()),
+    })
+
+def load_company_dashboard(company_id):
+    """Figures for a company dashboard."""
+    return load_concurrently({
+        "branches": (get_branches, (company_id,)),
+        "employees": (get_employees, (), {"company_id": company_id}),
+        "task_counts": (get_task_counts, (), {"company_id": company_id}),
+        "recent_tasks": (get_tasks, (), {"company_id": company_id, "limit": 5, "summary": True}),
+    })
+
+def load_branch_dashboard(branch_id, user_id):
+    """Figures for a manager or assistant manager dashboard."""
+    return load_concurrently({
+        "branch_employees": (get_employees, (), {"branch_id": branch_id}),
+        "employee_task_stats": (get_employee_task_stats, (branch_id,)),
+        "branch_task_counts": (get_task_counts, (), {"branch_id": branch_id}),
+        "own_tasks": (get_task_inbox, (user_id,), {"limit": 5, "summary": True}),
+    })
+
+def load_employee_dashboard(employee_id):
+    """Figures for an employee dashboard."""
+    return load_concurrently({
+        "task_counts": (get_task_counts, (), {"employee_id": employee_id}),
+        "pending_tasks": (get_task_inbox, (employee_id,), {"is_completed": False, "limit": 5, "summary": True}),
+        "report_count": (get_report_count, (), {"employee_id": employee_id}),
+        "recent_reports": (get_reports, (), {"employee_id": employee_id, "limit": 3, "summary": True}),
+    })
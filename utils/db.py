@@ -1,1203 +1,2261 @@
 import streamlit as st
 import psycopg2
+from psycopg2 import pool
+from psycopg2.extras import execute_values
+import threading
+import json
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 from datetime import datetime
-import bcrypt
+from utils.migrations import run_migrations
+from utils.passwords import hash_password, check_password
 
-# Database connection function
+# Connection pool settings (override via [postgres] pool_min / pool_max / pool_timeout / connect_timeout in secrets)
+POOL_MIN_CONNECTIONS = 2
+POOL_MAX_CONNECTIONS = 20
+POOL_CHECKOUT_TIMEOUT = 10  # seconds to wait for a free connection
+POOL_CONNECT_TIMEOUT = 5  # seconds to wait for the server when opening a new connection
+POOL_HEALTH_CHECK_AFTER = 30  # seconds a connection may sit idle before it is pinged on checkout
+LOADER_POOL_HEADROOM = 2  # connections load_concurrently() leaves free for other sessions
+
+class PooledConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers when it was last handed back to the pool."""
+    last_used = 0.0
+    # Tenant cache scopes to invalidate once the open transaction() commits
+    pending_invalidations = None
+
+class ConnectionPool:
+    """Process-wide, thread-safe pool of PostgreSQL connections.
+
+    Wraps psycopg2's ThreadedConnectionPool with a semaphore so callers wait for a free
+    connection instead of failing when the pool is exhausted, and validates connections
+    on checkout so a server restart or idle timeout never reaches a db function.
+    """
+
+    def __init__(self, minconn, maxconn, timeout, **connect_kwargs):
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(maxconn)
+        # ThreadedConnectionPool opens minconn connections up front, so the pool starts warm
+        self._pool = pool.ThreadedConnectionPool(
+            minconn, maxconn, connection_factory=PooledConnection, **connect_kwargs
+        )
+
+    def _is_healthy(self, conn):
+        """Check that a connection is still usable before handing it out."""
+        if conn.closed:
+            return False
+        if time.monotonic() - conn.last_used < POOL_HEALTH_CHECK_AFTER:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def reserve(self, count, keep_free=0):
+        """Claim up to count free connection slots without waiting, leaving keep_free unclaimed.
+        
+        Returns how many were claimed. Each claimed slot must be used by one
+        getconn(reserved=True) or given back with unreserve().
+        """
+        claimed = 0
+        while claimed < count + keep_free and self._slots.acquire(blocking=False):
+            claimed += 1
+        spare = min(claimed, keep_free)
+        self.unreserve(spare)
+        return claimed - spare
+
+    def unreserve(self, count):
+        """Give back slots claimed with reserve() that will not be used."""
+        for _ in range(count):
+            self._slots.release()
+
+    def getconn(self, reserved=False):
+        """Borrow a healthy connection, waiting up to the checkout timeout for a free slot.
+        
+        With reserved, the slot was already claimed with reserve() and no wait is needed.
+        """
+        if not reserved and not self._slots.acquire(timeout=self.timeout):
+            raise pool.PoolError(f"no connection available within {self.timeout} seconds")
+        try:
+            # Discard broken idle connections until a healthy one turns up; once the idle ones
+            # are used up the pool opens fresh connections (e.g. after a server restart)
+            for _ in range(self.maxconn + 1):
+                conn = self._pool.getconn()
+                if self._is_healthy(conn):
+                    return conn
+                self._pool.putconn(conn, close=True)
+            raise pool.PoolError("could not obtain a working connection")
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn):
+        """Return a connection to the pool, discarding it if it is no longer usable."""
+        try:
+            broken = bool(conn.closed)
+            if not broken and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            conn.last_used = time.monotonic()
+            self._pool.putconn(conn, close=broken)
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        """Close every connection held by the pool."""
+        self._pool.closeall()
+
+@st.cache_resource(show_spinner=False)
+def get_connection_pool():
+    """Create the shared connection pool once per Streamlit server process."""
+    settings = st.secrets["postgres"]
+    return ConnectionPool(
+        int(settings.get("pool_min", POOL_MIN_CONNECTIONS)),
+        int(settings.get("pool_max", POOL_MAX_CONNECTIONS)),
+        float(settings.get("pool_timeout", POOL_CHECKOUT_TIMEOUT)),
+        # Without it an unreachable server blocks the checkout until the OS gives up
+        connect_timeout=int(settings.get("connect_timeout", POOL_CONNECT_TIMEOUT)),
+        dbname=settings["dbname"],
+        user=settings["user"],
+        password=settings["password"],
+        host=settings["host"],
+        port=settings["port"]
+    )
+
+# Tenant cache settings
+TENANT_CACHE_TTL = 300  # seconds a cached result is trusted, bounding staleness from other server processes
+TENANT_CACHE_MAX_ENTRIES = 64  # results kept per company or branch
+
+class TenantCache:
+    """Process-wide cache of branch and employee lists, scoped by company and by branch.
+
+    Each scope carries a version that writes bump once they have committed. A result is only
+    stored if its scope's version has not moved since the version was looked up. A query that
+    starts after that lookup either sees a write or runs before it commits, and the write's
+    bump then drops or blocks the stale rows. Reads inside rerun_connection(snapshot=True)
+    are not stored: their snapshot may be older than the lookup, so they could cache rows
+    from before a write whose bump has already been counted.
+
+    Versions and results are per server process: a write only invalidates the replica that
+    made it, and other replicas may serve the old lists until TENANT_CACHE_TTL runs out.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._results = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def lookup(self, scope, key):
+        """Return (rows or None, version to pass to store() after a miss)."""
+        with self._lock:
+            entry = self._results.get(scope, {}).get(key)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self.hits += 1
+                return list(entry[0]), None
+            self.misses += 1
+            return None, self._versions.get(scope, 0)
+
+    def store(self, scope, key, version, rows):
+        """Cache rows read under version, unless a write has bumped the scope since."""
+        with self._lock:
+            if self._versions.get(scope, 0) != version:
+                return
+            results = self._results.setdefault(scope, {})
+            results.pop(key, None)
+            if len(results) >= self.max_entries:
+                # Drop the oldest result of this scope
+                results.pop(next(iter(results)))
+            results[key] = (list(rows), time.monotonic())
+
+    def invalidate(self, *scopes):
+        """Bump the version of each scope and drop its cached results."""
+        with self._lock:
+            for scope in scopes:
+                self._versions[scope] = self._versions.get(scope, 0) + 1
+                self._results.pop(scope, None)
+                self.invalidations += 1
+
+    def stats(self):
+        """Hit, miss and invalidation counters since the server process started."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "invalidations": self.invalidations,
+                    "cached_results": sum(len(results) for results in self._results.values())}
+
+@st.cache_resource(show_spinner=False)
+def get_tenant_cache():
+    """Create the shared tenant cache once per Streamlit server process."""
+    return TenantCache(TENANT_CACHE_TTL, TENANT_CACHE_MAX_ENTRIES)
+
+def get_cache_stats():
+    """Get the tenant cache's hit/miss counters."""
+    return get_tenant_cache().stats()
+
+def _invalidate_tenant(conn, company_id, *branch_ids):
+    """Invalidate cached lists for a company and the given branches after a write on conn.
+    
+    Inside transaction() this waits for the commit, so no other session can re-cache the
+    rows as they were before the write.
+    """
+    scopes = [("company", company_id)] + [("branch", branch_id) for branch_id in branch_ids if branch_id]
+    pending = getattr(conn, "pending_invalidations", None)
+    if pending is not None:
+        pending.extend(scopes)
+    else:
+        get_tenant_cache().invalidate(*scopes)
+
+# Database connection functions
 def get_connection():
-    """Create a connection to PostgreSQL database using streamlit secrets."""
+    """Borrow a connection from the shared pool; hand it back with release_connection()."""
     try:
-        conn = psycopg2.connect(
-            dbname=st.secrets["postgres"]["dbname"],
-            user=st.secrets["postgres"]["user"],
-            password=st.secrets["postgres"]["password"],
-            host=st.secrets["postgres"]["host"],
-            port=st.secrets["postgres"]["port"]
-        )
-        return conn
+        return get_connection_pool().getconn()
     except Exception as e:
         st.error(f"Database connection failed: {e}")
         return None
 
-# Initialize the database schema
-def initialize_database():
-    """Create necessary tables if they don't exist."""
-    conn = get_connection()
-    if conn:
+def release_connection(conn):
+    """Return a connection obtained from get_connection() to the pool."""
+    if conn is not None:
+        get_connection_pool().putconn(conn)
+
+# Connection shared by every db call of the current script run (see rerun_connection)
+_rerun = threading.local()
+
+@contextmanager
+def pooled_connection(conn=None):
+    """Borrow a pooled connection for the duration of a with block.
+
+    Yields None if no connection could be obtained. Any transaction left open
+    when the block exits is rolled back before the connection is reused.
+    Inside rerun_connection() the run's shared connection is yielded instead,
+    and a connection passed in by the caller (see transaction()) is yielded as is.
+    """
+    if conn is not None:
+        yield conn
+        return
+    
+    if getattr(_rerun, "active", False):
+        shared = _shared_connection()
+        if shared is None:
+            yield None
+            return
+        _rerun.depth += 1
         try:
-            cur = conn.cursor()
-            
-            # Admin table
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS admin (
-                id SERIAL PRIMARY KEY,
-                username VARCHAR(50) UNIQUE NOT NULL,
-                profile_name VARCHAR(100) NOT NULL,
-                profile_pic VARCHAR(255),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """)
-            
-            # Company table
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS company (
-                id SERIAL PRIMARY KEY,
-                company_name VARCHAR(100) NOT NULL,
-                username VARCHAR(50) UNIQUE NOT NULL,
-                password_hash VARCHAR(255) NOT NULL,
-                profile_pic VARCHAR(255),
-                is_active BOOLEAN DEFAULT TRUE,
-                created_by INTEGER REFERENCES admin(id),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """)
-            
-            # Branch table
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS branch (
-                id SERIAL PRIMARY KEY,
-                branch_name VARCHAR(100) NOT NULL,
-                company_id INTEGER REFERENCES company(id),
-                is_main_branch BOOLEAN DEFAULT FALSE,
-                is_active BOOLEAN DEFAULT TRUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(branch_name, company_id)
-            )
-            """)
-            
-            # Employee table
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS employee (
-                id SERIAL PRIMARY KEY,
-                employee_name VARCHAR(100) NOT NULL,
-                username VARCHAR(50) UNIQUE NOT NULL,
-                password_hash VARCHAR(255) NOT NULL,
-                profile_pic VARCHAR(255),
-                role VARCHAR(20) CHECK (role IN ('manager', 'asst_manager', 'employee')),
-                company_id INTEGER REFERENCES company(id),
-                branch_id INTEGER REFERENCES branch(id),
-                is_active BOOLEAN DEFAULT TRUE,
-                created_by VARCHAR(20) NOT NULL,
-                created_by_id INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """)
-            
-            # Task table
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS task (
-                id SERIAL PRIMARY KEY,
-                title VARCHAR(100) NOT NULL,
-                description TEXT,
-                assigned_to VARCHAR(20) NOT NULL, -- 'branch' or 'employee'
-                assigned_id INTEGER NOT NULL,
-                assigned_by VARCHAR(20) NOT NULL, -- 'company', 'manager', or 'asst_manager'
-                assigned_by_id INTEGER NOT NULL,
-                is_completed BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """)
-            
-            # Employee task completion table
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS task_completion (
-                id SERIAL PRIMARY KEY,
-                task_id INTEGER REFERENCES task(id),
-                employee_id INTEGER REFERENCES employee(id),
-                is_completed BOOLEAN DEFAULT FALSE,
-                completed_at TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """)
-            
-            # Report table
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS report (
-                id SERIAL PRIMARY KEY,
-                employee_id INTEGER REFERENCES employee(id),
-                report_date DATE NOT NULL,
-                content TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """)
-            
-            # Message table
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS message (
-                id SERIAL PRIMARY KEY,
-                sender_type VARCHAR(20) NOT NULL, -- 'admin', 'company', 'manager', 'asst_manager', 'employee'
-                sender_id INTEGER NOT NULL,
-                receiver_type VARCHAR(20) NOT NULL, -- 'company', 'branch', 'employee'
-                receiver_id INTEGER NOT NULL,
-                message_text TEXT,
-                attachment_link VARCHAR(255),
-                is_deleted BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """)
-
-            # Insert default admin if not exists
-            cur.execute("""
-            INSERT INTO admin (username, profile_name, profile_pic)
-            SELECT 'admin', 'System Administrator', 'https://ui-avatars.com/api/?name=Admin&background=random'
-            WHERE NOT EXISTS (SELECT 1 FROM admin WHERE username = 'admin')
-            """)
-            
-            conn.commit()
-            cur.close()
-        except Exception as e:
-            st.error(f"Database initialization failed: {e}")
+            yield shared
         finally:
-            conn.close()
+            _rerun.depth -= 1
+            if _rerun.depth == 0:
+                _end_shared_transaction(shared)
+        return
+    
+    conn = get_connection()
+    try:
+        yield conn
+    finally:
+        release_connection(conn)
 
-# Company Functions
-def create_company(company_name, username, password, profile_pic, admin_id):
-    """Create a new company."""
+def _start_snapshot(conn, snapshot_id):
+    """Put a connection into a read-only REPEATABLE READ transaction, optionally on an exported snapshot."""
+    conn.rollback()
+    conn.set_session(isolation_level=psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ, readonly=True)
+    if snapshot_id:
+        cur = conn.cursor()
+        cur.execute("SET TRANSACTION SNAPSHOT %s", (snapshot_id,))
+        cur.close()
+
+def _shared_connection():
+    """The run's shared connection, borrowed on first use; None (and the run marked failed) if unavailable."""
+    conn = _rerun.conn
+    if conn is not None:
+        return conn
     conn = get_connection()
-    if conn:
+    if conn is None:
+        _rerun.failed = True
+        return None
+    if _rerun.snapshot:
         try:
-            cur = conn.cursor()
-            # Hash the password
-            password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-            
-            cur.execute("""
-            INSERT INTO company (company_name, username, password_hash, profile_pic, created_by)
-            VALUES (%s, %s, %s, %s, %s)
-            RETURNING id
-            """, (company_name, username, password_hash, profile_pic, admin_id))
-            
-            company_id = cur.fetchone()[0]
-            
-            # Create default main branch
-            cur.execute("""
-            INSERT INTO branch (branch_name, company_id, is_main_branch)
-            VALUES ('Main Branch', %s, TRUE)
-            """, (company_id,))
-            
-            conn.commit()
-            cur.close()
-            return company_id
-        except Exception as e:
-            conn.rollback()
-            st.error(f"Failed to create company: {e}")
+            _start_snapshot(conn, _rerun.snapshot_id)
+        except psycopg2.Error as e:
+            # e.g. the exporting transaction has already ended
+            conn.close()
+            release_connection(conn)
+            st.error(f"Database connection failed: {e}")
+            _rerun.failed = True
             return None
-        finally:
+    _rerun.conn = conn
+    return conn
+
+def _release_shared():
+    """Hand the run's shared connection back to the pool, if one was borrowed."""
+    conn, _rerun.conn = _rerun.conn, None
+    if conn is None:
+        return
+    if _rerun.snapshot and not conn.closed:
+        try:
+            conn.rollback()
+            conn.set_session(isolation_level="DEFAULT", readonly="DEFAULT")
+        except psycopg2.Error:
+            # Never hand a connection stuck in read-only mode back to the pool
             conn.close()
+    release_connection(conn)
+
+def _end_shared_transaction(conn):
+    """Finish what a db function left open on the shared connection.
+    
+    Outside a snapshot this matches handing the connection back to the pool; inside one the
+    read-only transaction is kept so later calls see the same point in time, unless a failed
+    statement aborted it. A connection that broke is given back, and the next call borrows
+    another. A failed statement or a broken connection marks the run failed (see
+    rerun_failed()), since the db function will have returned an empty result.
+    """
+    if conn.closed:
+        _rerun.failed = True
+        _release_shared()
+        return
+    status = conn.get_transaction_status()
+    if status == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+        _rerun.failed = True
+    if status == psycopg2.extensions.TRANSACTION_STATUS_INERROR or (
+            status == psycopg2.extensions.TRANSACTION_STATUS_INTRANS and not _rerun.snapshot):
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+
+_RERUN_STATE = ("active", "conn", "depth", "snapshot", "snapshot_id", "failed")
+
+@contextmanager
+def rerun_connection(snapshot=False, snapshot_id=None, conn=None):
+    """Share one pooled connection across every db call made inside the with block.
+    
+    Wrap a whole script run (or one page render) in this so it borrows a single connection
+    instead of one per db call. The connection is only borrowed by the first db call in the
+    block, so a run that never queries never takes one. With snapshot=True the calls run in
+    one REPEATABLE READ, read-only transaction, so every figure on the page comes from the
+    same point in time; use it only around code that does not write. snapshot_id (from
+    export_snapshot()) makes that transaction see exactly the same data as another
+    connection's snapshot, and conn supplies an already borrowed connection for the block to
+    use and release. Blocks nest, and calls made from other threads still borrow their own
+    connections.
+    """
+    if getattr(_rerun, "active", False) and conn is None and (_rerun.snapshot or not snapshot):
+        # The outer block already provides what this one asks for
+        yield
+        return
+    
+    outer = {name: getattr(_rerun, name, None) for name in _RERUN_STATE}
+    if outer["active"] and outer["conn"] is not None and outer["depth"] == 0:
+        # Give the outer block's idle connection back rather than hold two at once
+        _release_shared()
+        outer["conn"] = None
+    _rerun.active, _rerun.conn, _rerun.depth = True, None, 0
+    _rerun.snapshot, _rerun.snapshot_id, _rerun.failed = snapshot, snapshot_id, False
+    try:
+        if conn is not None:
+            _rerun.conn = conn
+            if snapshot:
+                _start_snapshot(conn, snapshot_id)
+        yield
+    finally:
+        _release_shared()
+        for name, value in outer.items():
+            setattr(_rerun, name, value)
+
+def rerun_failed():
+    """Check whether a db call in the current rerun_connection() block failed.
+    
+    True once a call found no working connection or left a failed statement behind. Db
+    functions report such failures with st.error() and return empty results ([], {} or 0),
+    so code that keeps its results (like the dashboard cache) checks this before trusting them.
+    """
+    return bool(getattr(_rerun, "failed", False))
+
+@contextmanager
+def connection_released():
+    """Give the run's shared connection back to the pool while the with block waits on something else.
+    
+    Use around slow work that needs no database, such as bcrypt or a login admission wait, so
+    other sessions can use the connection meanwhile; the next db call borrows one again. Does
+    nothing while a db function or transaction() is using the connection, or inside a
+    snapshot, whose transaction would be lost.
+    """
+    if getattr(_rerun, "active", False) and _rerun.depth == 0 and not _rerun.snapshot:
+        _release_shared()
+    yield
+
+def export_snapshot():
+    """Export the snapshot this thread is reading from, or None outside rerun_connection(snapshot=True).
+    
+    Other connections can adopt it with rerun_connection(snapshot=True, snapshot_id=...) for
+    as long as this thread's snapshot stays open.
+    """
+    if not getattr(_rerun, "active", False) or not _rerun.snapshot:
+        return None
+    conn = _shared_connection()
+    if conn is None or conn.closed:
+        return None
+    cur = conn.cursor()
+    cur.execute("SELECT pg_export_snapshot()")
+    snapshot_id = cur.fetchone()[0]
+    cur.close()
+    return snapshot_id
+
+@st.cache_resource(show_spinner=False)
+def get_loader_executor():
+    """Create the thread pool used by load_concurrently() once per Streamlit server process."""
+    # A worker only runs with a reserved connection, so one thread per connection never queues
+    return ThreadPoolExecutor(max_workers=get_connection_pool().maxconn, thread_name_prefix="db-loader")
+
+def _load_on_worker(snapshot_id, func, args, kwargs):
+    """Run one db call on a worker thread with its reserved connection, in the caller's snapshot if any."""
+    try:
+        conn = get_connection_pool().getconn(reserved=True)
+    except Exception as e:
+        raise ConnectionError(f"database unavailable: {e}") from e
+    with rerun_connection(snapshot=snapshot_id is not None, snapshot_id=snapshot_id, conn=conn):
+        result = func(*args, **kwargs)
+        if rerun_failed():
+            raise ConnectionError("database query failed")
+        return result
+
+def load_concurrently(calls):
+    """Run independent db calls in parallel on as many pooled connections as are free.
+    
+    calls maps a name to (func, args) or (func, args, kwargs); the results come back under
+    the same names once every call has finished. The calling thread runs one call itself and
+    hands the others to worker threads, but only as many as there are connections free right
+    now (keeping LOADER_POOL_HEADROOM for other sessions); the rest run on the calling thread
+    too. So the workers never wait on the pool while the caller holds a connection, and on a
+    busy pool the calls simply run one after another. Inside rerun_connection(snapshot=True)
+    every call reads the caller's snapshot, so the results stay consistent with each other.
+    An exception raised by any call is re-raised here.
+    """
+    calls = [(name,) + tuple(call) + ({},) * (3 - len(call)) for name, call in calls.items()]
+    snapshot_id = export_snapshot()
+    reserved = get_connection_pool().reserve(len(calls) - 1, keep_free=LOADER_POOL_HEADROOM)
+    futures = {}
+    try:
+        executor = get_loader_executor()
+        for name, func, args, kwargs in calls[:reserved]:
+            futures[name] = executor.submit(_load_on_worker, snapshot_id, func, args, kwargs)
+    finally:
+        get_connection_pool().unreserve(reserved - len(futures))
+    
+    results = {name: func(*args, **kwargs) for name, func, args, kwargs in calls[len(futures):]}
+    results.update((name, future.result()) for name, future in futures.items())
+    return {name: results[name] for name, *_ in calls}
+
+def _snapshot_open():
+    """Check whether this thread's db calls read from a rerun_connection(snapshot=True) snapshot."""
+    return bool(getattr(_rerun, "active", False) and _rerun.snapshot)
+
+def _transaction_open():
+    """Check whether this thread is inside transaction(), which db functions then join."""
+    conn = getattr(_rerun, "conn", None) if getattr(_rerun, "active", False) else None
+    return conn is not None and conn.pending_invalidations is not None
+
+@contextmanager
+def transaction():
+    """Run several db writes as one unit of work that commits once.
+    
+    Every db function called inside the block on this thread runs on the block's connection,
+    whether or not the yielded connection is passed as conn=. Those calls leave the commit to
+    this block and let errors propagate, so a failure in any step rolls back every step; a
+    nested transaction() simply joins the outer one. Call st.rerun() after the block, not
+    inside it.
+    """
+    with rerun_connection(), pooled_connection() as conn:
+        if conn is None:
+            raise RuntimeError("no database connection")
+        if conn.pending_invalidations is not None:
+            # The outermost block commits
+            yield conn
+            return
+        conn.pending_invalidations = []
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            invalidations, conn.pending_invalidations = conn.pending_invalidations, None
+        conn.commit()
+        get_tenant_cache().invalidate(*invalidations)
+
+# Initialize the database schema
+@st.cache_resource(show_spinner=False)
+def _migrate_schema():
+    """Apply pending migrations once per server process (failures are not cached)."""
+    with pooled_connection() as conn:
+        if conn is None:
+            raise RuntimeError("no database connection")
+        return run_migrations(conn)
+
+def initialize_database():
+    """Bring the schema up to date; only the first call in a server process touches the database."""
+    try:
+        _migrate_schema()
+    except Exception as e:
+        st.error(f"Database initialization failed: {e}")
+
+# Keyset pagination
+def keyset_filter(sort_keys, cursor):
+    """Build a WHERE fragment matching rows that sort after cursor.
+    
+    sort_keys is the list of (column, descending) pairs of the query's ORDER BY and cursor holds
+    the same columns' values from the last row of the previous page. A None cursor (the first
+    page) adds no condition; a None value inside one is rejected, since no row compares after it.
+    """
+    if cursor is None:
+        return "", []
+    if len(cursor) != len(sort_keys) or any(value is None for value in cursor):
+        raise ValueError(f"keyset cursor {cursor!r} does not match sort keys {sort_keys!r}")
+
+    if all(descending for _, descending in sort_keys) or not any(descending for _, descending in sort_keys):
+        # Uniform direction: a row comparison can be answered straight from a matching index
+        operator = "<" if sort_keys[0][1] else ">"
+        columns = ", ".join(column for column, _ in sort_keys)
+        placeholders = ", ".join(["%s"] * len(sort_keys))
+        return f" AND ({columns}) {operator} ({placeholders})", list(cursor)
+    
+    clauses = []
+    params = []
+    for position, (column, descending) in enumerate(sort_keys):
+        equal_columns = [f"{prior} = %s" for prior, _ in sort_keys[:position]]
+        clauses.append("(" + " AND ".join(equal_columns + [f"{column} {'<' if descending else '>'} %s"]) + ")")
+        params.extend(cursor[:position])
+        params.append(cursor[position])
+    return " AND (" + " OR ".join(clauses) + ")", params
+
+# Company Functions
+def create_company(company_name, username, password, profile_pic, admin_id, conn=None):
+    """Create a new company."""
+    owns_transaction = conn is None and not _transaction_open()
+    # Hash before borrowing a connection so none is held while bcrypt runs
+    with connection_released():
+        password_hash = hash_password(password)
+    with pooled_connection(conn) as conn:
+        if conn:
+            if owns_transaction:
+                # Hold create_branch's invalidations until the company commits, as transaction() does
+                conn.pending_invalidations = []
+            try:
+                cur = conn.cursor()
+            
+                cur.execute("""
+                INSERT INTO company (company_name, username, password_hash, profile_pic, created_by)
+                VALUES (%s, %s, %s, %s, %s)
+                RETURNING id
+                """, (company_name, username, password_hash, profile_pic, admin_id))
+            
+                company_id = cur.fetchone()[0]
+            
+                # Create default main branch in the same transaction
+                create_branch("Main Branch", company_id, is_main_branch=True, conn=conn)
+            
+                if owns_transaction:
+                    conn.commit()
+                    get_tenant_cache().invalidate(*conn.pending_invalidations)
+                cur.close()
+                return company_id
+            except Exception as e:
+                if not owns_transaction:
+                    raise
+                conn.rollback()
+                st.error(f"Failed to create company: {e}")
+                return None
+            finally:
+                if owns_transaction:
+                    conn.pending_invalidations = None
     return None
 
 def get_companies():
     """Get all companies."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("""
-            SELECT id, company_name, username, profile_pic, is_active, created_at
-            FROM company
-            ORDER BY created_at DESC
-            """)
-            companies = cur.fetchall()
-            cur.close()
-            
-            return companies
-        except Exception as e:
-            st.error(f"Failed to get companies: {e}")
-            return []
-        finally:
-            conn.close()
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                SELECT id, company_name, username, profile_pic, is_active, created_at
+                FROM company
+                ORDER BY created_at DESC
+                """)
+                companies = cur.fetchall()
+                cur.close()
+            
+                return companies
+            except Exception as e:
+                st.error(f"Failed to get companies: {e}")
+                return []
     return []
 
-def toggle_company_status(company_id, is_active):
+def get_company_stats():
+    """Get branch and employee counts for every company in one query.
+    
+    Returns {company_id: {"branches", "active_branches", "employees", "active_employees"}}.
+    """
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                SELECT c.id,
+                       COALESCE(b.total, 0), COALESCE(b.active, 0),
+                       COALESCE(e.total, 0), COALESCE(e.active, 0)
+                FROM company c
+                LEFT JOIN (
+                    SELECT company_id, COUNT(*) AS total, COUNT(*) FILTER (WHERE is_active) AS active
+                    FROM branch
+                    GROUP BY company_id
+                ) b ON b.company_id = c.id
+                LEFT JOIN (
+                    SELECT company_id, COUNT(*) AS total, COUNT(*) FILTER (WHERE is_active) AS active
+                    FROM employee
+                    GROUP BY company_id
+                ) e ON e.company_id = c.id
+                """)
+                stats = {
+                    row[0]: {
+                        "branches": row[1],
+                        "active_branches": row[2],
+                        "employees": row[3],
+                        "active_employees": row[4]
+                    }
+                    for row in cur.fetchall()
+                }
+                cur.close()
+                
+                return stats
+            except Exception as e:
+                st.error(f"Failed to get company statistics: {e}")
+                return {}
+    return {}
+
+def toggle_company_status(company_id, is_active, conn=None):
     """Activate or deactivate a company and related branches and employees."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            # Update company status
-            cur.execute("""
-            UPDATE company
-            SET is_active = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-            """, (is_active, company_id))
-            
-            # Update branch status
-            cur.execute("""
-            UPDATE branch
-            SET is_active = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE company_id = %s
-            """, (is_active, company_id))
+    owns_transaction = conn is None and not _transaction_open()
+    with pooled_connection(conn) as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                # Update company status
+                cur.execute("""
+                UPDATE company
+                SET is_active = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+                """, (is_active, company_id))
             
-            # Update employee status
-            cur.execute("""
-            UPDATE employee
-            SET is_active = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE company_id = %s
-            """, (is_active, company_id))
+                # Update branch status
+                cur.execute("""
+                UPDATE branch
+                SET is_active = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE company_id = %s
+                RETURNING id
+                """, (is_active, company_id))
+                branch_ids = [row[0] for row in cur.fetchall()]
             
-            conn.commit()
-            cur.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            st.error(f"Failed to update company status: {e}")
-            return False
-        finally:
-            conn.close()
+                # Update employee status
+                cur.execute("""
+                UPDATE employee
+                SET is_active = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE company_id = %s
+                """, (is_active, company_id))
+            
+                if owns_transaction:
+                    conn.commit()
+                cur.close()
+                _invalidate_tenant(conn, company_id, *branch_ids)
+                return True
+            except Exception as e:
+                if not owns_transaction:
+                    raise
+                conn.rollback()
+                st.error(f"Failed to update company status: {e}")
+                return False
     return False
 
 # Branch Functions
-def create_branch(branch_name, company_id):
+def create_branch(branch_name, company_id, is_main_branch=False, conn=None):
     """Create a new branch."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("""
-            INSERT INTO branch (branch_name, company_id)
-            VALUES (%s, %s)
-            RETURNING id
-            """, (branch_name, company_id))
-            
-            branch_id = cur.fetchone()[0]
-            conn.commit()
-            cur.close()
-            return branch_id
-        except Exception as e:
-            conn.rollback()
-            st.error(f"Failed to create branch: {e}")
-            return None
-        finally:
-            conn.close()
+    owns_transaction = conn is None and not _transaction_open()
+    with pooled_connection(conn) as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                INSERT INTO branch (branch_name, company_id, is_main_branch)
+                VALUES (%s, %s, %s)
+                RETURNING id
+                """, (branch_name, company_id, is_main_branch))
+            
+                branch_id = cur.fetchone()[0]
+                if owns_transaction:
+                    conn.commit()
+                cur.close()
+                _invalidate_tenant(conn, company_id, branch_id)
+                return branch_id
+            except Exception as e:
+                if not owns_transaction:
+                    raise
+                conn.rollback()
+                st.error(f"Failed to create branch: {e}")
+                return None
     return None
 
+# Shared with the plan checks in utils/query_plans.py
+BRANCHES_SQL = """
+SELECT id, branch_name, is_main_branch, is_active, created_at
+FROM branch
+WHERE company_id = %s
+ORDER BY is_main_branch DESC, created_at DESC
+"""
+
 def get_branches(company_id):
-    """Get all branches for a company."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("""
-            SELECT id, branch_name, is_main_branch, is_active, created_at
-            FROM branch
-            WHERE company_id = %s
-            ORDER BY is_main_branch DESC, created_at DESC
-            """, (company_id,))
-            branches = cur.fetchall()
-            cur.close()
-            
-            return branches
-        except Exception as e:
-            st.error(f"Failed to get branches: {e}")
-            return []
-        finally:
-            conn.close()
+    """Get all branches for a company, served from the tenant cache until one of them changes."""
+    cache = get_tenant_cache()
+    branches, version = cache.lookup(("company", company_id), ("branches",))
+    if branches is not None:
+        return branches
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute(BRANCHES_SQL, (company_id,))
+                branches = cur.fetchall()
+                cur.close()
+            
+                if not _snapshot_open():
+                    cache.store(("company", company_id), ("branches",), version, branches)
+                return branches
+            except Exception as e:
+                st.error(f"Failed to get branches: {e}")
+                return []
     return []
 
-def toggle_branch_status(branch_id, is_active):
+def toggle_branch_status(branch_id, is_active, conn=None):
     """Activate or deactivate a branch and related employees."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            # Update branch status
-            cur.execute("""
-            UPDATE branch
-            SET is_active = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-            """, (is_active, branch_id))
-            
-            # Update employee status
-            cur.execute("""
-            UPDATE employee
-            SET is_active = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE branch_id = %s
-            """, (is_active, branch_id))
+    owns_transaction = conn is None and not _transaction_open()
+    with pooled_connection(conn) as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                # Update branch status
+                cur.execute("""
+                UPDATE branch
+                SET is_active = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+                RETURNING company_id
+                """, (is_active, branch_id))
+                branch = cur.fetchone()
             
-            conn.commit()
-            cur.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            st.error(f"Failed to update branch status: {e}")
-            return False
-        finally:
-            conn.close()
+                # Update employee status
+                cur.execute("""
+                UPDATE employee
+                SET is_active = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE branch_id = %s
+                """, (is_active, branch_id))
+            
+                if owns_transaction:
+                    conn.commit()
+                cur.close()
+                if branch:
+                    _invalidate_tenant(conn, branch[0], branch_id)
+                return True
+            except Exception as e:
+                if not owns_transaction:
+                    raise
+                conn.rollback()
+                st.error(f"Failed to update branch status: {e}")
+                return False
     return False
 
 # Employee Functions
-def create_employee(employee_name, username, password, profile_pic, role, company_id, branch_id, created_by, created_by_id):
+def create_employee(employee_name, username, password, profile_pic, role, company_id, branch_id, created_by, created_by_id, conn=None):
     """Create a new employee."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            # Hash the password
-            password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-            
-            cur.execute("""
-            INSERT INTO employee (employee_name, username, password_hash, profile_pic, role, company_id, branch_id, created_by, created_by_id)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            RETURNING id
-            """, (employee_name, username, password_hash, profile_pic, role, company_id, branch_id, created_by, created_by_id))
+    owns_transaction = conn is None and not _transaction_open()
+    # Hash before borrowing a connection so none is held while bcrypt runs
+    with connection_released():
+        password_hash = hash_password(password)
+    with pooled_connection(conn) as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
             
-            employee_id = cur.fetchone()[0]
-            conn.commit()
-            cur.close()
-            return employee_id
-        except Exception as e:
-            conn.rollback()
-            st.error(f"Failed to create employee: {e}")
-            return None
-        finally:
-            conn.close()
+                cur.execute("""
+                INSERT INTO employee (employee_name, username, password_hash, profile_pic, role, company_id, branch_id, created_by, created_by_id)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING id
+                """, (employee_name, username, password_hash, profile_pic, role, company_id, branch_id, created_by, created_by_id))
+            
+                employee_id = cur.fetchone()[0]
+                if owns_transaction:
+                    conn.commit()
+                cur.close()
+                _invalidate_tenant(conn, company_id, branch_id)
+                return employee_id
+            except Exception as e:
+                if not owns_transaction:
+                    raise
+                conn.rollback()
+                st.error(f"Failed to create employee: {e}")
+                return None
     return None
 
-def get_employees(company_id=None, branch_id=None, role=None):
-    """Get employees based on filters."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            query = """
-            SELECT e.id, e.employee_name, e.username, e.profile_pic, e.role, e.is_active, b.branch_name
-            FROM employee e
-            JOIN branch b ON e.branch_id = b.id
-            WHERE 1=1
-            """
-            params = []
-            
-            if company_id:
-                query += " AND e.company_id = %s"
-                params.append(company_id)
-            
-            if branch_id:
-                query += " AND e.branch_id = %s"
-                params.append(branch_id)
-            
-            if role:
-                query += " AND e.role = %s"
-                params.append(role)
-            
-            query += " ORDER BY e.role, e.created_at DESC"
-            
-            cur.execute(query, params)
-            employees = cur.fetchall()
-            cur.close()
-            
+# Rows sent per INSERT statement by bulk_create_employees
+BULK_INSERT_PAGE_SIZE = 500
+
+def get_existing_usernames(usernames):
+    """Get which of the given usernames are already taken by an employee."""
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                SELECT username FROM employee
+                WHERE username = ANY(%s)
+                """, (list(usernames),))
+                taken = {row[0] for row in cur.fetchall()}
+                cur.close()
+                return taken
+            except Exception as e:
+                st.error(f"Failed to check usernames: {e}")
+                return None
+    return None
+
+def bulk_create_employees(employees, company_id, created_by, created_by_id, conn=None):
+    """Create many employees in one transaction with batched inserts.
+    
+    employees is a list of (employee_name, username, password_hash, profile_pic, role, branch_id)
+    with the passwords already hashed. Rows whose username is taken by the time they are
+    inserted are skipped; returns {username: employee_id} for the rows created, or None.
+    """
+    owns_transaction = conn is None and not _transaction_open()
+    with pooled_connection(conn) as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                created = execute_values(cur, """
+                INSERT INTO employee (employee_name, username, password_hash, profile_pic, role, company_id, branch_id, created_by, created_by_id)
+                VALUES %s
+                ON CONFLICT (username) DO NOTHING
+                RETURNING username, id
+                """, [(name, username, password_hash, profile_pic, role, company_id, branch_id, created_by, created_by_id)
+                      for name, username, password_hash, profile_pic, role, branch_id in employees],
+                page_size=BULK_INSERT_PAGE_SIZE, fetch=True)
+                
+                if owns_transaction:
+                    conn.commit()
+                cur.close()
+                _invalidate_tenant(conn, company_id, *{employee[5] for employee in employees})
+                return dict(created)
+            except Exception as e:
+                if not owns_transaction:
+                    raise
+                conn.rollback()
+                st.error(f"Failed to import employees: {e}")
+                return None
+    return None
+
+EMPLOYEE_SORT_KEYS = [("e.role", False), ("e.created_at", True), ("e.id", True)]
+
+def employee_cursor(employee):
+    """Keyset cursor for the page of employees ending with this row."""
+    return (employee[4], employee[7], employee[0])
+
+def employees_query(company_id=None, branch_id=None, role=None, limit=None, after=None):
+    """Build the (query, params) get_employees() runs for these filters."""
+    query = """
+    SELECT e.id, e.employee_name, e.username, e.profile_pic, e.role, e.is_active, b.branch_name, e.created_at
+    FROM employee e
+    JOIN branch b ON e.branch_id = b.id
+    WHERE 1=1
+    """
+    params = []
+
+    if company_id:
+        query += " AND e.company_id = %s"
+        params.append(company_id)
+
+    if branch_id:
+        query += " AND e.branch_id = %s"
+        params.append(branch_id)
+
+    if role:
+        query += " AND e.role = %s"
+        params.append(role)
+
+    if after:
+        keyset_sql, keyset_params = keyset_filter(EMPLOYEE_SORT_KEYS, after)
+        query += keyset_sql
+        params.extend(keyset_params)
+
+    query += " ORDER BY e.role, e.created_at DESC, e.id DESC"
+
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query, params
+
+def get_employees(company_id=None, branch_id=None, role=None, limit=None, after=None):
+    """Get employees based on filters.
+    
+    Pass limit and the employee_cursor() of the last row seen as after to page through results.
+    Results scoped to a company or branch are served from the tenant cache until an employee
+    or branch in that scope changes.
+    """
+    cache = get_tenant_cache()
+    cache_scope = ("company", company_id) if company_id else ("branch", branch_id) if branch_id else None
+    cache_key = ("employees", company_id, branch_id, role, limit, after)
+    if cache_scope:
+        employees, version = cache.lookup(cache_scope, cache_key)
+        if employees is not None:
             return employees
-        except Exception as e:
-            st.error(f"Failed to get employees: {e}")
-            return []
-        finally:
-            conn.close()
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute(*employees_query(company_id, branch_id, role, limit, after))
+                employees = cur.fetchall()
+                cur.close()
+            
+                if cache_scope and not _snapshot_open():
+                    cache.store(cache_scope, cache_key, version, employees)
+                return employees
+            except Exception as e:
+                st.error(f"Failed to get employees: {e}")
+                return []
     return []
 
-def toggle_employee_status(employee_id, is_active):
+def toggle_employee_status(employee_id, is_active, conn=None):
     """Activate or deactivate an employee."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("""
-            UPDATE employee
-            SET is_active = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-            """, (is_active, employee_id))
-            
-            conn.commit()
-            cur.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            st.error(f"Failed to update employee status: {e}")
-            return False
-        finally:
-            conn.close()
+    owns_transaction = conn is None and not _transaction_open()
+    with pooled_connection(conn) as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                UPDATE employee
+                SET is_active = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+                RETURNING company_id, branch_id
+                """, (is_active, employee_id))
+                employee = cur.fetchone()
+            
+                if owns_transaction:
+                    conn.commit()
+                cur.close()
+                if employee:
+                    _invalidate_tenant(conn, *employee)
+                return True
+            except Exception as e:
+                if not owns_transaction:
+                    raise
+                conn.rollback()
+                st.error(f"Failed to update employee status: {e}")
+                return False
     return False
 
-def update_employee_role(employee_id, role):
+def update_employee_role(employee_id, role, conn=None):
     """Update employee role."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("""
-            UPDATE employee
-            SET role = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-            """, (role, employee_id))
-            
-            conn.commit()
-            cur.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            st.error(f"Failed to update employee role: {e}")
-            return False
-        finally:
-            conn.close()
+    owns_transaction = conn is None and not _transaction_open()
+    with pooled_connection(conn) as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                UPDATE employee
+                SET role = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+                RETURNING company_id, branch_id
+                """, (role, employee_id))
+                employee = cur.fetchone()
+            
+                if owns_transaction:
+                    conn.commit()
+                cur.close()
+                if employee:
+                    _invalidate_tenant(conn, *employee)
+                return True
+            except Exception as e:
+                if not owns_transaction:
+                    raise
+                conn.rollback()
+                st.error(f"Failed to update employee role: {e}")
+                return False
     return False
 
-def update_employee_branch(employee_id, branch_id):
+def update_employee_branch(employee_id, branch_id, conn=None):
     """Update employee branch."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("""
-            UPDATE employee
-            SET branch_id = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-            """, (branch_id, employee_id))
-            
-            conn.commit()
-            cur.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            st.error(f"Failed to update employee branch: {e}")
-            return False
-        finally:
-            conn.close()
+    owns_transaction = conn is None and not _transaction_open()
+    with pooled_connection(conn) as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                UPDATE employee e
+                SET branch_id = %s, updated_at = CURRENT_TIMESTAMP
+                FROM (SELECT id, branch_id FROM employee WHERE id = %s FOR UPDATE) AS previous
+                WHERE e.id = previous.id
+                RETURNING e.company_id, previous.branch_id
+                """, (branch_id, employee_id))
+                employee = cur.fetchone()
+            
+                if owns_transaction:
+                    conn.commit()
+                cur.close()
+                if employee:
+                    # Both the old and the new branch list change
+                    _invalidate_tenant(conn, employee[0], employee[1], branch_id)
+                return True
+            except Exception as e:
+                if not owns_transaction:
+                    raise
+                conn.rollback()
+                st.error(f"Failed to update employee branch: {e}")
+                return False
     return False
 
 # Task Functions
-def create_task(title, description, assigned_to, assigned_id, assigned_by, assigned_by_id):
+def create_task(title, description, assigned_to, assigned_id, assigned_by, assigned_by_id, conn=None):
     """Create a new task."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("""
-            INSERT INTO task (title, description, assigned_to, assigned_id, assigned_by, assigned_by_id)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            RETURNING id
-            """, (title, description, assigned_to, assigned_id, assigned_by, assigned_by_id))
-            
-            task_id = cur.fetchone()[0]
-            
-            # If assigned to branch, assign to all employees in that branch
-            if assigned_to == 'branch':
+    owns_transaction = conn is None and not _transaction_open()
+    with pooled_connection(conn) as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
                 cur.execute("""
-                INSERT INTO task_completion (task_id, employee_id)
-                SELECT %s, id FROM employee
-                WHERE branch_id = %s AND is_active = TRUE
-                """, (task_id, assigned_id))
-            else:  # assigned to employee
-                cur.execute("""
-                INSERT INTO task_completion (task_id, employee_id)
-                VALUES (%s, %s)
-                """, (task_id, assigned_id))
-            
-            conn.commit()
-            cur.close()
-            return task_id
-        except Exception as e:
-            conn.rollback()
-            st.error(f"Failed to create task: {e}")
-            return None
-        finally:
-            conn.close()
+                INSERT INTO task (title, description, assigned_to, assigned_id, assigned_by, assigned_by_id)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                RETURNING id
+                """, (title, description, assigned_to, assigned_id, assigned_by, assigned_by_id))
+            
+                task_id = cur.fetchone()[0]
+            
+                # If assigned to branch, assign to all employees in that branch
+                if assigned_to == 'branch':
+                    cur.execute("""
+                    INSERT INTO task_completion (task_id, employee_id)
+                    SELECT %s, id FROM employee
+                    WHERE branch_id = %s AND is_active = TRUE
+                    """, (task_id, assigned_id))
+                else:  # assigned to employee
+                    cur.execute("""
+                    INSERT INTO task_completion (task_id, employee_id)
+                    VALUES (%s, %s)
+                    """, (task_id, assigned_id))
+            
+                if owns_transaction:
+                    conn.commit()
+                cur.close()
+                return task_id
+            except Exception as e:
+                if not owns_transaction:
+                    raise
+                conn.rollback()
+                st.error(f"Failed to create task: {e}")
+                return None
     return None
 
+TASK_SORT_KEYS = [("t.created_at", True), ("t.id", True)]
+
+# Characters of a task description or report content returned by summary queries
+SUMMARY_PREVIEW_LENGTH = 200
+
+def task_cursor(task):
+    """Keyset cursor for the page of tasks ending with this row."""
+    return (task[8], task[0])
+
+def _task_filters(company_id=None, branch_id=None, employee_id=None, assigned_to=None, assigned_id=None,
+                  is_completed=None, assigned_by=None, assigned_by_id=None):
+    """Build the join, WHERE fragment and params shared by the task list and count queries."""
+    join = ""
+    conditions = []
+    params = []
+    
+    if employee_id:
+        join = " JOIN task_completion tc ON t.id = tc.task_id"
+        conditions.append("tc.employee_id = %s")
+        params.append(employee_id)
+    
+    if company_id:
+        conditions.append("(t.assigned_by = 'company' AND t.assigned_by_id = %s)")
+        params.append(company_id)
+    
+    if branch_id:
+        if assigned_to:
+            conditions.append("(t.assigned_to = %s AND t.assigned_id = %s)")
+            params.extend([assigned_to, branch_id])
+        else:
+            conditions.append("(t.assigned_to = 'branch' AND t.assigned_id = %s)")
+            params.append(branch_id)
+    
+    if assigned_to and assigned_id:
+        conditions.append("(t.assigned_to = %s AND t.assigned_id = %s)")
+        params.extend([assigned_to, assigned_id])
+    elif assigned_to and not assigned_id:
+        conditions.append("t.assigned_to = %s")
+        params.append(assigned_to)
+    
+    if assigned_by and assigned_by_id:
+        conditions.append("t.assigned_by = %s AND t.assigned_by_id = %s")
+        params.extend([assigned_by, assigned_by_id])
+    elif assigned_by and not assigned_by_id:
+        conditions.append("t.assigned_by = %s")
+        params.append(assigned_by)
+    
+    if is_completed is not None:
+        conditions.append("t.is_completed = %s")
+        params.append(is_completed)
+    
+    where = "".join(" AND " + condition for condition in conditions)
+    return join, where, params
+
+def tasks_query(company_id=None, branch_id=None, employee_id=None, assigned_to=None, assigned_id=None,
+                is_completed=None, assigned_by=None, assigned_by_id=None, limit=None, after=None, summary=False):
+    """Build the (query, params) get_tasks() runs for these filters."""
+    description = "LEFT(t.description, %s)" if summary else "t.description"
+    join, where, params = _task_filters(company_id, branch_id, employee_id, assigned_to, assigned_id,
+                                        is_completed, assigned_by, assigned_by_id)
+    query = f"""
+    SELECT t.id, t.title, {description}, t.assigned_to, t.assigned_id, 
+           t.assigned_by, t.assigned_by_id, t.is_completed, t.created_at
+    FROM task t{join}
+    WHERE 1=1{where}
+    """
+    if summary:
+        params.insert(0, SUMMARY_PREVIEW_LENGTH)
+
+    if after:
+        keyset_sql, keyset_params = keyset_filter(TASK_SORT_KEYS, after)
+        query += keyset_sql
+        params.extend(keyset_params)
+
+    query += " ORDER BY t.created_at DESC, t.id DESC"
+
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query, params
+
 def get_tasks(company_id=None, branch_id=None, employee_id=None, assigned_to=None, assigned_id=None, 
-             is_completed=None, assigned_by=None, assigned_by_id=None):
-    """Get tasks based on filters."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            query = """
-            SELECT t.id, t.title, t.description, t.assigned_to, t.assigned_id, 
-                   t.assigned_by, t.assigned_by_id, t.is_completed, t.created_at
-            FROM task t
-            """
-            
-            conditions = []
-            params = []
-            
-            if employee_id:
-                query += """
-                JOIN task_completion tc ON t.id = tc.task_id
-                """
-                conditions.append("tc.employee_id = %s")
-                params.append(employee_id)
-            
-            if company_id:
-                conditions.append("(t.assigned_by = 'company' AND t.assigned_by_id = %s)")
-                params.append(company_id)
-            
-            if branch_id:
-                if assigned_to:
-                    conditions.append("(t.assigned_to = %s AND t.assigned_id = %s)")
-                    params.extend([assigned_to, branch_id])
-                else:
-                    conditions.append("(t.assigned_to = 'branch' AND t.assigned_id = %s)")
-                    params.append(branch_id)
-            
-            if assigned_to and assigned_id:
-                conditions.append("(t.assigned_to = %s AND t.assigned_id = %s)")
-                params.extend([assigned_to, assigned_id])
-            elif assigned_to and not assigned_id:
-                conditions.append("t.assigned_to = %s")
-                params.append(assigned_to)
-            
-            if assigned_by and assigned_by_id:
-                conditions.append("t.assigned_by = %s AND t.assigned_by_id = %s")
-                params.extend([assigned_by, assigned_by_id])
-            elif assigned_by and not assigned_by_id:
-                conditions.append("t.assigned_by = %s")
-                params.append(assigned_by)
-            
-            if is_completed is not None:
-                conditions.append("t.is_completed = %s")
-                params.append(is_completed)
-            
-            if conditions:
-                query += " WHERE " + " AND ".join(conditions)
-            
-            query += " ORDER BY t.created_at DESC"
-            
-            cur.execute(query, params)
-            tasks = cur.fetchall()
-            cur.close()
-            
-            return tasks
-        except Exception as e:
-            st.error(f"Failed to get tasks: {e}")
-            return []
-        finally:
-            conn.close()
+             is_completed=None, assigned_by=None, assigned_by_id=None, limit=None, after=None, summary=False):
+    """Get tasks based on filters, newest first.
+    
+    Pass limit and the task_cursor() of the last row seen as after to page through results.
+    With summary=True the description column holds only its first SUMMARY_PREVIEW_LENGTH
+    characters, so list views never read or transfer the full text.
+    """
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute(*tasks_query(company_id, branch_id, employee_id, assigned_to, assigned_id,
+                                         is_completed, assigned_by, assigned_by_id, limit, after, summary))
+                tasks = cur.fetchall()
+                cur.close()
+            
+                return tasks
+            except Exception as e:
+                st.error(f"Failed to get tasks: {e}")
+                return []
     return []
 
+def task_counts_query(company_id=None, branch_id=None, employee_id=None, assigned_to=None, assigned_id=None,
+                      assigned_by=None, assigned_by_id=None):
+    """Build the (query, params) get_task_counts() runs for these filters."""
+    join, where, params = _task_filters(company_id, branch_id, employee_id, assigned_to, assigned_id,
+                                        None, assigned_by, assigned_by_id)
+    if employee_id:
+        counts = "COUNT(DISTINCT t.id), COUNT(DISTINCT t.id) FILTER (WHERE tc.is_completed)"
+    else:
+        counts = "COUNT(*), COUNT(*) FILTER (WHERE t.is_completed)"
+    query = f"""
+    SELECT {counts}
+    FROM task t{join}
+    WHERE 1=1{where}
+    """
+    return query, params
+
+def get_task_counts(company_id=None, branch_id=None, employee_id=None, assigned_to=None, assigned_id=None,
+                    assigned_by=None, assigned_by_id=None):
+    """Count the tasks get_tasks would return for these filters.
+    
+    Returns {"total", "completed", "pending"} without fetching any task rows. With employee_id,
+    completed counts the employee's own completions, matching get_task_inbox.
+    """
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute(*task_counts_query(company_id, branch_id, employee_id, assigned_to, assigned_id,
+                                               assigned_by, assigned_by_id))
+                total, completed = cur.fetchone()
+                cur.close()
+                
+                return {"total": total, "completed": completed, "pending": total - completed}
+            except Exception as e:
+                st.error(f"Failed to count tasks: {e}")
+                return {"total": 0, "completed": 0, "pending": 0}
+    return {"total": 0, "completed": 0, "pending": 0}
+
+def task_inbox_query(employee_id, is_completed=None, limit=None, after=None, summary=False):
+    """Build the (query, params) get_task_inbox() runs for these filters."""
+    description = "LEFT(t.description, %s)" if summary else "t.description"
+    params = [SUMMARY_PREVIEW_LENGTH] if summary else []
+    query = f"""
+    SELECT t.id, t.title, {description}, t.assigned_to, t.assigned_id,
+           t.assigned_by, t.assigned_by_id, t.is_completed, t.created_at,
+           BOOL_OR(COALESCE(tc.is_completed, FALSE)), MAX(tc.completed_at)
+    FROM task_completion tc
+    JOIN task t ON t.id = tc.task_id
+    WHERE tc.employee_id = %s
+    """
+    params.append(employee_id)
+
+    if after:
+        keyset_sql, keyset_params = keyset_filter(TASK_SORT_KEYS, after)
+        query += keyset_sql
+        params.extend(keyset_params)
 
+    query += " GROUP BY t.id"
+
+    if is_completed is not None:
+        query += " HAVING BOOL_OR(COALESCE(tc.is_completed, FALSE)) = %s"
+        params.append(is_completed)
+
+    query += " ORDER BY t.created_at DESC, t.id DESC"
+
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query, params
+
+def get_task_inbox(employee_id, is_completed=None, limit=None, after=None, summary=False):
+    """Get the tasks assigned to an employee with the employee's own completion status, newest first.
+    
+    Rows hold the get_tasks columns (where [7] is the task's overall status) followed by
+    [9] the employee's own is_completed and [10] their completed_at. is_completed filters on
+    the employee's own status. Paging and summary work as in get_tasks.
+    """
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute(*task_inbox_query(employee_id, is_completed, limit, after, summary))
+                tasks = cur.fetchall()
+                cur.close()
+            
+                return tasks
+            except Exception as e:
+                st.error(f"Failed to get task inbox: {e}")
+                return []
+    return []
+
+# Shared with the plan checks in utils/query_plans.py
+# A branch task counts as completed for each employee once that employee has completed it
+EMPLOYEE_TASK_STATS_SQL = """
+SELECT tc.employee_id,
+       COUNT(DISTINCT t.id) FILTER (WHERE tc.is_completed),
+       COUNT(DISTINCT t.id)
+FROM employee e
+JOIN task_completion tc ON tc.employee_id = e.id
+JOIN task t ON t.id = tc.task_id
+WHERE e.branch_id = %s
+GROUP BY tc.employee_id
+"""
+
+def get_employee_task_stats(branch_id):
+    """Get completed/total task counts for every employee in a branch in one query.
+    
+    Returns {employee_id: {"completed": int, "total": int}}; employees without tasks are omitted.
+    """
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute(EMPLOYEE_TASK_STATS_SQL, (branch_id,))
+                stats = {row[0]: {"completed": row[1], "total": row[2]} for row in cur.fetchall()}
+                cur.close()
+                
+                return stats
+            except Exception as e:
+                st.error(f"Failed to get employee task statistics: {e}")
+                return {}
+    return {}
+
+# Statements of complete_task(), shared with the plan checks in utils/query_plans.py.
+# Lock the task row so concurrent completions of the same task take turns, then record
+# this employee's completion as one upsert on task_completion_task_employee_key.
+COMPLETE_TASK_MARK_SQL = """
+    WITH task_row AS (
+        SELECT id FROM task
+        WHERE id = %(task_id)s
+        FOR NO KEY UPDATE
+    )
+    INSERT INTO task_completion (task_id, employee_id, is_completed, completed_at)
+    SELECT id, %(employee_id)s, TRUE, CURRENT_TIMESTAMP FROM task_row
+    ON CONFLICT (task_id, employee_id) DO UPDATE
+    SET is_completed = TRUE, completed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+"""
+
+# Employee tasks are done as soon as the assignee completes them; branch tasks once every
+# active employee in the branch has. Run as a separate statement while holding the lock, so
+# it sees every earlier completion.
+COMPLETE_TASK_CLOSE_SQL = """
+    UPDATE task t
+    SET is_completed = TRUE, updated_at = CURRENT_TIMESTAMP
+    WHERE t.id = %(task_id)s AND t.is_completed = FALSE
+      AND (
+          t.assigned_to = 'employee'
+          OR (
+              EXISTS (
+                  SELECT 1 FROM employee e
+                  WHERE e.branch_id = t.assigned_id AND e.is_active = TRUE
+              )
+              AND NOT EXISTS (
+                  SELECT 1 FROM employee e
+                  WHERE e.branch_id = t.assigned_id AND e.is_active = TRUE
+                    AND NOT EXISTS (
+                        SELECT 1 FROM task_completion tc
+                        WHERE tc.task_id = t.id AND tc.employee_id = e.id
+                          AND tc.is_completed = TRUE
+                    )
+              )
+          )
+      )
+"""
 
 def complete_task(task_id, employee_id):
     """Mark a task as completed by an employee."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            
-            # First check if the task completion record exists
-            cur.execute("""
-            SELECT id FROM task_completion
-            WHERE task_id = %s AND employee_id = %s
-            """, (task_id, employee_id))
-            
-            completion_record = cur.fetchone()
+    owns_transaction = not _transaction_open()
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                params = {"task_id": task_id, "employee_id": employee_id}
+            
+                cur.execute(COMPLETE_TASK_MARK_SQL, params)
+                cur.execute(COMPLETE_TASK_CLOSE_SQL, params)
+            
+                if owns_transaction:
+                    conn.commit()
+                cur.close()
+                return True
+            except Exception as e:
+                if not owns_transaction:
+                    raise
+                conn.rollback()
+                st.error(f"Failed to complete task: {e}")
+                return False
+    return False
+
+def manager_complete_task(task_id, branch_id):
+    """Manager marks a task as completed for the whole branch."""
+    owns_transaction = not _transaction_open()
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
             
-            if completion_record:
-                # Update existing task completion record
+                # Update task completion for all employees in branch
                 cur.execute("""
                 UPDATE task_completion
                 SET is_completed = TRUE, completed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
-                WHERE task_id = %s AND employee_id = %s
-                """, (task_id, employee_id))
-            else:
-                # Create new task completion record
-                cur.execute("""
-                INSERT INTO task_completion (task_id, employee_id, is_completed, completed_at)
-                VALUES (%s, %s, TRUE, CURRENT_TIMESTAMP)
-                """, (task_id, employee_id))
-            
-            # Get the task details to determine if it's branch or employee task
-            cur.execute("""
-            SELECT assigned_to, assigned_id FROM task
-            WHERE id = %s
-            """, (task_id,))
-            
-            task_info = cur.fetchone()
-            assigned_to = task_info[0]
-            assigned_id = task_info[1]
+                WHERE task_id = %s AND employee_id IN (
+                    SELECT id FROM employee WHERE branch_id = %s
+                )
+                """, (task_id, branch_id))
             
-            if assigned_to == 'employee':
-                # For individual employee task, directly mark as completed
+                # Mark the task as completed
                 cur.execute("""
                 UPDATE task
                 SET is_completed = TRUE, updated_at = CURRENT_TIMESTAMP
                 WHERE id = %s
                 """, (task_id,))
-            else:  # branch task
-                # For branch task, check if all active employees have completed it
-                
-                # Get all active employees in the branch
-                cur.execute("""
-                SELECT id FROM employee 
-                WHERE branch_id = %s AND is_active = TRUE
-                """, (assigned_id,))
-                
-                active_employees = cur.fetchall()
-                total_employees = len(active_employees)
-                
-                if total_employees > 0:
-                    # Check how many of these employees have completed the task
-                    employee_ids = [emp[0] for emp in active_employees]
-                    placeholders = ', '.join(['%s'] * len(employee_ids))
-                    query = f"""
-                    SELECT COUNT(*) FROM task_completion
-                    WHERE task_id = %s AND employee_id IN ({placeholders}) AND is_completed = TRUE
-                    """
-                    
-                    cur.execute(query, [task_id] + employee_ids)
-                    completed_count = cur.fetchone()[0]
-                    
-                    # Mark task as completed if all active employees completed it
-                    if completed_count >= total_employees:
-                        cur.execute("""
-                        UPDATE task
-                        SET is_completed = TRUE, updated_at = CURRENT_TIMESTAMP
-                        WHERE id = %s
-                        """, (task_id,))
             
-            conn.commit()
-            cur.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            st.error(f"Failed to complete task: {e}")
-            return False
-        finally:
-            conn.close()
+                if owns_transaction:
+                    conn.commit()
+                cur.close()
+                return True
+            except Exception as e:
+                if not owns_transaction:
+                    raise
+                conn.rollback()
+                st.error(f"Failed to complete task: {e}")
+                return False
     return False
 
-def manager_complete_task(task_id, branch_id):
-    """Manager marks a task as completed for the whole branch."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            
-            # Update task completion for all employees in branch
-            cur.execute("""
-            UPDATE task_completion
-            SET is_completed = TRUE, completed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
-            WHERE task_id = %s AND employee_id IN (
-                SELECT id FROM employee WHERE branch_id = %s
-            )
-            """, (task_id, branch_id))
-            
-            # Mark the task as completed
-            cur.execute("""
-            UPDATE task
-            SET is_completed = TRUE, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-            """, (task_id,))
-            
-            conn.commit()
-            cur.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            st.error(f"Failed to complete task: {e}")
-            return False
-        finally:
-            conn.close()
-    return False
+# Shared with the plan checks in utils/query_plans.py
+TASK_PROGRESS_SQL = """
+SELECT t.id, assignee.employee_id, COALESCE(BOOL_OR(tc.is_completed), FALSE)
+FROM task t
+CROSS JOIN LATERAL (
+    SELECT e.id FROM employee e
+    WHERE t.assigned_to = 'branch' AND e.branch_id = t.assigned_id AND e.is_active = TRUE
+    UNION ALL
+    SELECT t.assigned_id WHERE t.assigned_to = 'employee'
+) AS assignee(employee_id)
+LEFT JOIN task_completion tc ON tc.task_id = t.id AND tc.employee_id = assignee.employee_id
+WHERE t.id = ANY(%s)
+GROUP BY t.id, assignee.employee_id
+"""
+
+def get_task_progress(task_ids):
+    """Get completion progress for several tasks in one query.
+    
+    Returns {task_id: {"completed": int, "total": int, "employees": {employee_id: is_completed}}}.
+    Branch tasks count every active employee in the branch, employee tasks their assignee.
+    """
+    progress = {task_id: {"completed": 0, "total": 0, "employees": {}} for task_id in task_ids}
+    if not progress:
+        return progress
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute(TASK_PROGRESS_SQL, (list(progress),))
+                
+                for task_id, employee_id, employee_completed in cur.fetchall():
+                    task_progress = progress[task_id]
+                    task_progress["employees"][employee_id] = employee_completed
+                    task_progress["total"] += 1
+                    task_progress["completed"] += 1 if employee_completed else 0
+                cur.close()
+            except Exception as e:
+                st.error(f"Failed to get task progress: {e}")
+    return progress
 
 # Report Functions
 def submit_report(employee_id, report_date, content):
-    """Submit a daily report."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            # Check if a report already exists for this date
-            cur.execute("""
-            SELECT id FROM report
-            WHERE employee_id = %s AND report_date = %s
-            """, (employee_id, report_date))
-            
-            existing_report = cur.fetchone()
-            
-            if existing_report:
-                # Update existing report
-                cur.execute("""
-                UPDATE report
-                SET content = %s, updated_at = CURRENT_TIMESTAMP
-                WHERE id = %s
-                """, (content, existing_report[0]))
-                report_id = existing_report[0]
-            else:
-                # Create new report
-                cur.execute("""
-                INSERT INTO report (employee_id, report_date, content)
-                VALUES (%s, %s, %s)
-                RETURNING id
-                """, (employee_id, report_date, content))
-                report_id = cur.fetchone()[0]
-            
-            conn.commit()
-            cur.close()
-            return report_id
-        except Exception as e:
-            conn.rollback()
-            st.error(f"Failed to submit report: {e}")
-            return None
-        finally:
-            conn.close()
-    return None
-
-def get_reports(employee_id=None, branch_id=None, company_id=None, start_date=None, end_date=None):
-    """Get reports based on filters."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            query = """
-            SELECT r.id, r.employee_id, e.employee_name, e.role, r.report_date, r.content, r.created_at, b.branch_name
-            FROM report r
-            JOIN employee e ON r.employee_id = e.id
-            JOIN branch b ON e.branch_id = b.id
-            WHERE 1=1
-            """
-            params = []
-            
-            if employee_id:
-                query += " AND r.employee_id = %s"
-                params.append(employee_id)
-            
-            if branch_id:
-                query += " AND e.branch_id = %s"
-                params.append(branch_id)
-            
-            if company_id:
-                query += " AND e.company_id = %s"
-                params.append(company_id)
-            
-            if start_date:
-                query += " AND r.report_date >= %s"
-                params.append(start_date)
-            
-            if end_date:
-                query += " AND r.report_date <= %s"
-                params.append(end_date)
-            
-            query += " ORDER BY r.report_date DESC, e.role"
-            
-            cur.execute(query, params)
-            reports = cur.fetchall()
-            cur.close()
+    """Submit a daily report."""
+    owns_transaction = not _transaction_open()
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                # Insert or overwrite the report for this date in a single round trip
+                cur.execute("""
+                INSERT INTO report (employee_id, report_date, content)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (employee_id, report_date)
+                DO UPDATE SET content = EXCLUDED.content, updated_at = CURRENT_TIMESTAMP
+                RETURNING id
+                """, (employee_id, report_date, content))
+                report_id = cur.fetchone()[0]
             
-            return reports
-        except Exception as e:
-            st.error(f"Failed to get reports: {e}")
-            return []
-        finally:
-            conn.close()
+                if owns_transaction:
+                    conn.commit()
+                cur.close()
+                return report_id
+            except Exception as e:
+                if not owns_transaction:
+                    raise
+                conn.rollback()
+                st.error(f"Failed to submit report: {e}")
+                return None
+    return None
+
+REPORT_SORT_KEYS = [("r.report_date", True), ("e.role", False), ("r.id", True)]
+
+def report_cursor(report):
+    """Keyset cursor for the page of reports ending with this row."""
+    return (report[4], report[3], report[0])
+
+def _report_filters(employee_id=None, branch_id=None, company_id=None, start_date=None, end_date=None):
+    """Build the WHERE fragment and params shared by the report list and count queries."""
+    conditions = []
+    params = []
+    
+    if employee_id:
+        conditions.append("r.employee_id = %s")
+        params.append(employee_id)
+    
+    if branch_id:
+        conditions.append("e.branch_id = %s")
+        params.append(branch_id)
+    
+    if company_id:
+        conditions.append("e.company_id = %s")
+        params.append(company_id)
+    
+    if start_date:
+        conditions.append("r.report_date >= %s")
+        params.append(start_date)
+    
+    if end_date:
+        conditions.append("r.report_date <= %s")
+        params.append(end_date)
+    
+    where = "".join(" AND " + condition for condition in conditions)
+    return where, params
+
+def reports_query(employee_id=None, branch_id=None, company_id=None, start_date=None, end_date=None, limit=None,
+                  after=None, summary=False):
+    """Build the (query, params) get_reports() runs for these filters."""
+    content = "LEFT(r.content, %s)" if summary else "r.content"
+    where, params = _report_filters(employee_id, branch_id, company_id, start_date, end_date)
+    query = f"""
+    SELECT r.id, r.employee_id, e.employee_name, e.role, r.report_date, {content}, r.created_at, b.branch_name
+    FROM report r
+    JOIN employee e ON r.employee_id = e.id
+    JOIN branch b ON e.branch_id = b.id
+    WHERE 1=1{where}
+    """
+    if summary:
+        params.insert(0, SUMMARY_PREVIEW_LENGTH)
+
+    if after:
+        keyset_sql, keyset_params = keyset_filter(REPORT_SORT_KEYS, after)
+        query += keyset_sql
+        params.extend(keyset_params)
+
+    query += " ORDER BY r.report_date DESC, e.role, r.id DESC"
+
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query, params
+
+def get_reports(employee_id=None, branch_id=None, company_id=None, start_date=None, end_date=None, limit=None, after=None,
+                summary=False):
+    """Get reports based on filters, newest first.
+    
+    Pass limit and the report_cursor() of the last row seen as after to page through results.
+    With summary=True the content column holds only its first SUMMARY_PREVIEW_LENGTH characters.
+    """
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute(*reports_query(employee_id, branch_id, company_id, start_date, end_date, limit, after,
+                                           summary))
+                reports = cur.fetchall()
+                cur.close()
+            
+                return reports
+            except Exception as e:
+                st.error(f"Failed to get reports: {e}")
+                return []
     return []
 
+def report_count_query(employee_id=None, branch_id=None, company_id=None, start_date=None, end_date=None):
+    """Build the (query, params) get_report_count() runs for these filters."""
+    where, params = _report_filters(employee_id, branch_id, company_id, start_date, end_date)
+    query = f"""
+    SELECT COUNT(*)
+    FROM report r
+    JOIN employee e ON r.employee_id = e.id
+    WHERE 1=1{where}
+    """
+    return query, params
+
+def get_report_count(employee_id=None, branch_id=None, company_id=None, start_date=None, end_date=None):
+    """Count the reports get_reports would return for these filters."""
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute(*report_count_query(employee_id, branch_id, company_id, start_date, end_date))
+                count = cur.fetchone()[0]
+                cur.close()
+                
+                return count
+            except Exception as e:
+                st.error(f"Failed to count reports: {e}")
+                return 0
+    return 0
+
 # Message Functions
-def send_message(sender_type, sender_id, receiver_type, receiver_id, message_text, attachment_link=None):
+def send_message(sender_type, sender_id, receiver_type, receiver_id, message_text, attachment_link=None, conn=None):
     """Send a message."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("""
-            INSERT INTO message (sender_type, sender_id, receiver_type, receiver_id, message_text, attachment_link)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            RETURNING id
-            """, (sender_type, sender_id, receiver_type, receiver_id, message_text, attachment_link))
-            
-            message_id = cur.fetchone()[0]
-            conn.commit()
-            cur.close()
-            return message_id
-        except Exception as e:
-            conn.rollback()
-            st.error(f"Failed to send message: {e}")
-            return None
-        finally:
-            conn.close()
+    owns_transaction = conn is None and not _transaction_open()
+    with pooled_connection(conn) as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                INSERT INTO message (sender_type, sender_id, receiver_type, receiver_id, message_text, attachment_link)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                RETURNING id
+                """, (sender_type, sender_id, receiver_type, receiver_id, message_text, attachment_link))
+            
+                message_id = cur.fetchone()[0]
+                if owns_transaction:
+                    conn.commit()
+                cur.close()
+                return message_id
+            except Exception as e:
+                if not owns_transaction:
+                    raise
+                conn.rollback()
+                st.error(f"Failed to send message: {e}")
+                return None
     return None
 
-def get_messages(receiver_type=None, receiver_id=None, sender_type=None, sender_id=None):
-    """Get messages based on filters."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            query = """
-            SELECT id, sender_type, sender_id, receiver_type, receiver_id, message_text, attachment_link, is_deleted, created_at
-            FROM message
-            WHERE is_deleted = FALSE
-            """
-            params = []
-            
-            if receiver_type and receiver_id:
-                query += " AND receiver_type = %s AND receiver_id = %s"
-                params.extend([receiver_type, receiver_id])
-            
-            if sender_type and sender_id:
-                query += " AND sender_type = %s AND sender_id = %s"
-                params.extend([sender_type, sender_id])
-            
-            query += " ORDER BY created_at DESC"
-            
-            cur.execute(query, params)
-            messages = cur.fetchall()
-            cur.close()
-            
-            return messages
-        except Exception as e:
-            st.error(f"Failed to get messages: {e}")
-            return []
-        finally:
-            conn.close()
+def send_broadcast_message(sender_type, sender_id, receiver_type, receiver_id, employee_ids, message_text, attachment_link=None, conn=None):
+    """Send one message to many employees, e.g. everyone in a branch.
+    
+    Stores a single message row addressed to receiver_type/receiver_id (such as 'branch', branch_id)
+    and one message_recipient row per employee, in a single statement.
+    """
+    employee_ids = list(employee_ids)
+    if not employee_ids:
+        return None
+    owns_transaction = conn is None and not _transaction_open()
+    with pooled_connection(conn) as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                WITH new_message AS (
+                    INSERT INTO message (sender_type, sender_id, receiver_type, receiver_id, message_text, attachment_link)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    RETURNING id
+                ), recipients AS (
+                    INSERT INTO message_recipient (message_id, employee_id)
+                    SELECT new_message.id, employee_id
+                    FROM new_message, UNNEST(%s::INTEGER[]) AS employee_id
+                )
+                SELECT id FROM new_message
+                """, (sender_type, sender_id, receiver_type, receiver_id, message_text, attachment_link, employee_ids))
+                
+                message_id = cur.fetchone()[0]
+                if owns_transaction:
+                    conn.commit()
+                cur.close()
+                return message_id
+            except Exception as e:
+                if not owns_transaction:
+                    raise
+                conn.rollback()
+                st.error(f"Failed to send message: {e}")
+                return None
+    return None
+
+MESSAGE_SORT_KEYS = [("m.created_at", True), ("m.id", True)]
+
+def message_cursor(message):
+    """Keyset cursor for the page of messages ending with this row."""
+    return (message[8], message[0])
+
+MESSAGE_COLUMNS = """m.id, m.sender_type, m.sender_id, m.receiver_type, m.receiver_id,
+       m.message_text, m.attachment_link, m.is_deleted, m.created_at"""
+
+def messages_query(receiver_type=None, receiver_id=None, sender_type=None, sender_id=None, include_broadcasts=True,
+                   limit=None, after=None):
+    """Build the (query, params) get_messages() runs for these filters."""
+    # Filters shared by direct messages and broadcasts
+    sender_filter = ""
+    sender_params = []
+    if sender_type and sender_id:
+        sender_filter = " AND m.sender_type = %s AND m.sender_id = %s"
+        sender_params = [sender_type, sender_id]
+    elif sender_type:
+        sender_filter = " AND m.sender_type = %s"
+        sender_params = [sender_type]
+
+    if after:
+        keyset_sql, keyset_params = keyset_filter(MESSAGE_SORT_KEYS, after)
+        sender_filter += keyset_sql
+        sender_params.extend(keyset_params)
+
+    query = f"""
+    SELECT {MESSAGE_COLUMNS}
+    FROM message m
+    WHERE m.is_deleted = FALSE
+    """
+    params = []
+
+    if receiver_type and receiver_id:
+        query += " AND m.receiver_type = %s AND m.receiver_id = %s"
+        params.extend([receiver_type, receiver_id])
+    elif receiver_type:
+        query += " AND m.receiver_type = %s"
+        params.append(receiver_type)
+
+    query += sender_filter
+    params.extend(sender_params)
+
+    if receiver_type == "employee" and receiver_id and include_broadcasts:
+        query += f"""
+        UNION ALL
+        SELECT {MESSAGE_COLUMNS}
+        FROM message_recipient mr
+        JOIN message m ON m.id = mr.message_id
+        WHERE mr.employee_id = %s AND m.is_deleted = FALSE
+        """ + sender_filter
+        params.append(receiver_id)
+        params.extend(sender_params)
+
+    query += " ORDER BY created_at DESC, id DESC"
+
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query, params
+
+def get_messages(receiver_type=None, receiver_id=None, sender_type=None, sender_id=None, include_broadcasts=True,
+                 limit=None, after=None):
+    """Get messages based on filters, newest first.
+    
+    A receiver_type without receiver_id matches every receiver of that type (e.g. all messages a
+    sender sent to any branch). Messages for an employee include the broadcasts they received
+    unless include_broadcasts is False. Pass limit and the message_cursor() of the last row seen
+    as after to page through results.
+    """
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute(*messages_query(receiver_type, receiver_id, sender_type, sender_id, include_broadcasts,
+                                            limit, after))
+                messages = cur.fetchall()
+                cur.close()
+                
+                return messages
+            except Exception as e:
+                st.error(f"Failed to get messages: {e}")
+                return []
+    return []
+
+def conversation_query(party_type, party_id, other_type=None, other_id=None, limit=None, after=None):
+    """Build the (query, params) get_conversation() runs for these filters."""
+    def direction(own_side, other_side):
+        # One side of the conversation: messages where the party is on own_side
+        query = f"""
+        SELECT {MESSAGE_COLUMNS}
+        FROM message m
+        WHERE m.is_deleted = FALSE AND m.{own_side}_type = %s AND m.{own_side}_id = %s
+        """
+        params = [party_type, party_id]
+        if other_type:
+            query += f" AND m.{other_side}_type = %s"
+            params.append(other_type)
+        if other_type and other_id:
+            query += f" AND m.{other_side}_id = %s"
+            params.append(other_id)
+        if after:
+            keyset, keyset_params = keyset_filter(MESSAGE_SORT_KEYS, after)
+            query += keyset
+            params.extend(keyset_params)
+        query += " ORDER BY m.created_at DESC, m.id DESC"
+        if limit:
+            query += " LIMIT %s"
+            params.append(limit)
+        return f"({query})", params
+
+    sent_query, sent_params = direction("sender", "receiver")
+    received_query, received_params = direction("receiver", "sender")
+    query = f"{sent_query} UNION ALL {received_query} ORDER BY created_at DESC, id DESC"
+    params = sent_params + received_params
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query, params
+
+def get_conversation(party_type, party_id, other_type=None, other_id=None, limit=None, after=None):
+    """Get messages a party sent or received, interleaved newest first.
+    
+    Narrow to the thread with another party via other_type (and optionally other_id).
+    Pass limit and the message_cursor() of the last message seen as after to fetch the
+    next (older) page.
+    """
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute(*conversation_query(party_type, party_id, other_type, other_id, limit, after))
+                messages = cur.fetchall()
+                cur.close()
+                
+                return messages
+            except Exception as e:
+                st.error(f"Failed to get conversation: {e}")
+                return []
     return []
 
 def delete_message(message_id, sender_type, sender_id):
     """Delete a message (soft delete)."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("""
-            UPDATE message
-            SET is_deleted = TRUE, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s AND sender_type = %s AND sender_id = %s
-            """, (message_id, sender_type, sender_id))
-            
-            conn.commit()
-            cur.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            st.error(f"Failed to delete message: {e}")
-            return False
-        finally:
-            conn.close()
+    owns_transaction = not _transaction_open()
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                UPDATE message
+                SET is_deleted = TRUE, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s AND sender_type = %s AND sender_id = %s
+                """, (message_id, sender_type, sender_id))
+            
+                if owns_transaction:
+                    conn.commit()
+                cur.close()
+                return True
+            except Exception as e:
+                if not owns_transaction:
+                    raise
+                conn.rollback()
+                st.error(f"Failed to delete message: {e}")
+                return False
     return False
 
 # Profile Functions
 def update_admin_profile(admin_id, profile_name, profile_pic):
     """Update admin profile."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("""
-            UPDATE admin
-            SET profile_name = %s, profile_pic = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-            """, (profile_name, profile_pic, admin_id))
-            
-            conn.commit()
-            cur.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            st.error(f"Failed to update admin profile: {e}")
-            return False
-        finally:
-            conn.close()
+    owns_transaction = not _transaction_open()
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                UPDATE admin
+                SET profile_name = %s, profile_pic = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+                """, (profile_name, profile_pic, admin_id))
+            
+                if owns_transaction:
+                    conn.commit()
+                cur.close()
+                return True
+            except Exception as e:
+                if not owns_transaction:
+                    raise
+                conn.rollback()
+                st.error(f"Failed to update admin profile: {e}")
+                return False
     return False
 
 def update_company_profile(company_id, company_name, profile_pic):
     """Update company profile."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("""
-            UPDATE company
-            SET company_name = %s, profile_pic = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-            """, (company_name, profile_pic, company_id))
-            
-            conn.commit()
-            cur.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            st.error(f"Failed to update company profile: {e}")
-            return False
-        finally:
-            conn.close()
+    owns_transaction = not _transaction_open()
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                UPDATE company
+                SET company_name = %s, profile_pic = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+                """, (company_name, profile_pic, company_id))
+            
+                if owns_transaction:
+                    conn.commit()
+                cur.close()
+                return True
+            except Exception as e:
+                if not owns_transaction:
+                    raise
+                conn.rollback()
+                st.error(f"Failed to update company profile: {e}")
+                return False
     return False
 
 def update_employee_profile(employee_id, employee_name, profile_pic):
     """Update employee profile."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("""
-            UPDATE employee
-            SET employee_name = %s, profile_pic = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-            """, (employee_name, profile_pic, employee_id))
-            
-            conn.commit()
-            cur.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            st.error(f"Failed to update employee profile: {e}")
-            return False
-        finally:
-            conn.close()
+    owns_transaction = not _transaction_open()
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                UPDATE employee
+                SET employee_name = %s, profile_pic = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+                RETURNING company_id, branch_id
+                """, (employee_name, profile_pic, employee_id))
+                employee = cur.fetchone()
+            
+                if owns_transaction:
+                    conn.commit()
+                cur.close()
+                if employee:
+                    _invalidate_tenant(conn, *employee)
+                return True
+            except Exception as e:
+                if not owns_transaction:
+                    raise
+                conn.rollback()
+                st.error(f"Failed to update employee profile: {e}")
+                return False
     return False
 
 # Authentication Functions
 def verify_admin(username, password):
     """Verify admin credentials."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("""
-            SELECT id, profile_name, profile_pic
-            FROM admin
-            WHERE username = %s
-            """, (username,))
-            
-            admin = cur.fetchone()
-            cur.close()
-            
-            if admin and password == st.secrets["admin_password"]:
-                return {
-                    "id": admin[0],
-                    "username": username,
-                    "profile_name": admin[1],
-                    "profile_pic": admin[2],
-                    "role": "admin"
-                }
-            return None
-        except Exception as e:
-            st.error(f"Failed to verify admin: {e}")
-            return None
-        finally:
-            conn.close()
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                SELECT id, profile_name, profile_pic
+                FROM admin
+                WHERE username = %s
+                """, (username,))
+            
+                admin = cur.fetchone()
+                cur.close()
+            
+                if admin and password == st.secrets["admin_password"]:
+                    return {
+                        "id": admin[0],
+                        "username": username,
+                        "profile_name": admin[1],
+                        "profile_pic": admin[2],
+                        "role": "admin"
+                    }
+                return None
+            except Exception as e:
+                st.error(f"Failed to verify admin: {e}")
+                return None
     return None
 
 def verify_company(username, password):
     """Verify company credentials."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("""
-            SELECT id, company_name, password_hash, profile_pic, is_active
-            FROM company
-            WHERE username = %s
-            """, (username,))
-            
-            company = cur.fetchone()
-            cur.close()
-            
-            if company and company[4] and bcrypt.checkpw(password.encode('utf-8'), company[2].encode('utf-8')):
-                return {
-                    "id": company[0],
-                    "username": username,
-                    "name": company[1],
-                    "profile_pic": company[3],
-                    "role": "company",
-                    "company_id": company[0]  # Add this line to set company_id to the company's own ID
-                }
-            return None
-        except Exception as e:
-            st.error(f"Failed to verify company: {e}")
-            return None
-        finally:
-            conn.close()
-    return None
+    company = None
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                SELECT id, company_name, password_hash, profile_pic, is_active
+                FROM company
+                WHERE username = %s
+                """, (username,))
+            
+                company = cur.fetchone()
+                cur.close()
+            except Exception as e:
+                st.error(f"Failed to verify company: {e}")
+                return None
+    
+    if not company or not company[4]:
+        return None
+    # Checked once the connection is free, so none is held while bcrypt runs
+    with connection_released():
+        matches, rehash = check_password(password, company[2])
+    if not matches:
+        return None
+    if rehash:
+        _rehash_password("company", company[0], company[2], password)
+    return {
+        "id": company[0],
+        "username": username,
+        "name": company[1],
+        "profile_pic": company[3],
+        "role": "company",
+        "company_id": company[0]  # Add this line to set company_id to the company's own ID
+    }
 
 def verify_employee(username, password):
     """Verify employee credentials."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("""
-            SELECT e.id, e.employee_name, e.password_hash, e.profile_pic, e.role, e.is_active, 
-                   e.company_id, e.branch_id, c.is_active as company_active, b.is_active as branch_active
-            FROM employee e
-            JOIN company c ON e.company_id = c.id
-            JOIN branch b ON e.branch_id = b.id
-            WHERE e.username = %s
-            """, (username,))
-            
-            employee = cur.fetchone()
-            cur.close()
-            
-            if (employee and employee[5] and employee[8] and employee[9] and 
-                bcrypt.checkpw(password.encode('utf-8'), employee[2].encode('utf-8'))):
-                return {
-                    "id": employee[0],
-                    "username": username,
-                    "name": employee[1],
-                    "profile_pic": employee[3],
-                    "role": employee[4],
-                    "company_id": employee[6],
-                    "branch_id": employee[7]
-                }
-            return None
-        except Exception as e:
-            st.error(f"Failed to verify employee: {e}")
-            return None
-        finally:
-            conn.close()
-    return None
+    employee = None
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                SELECT e.id, e.employee_name, e.password_hash, e.profile_pic, e.role, e.is_active, 
+                       e.company_id, e.branch_id, c.is_active as company_active, b.is_active as branch_active
+                FROM employee e
+                JOIN company c ON e.company_id = c.id
+                JOIN branch b ON e.branch_id = b.id
+                WHERE e.username = %s
+                """, (username,))
+            
+                employee = cur.fetchone()
+                cur.close()
+            except Exception as e:
+                st.error(f"Failed to verify employee: {e}")
+                return None
+    
+    if not (employee and employee[5] and employee[8] and employee[9]):
+        return None
+    # Checked once the connection is free, so none is held while bcrypt runs
+    with connection_released():
+        matches, rehash = check_password(password, employee[2])
+    if not matches:
+        return None
+    if rehash:
+        _rehash_password("employee", employee[0], employee[2], password)
+    return {
+        "id": employee[0],
+        "username": username,
+        "name": employee[1],
+        "profile_pic": employee[3],
+        "role": employee[4],
+        "company_id": employee[6],
+        "branch_id": employee[7]
+    }
+
+def get_session_user(role, user_id):
+    """Load an admin, company or employee by id to restore a remembered session.
+    
+    Returns (user, credential) for an active account, where credential is the stored
+    password hash (the admin password for admins) so tokens can be tied to it, or None if
+    there is no such active account. Raises ConnectionError if the lookup itself failed, so
+    a database outage is never mistaken for a deleted or deactivated account.
+    """
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                if role == "admin":
+                    cur.execute("""
+                    SELECT id, username, profile_name, profile_pic
+                    FROM admin
+                    WHERE id = %s
+                    """, (user_id,))
+                    admin = cur.fetchone()
+                    cur.close()
+                    if not admin:
+                        return None
+                    return {
+                        "id": admin[0],
+                        "username": admin[1],
+                        "profile_name": admin[2],
+                        "profile_pic": admin[3],
+                        "role": "admin"
+                    }, st.secrets["admin_password"]
+                elif role == "company":
+                    cur.execute("""
+                    SELECT id, username, company_name, profile_pic, password_hash
+                    FROM company
+                    WHERE id = %s AND is_active = TRUE
+                    """, (user_id,))
+                    company = cur.fetchone()
+                    cur.close()
+                    if not company:
+                        return None
+                    return {
+                        "id": company[0],
+                        "username": company[1],
+                        "name": company[2],
+                        "profile_pic": company[3],
+                        "role": "company",
+                        "company_id": company[0]
+                    }, company[4]
+                else:
+                    cur.execute("""
+                    SELECT e.id, e.username, e.employee_name, e.profile_pic, e.role,
+                           e.company_id, e.branch_id, e.password_hash
+                    FROM employee e
+                    JOIN company c ON e.company_id = c.id
+                    JOIN branch b ON e.branch_id = b.id
+                    WHERE e.id = %s AND e.is_active = TRUE AND c.is_active = TRUE AND b.is_active = TRUE
+                    """, (user_id,))
+                    employee = cur.fetchone()
+                    cur.close()
+                    if not employee:
+                        return None
+                    return {
+                        "id": employee[0],
+                        "username": employee[1],
+                        "name": employee[2],
+                        "profile_pic": employee[3],
+                        "role": employee[4],
+                        "company_id": employee[5],
+                        "branch_id": employee[6]
+                    }, employee[7]
+            except Exception as e:
+                raise ConnectionError(f"Failed to restore session: {e}") from e
+    raise ConnectionError("Database connection failed")
+
+def _rehash_password(table, user_id, old_hash, password):
+    """Replace a hash made with an outdated work factor after a successful login.
+    
+    Only updates the row if its hash is unchanged, so a password changed meanwhile is kept;
+    a failure here never blocks the login.
+    """
+    with connection_released():
+        password_hash = hash_password(password)
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute(f"""
+                UPDATE {table}
+                SET password_hash = %s
+                WHERE id = %s AND password_hash = %s
+                """, (password_hash, user_id, old_hash))
+                conn.commit()
+                cur.close()
+            except Exception:
+                conn.rollback()
 
 # Password Update Functions
 def update_company_password(company_id, current_password, new_password):
     """Update company password."""
-    conn = get_connection()
-    if conn:
+    with pooled_connection() as conn:
+        if not conn:
+            return False, "Database connection failed"
         try:
             cur = conn.cursor()
-            
-            # Verify current password
             cur.execute("""
             SELECT password_hash FROM company
             WHERE id = %s
             """, (company_id,))
-            
             result = cur.fetchone()
-            if not result or not bcrypt.checkpw(current_password.encode('utf-8'), result[0].encode('utf-8')):
-                return False, "Current password is incorrect"
-            
-            # Hash the new password
-            password_hash = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-            
-            # Update password
-            cur.execute("""
-            UPDATE company
-            SET password_hash = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-            """, (password_hash, company_id))
-            
-            conn.commit()
             cur.close()
-            return True, "Password updated successfully"
         except Exception as e:
-            conn.rollback()
             return False, f"Failed to update password: {e}"
-        finally:
-            conn.close()
+    
+    # Verify the current password and hash the new one with no connection held
+    with connection_released():
+        if not result or not check_password(current_password, result[0])[0]:
+            return False, "Current password is incorrect"
+        password_hash = hash_password(new_password)
+    
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+            
+                # Update password, unless it was changed since it was verified
+                cur.execute("""
+                UPDATE company
+                SET password_hash = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s AND password_hash = %s
+                """, (password_hash, company_id, result[0]))
+                updated = cur.rowcount
+            
+                conn.commit()
+                cur.close()
+                if not updated:
+                    return False, "Current password is incorrect"
+                return True, "Password updated successfully"
+            except Exception as e:
+                conn.rollback()
+                return False, f"Failed to update password: {e}"
     return False, "Database connection failed"
 
 def update_employee_password(employee_id, current_password, new_password):
     """Update employee password."""
-    conn = get_connection()
-    if conn:
+    with pooled_connection() as conn:
+        if not conn:
+            return False, "Database connection failed"
         try:
             cur = conn.cursor()
-            
-            # Verify current password
             cur.execute("""
             SELECT password_hash FROM employee
             WHERE id = %s
             """, (employee_id,))
-            
             result = cur.fetchone()
-            if not result or not bcrypt.checkpw(current_password.encode('utf-8'), result[0].encode('utf-8')):
-                return False, "Current password is incorrect"
-            
-            # Hash the new password
-            password_hash = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-            
-            # Update password
-            cur.execute("""
-            UPDATE employee
-            SET password_hash = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-            """, (password_hash, employee_id))
-            
-            conn.commit()
             cur.close()
-            return True, "Password updated successfully"
         except Exception as e:
-            conn.rollback()
             return False, f"Failed to update password: {e}"
-        finally:
-            conn.close()
+    
+    # Verify the current password and hash the new one with no connection held
+    with connection_released():
+        if not result or not check_password(current_password, result[0])[0]:
+            return False, "Current password is incorrect"
+        password_hash = hash_password(new_password)
+    
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+            
+                # Update password, unless it was changed since it was verified
+                cur.execute("""
+                UPDATE employee
+                SET password_hash = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s AND password_hash = %s
+                """, (password_hash, employee_id, result[0]))
+                updated = cur.rowcount
+            
+                conn.commit()
+                cur.close()
+                if not updated:
+                    return False, "Current password is incorrect"
+                return True, "Password updated successfully"
+            except Exception as e:
+                conn.rollback()
+                return False, f"Failed to update password: {e}"
     return False, "Database connection failed"
 
 
-# Add these functions to the existing utils/db.py file
+# Session Store Functions (backing utils/sessions when [session] store = "postgres")
+def load_user_session(session_id):
+    """Get the data of an unexpired server-side session, or None."""
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                SELECT data FROM user_session
+                WHERE id = %s AND expires_at > CURRENT_TIMESTAMP
+                """, (session_id,))
+                result = cur.fetchone()
+                cur.close()
+                return result[0] if result else None
+            except Exception as e:
+                st.error(f"Failed to load session: {e}")
+                return None
+    return None
 
-def update_company_password(company_id, current_password, new_password):
-    """Update company password."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            
-            # Verify current password
-            cur.execute("""
-            SELECT password_hash FROM company
-            WHERE id = %s
-            """, (company_id,))
-            
-            result = cur.fetchone()
-            if not result or not bcrypt.checkpw(current_password.encode('utf-8'), result[0].encode('utf-8')):
-                return False, "Current password is incorrect"
-            
-            # Hash the new password
-            password_hash = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-            
-            # Update password
-            cur.execute("""
-            UPDATE company
-            SET password_hash = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-            """, (password_hash, company_id))
-            
-            conn.commit()
-            cur.close()
-            return True, "Password updated successfully"
-        except Exception as e:
-            conn.rollback()
-            return False, f"Failed to update password: {e}"
-        finally:
-            conn.close()
-    return False, "Database connection failed"
+def save_user_session(session_id, data, ttl):
+    """Create or replace a server-side session, expiring ttl seconds from now."""
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                INSERT INTO user_session (id, data, expires_at)
+                VALUES (%s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 second')
+                ON CONFLICT (id) DO UPDATE
+                SET data = EXCLUDED.data, expires_at = EXCLUDED.expires_at, updated_at = CURRENT_TIMESTAMP
+                """, (session_id, json.dumps(data), ttl))
+                conn.commit()
+                cur.close()
+                return True
+            except Exception as e:
+                conn.rollback()
+                st.error(f"Failed to save session: {e}")
+                return False
+    return False
 
-def update_employee_password(employee_id, current_password, new_password):
-    """Update employee password."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            
-            # Verify current password
-            cur.execute("""
-            SELECT password_hash FROM employee
-            WHERE id = %s
-            """, (employee_id,))
-            
-            result = cur.fetchone()
-            if not result or not bcrypt.checkpw(current_password.encode('utf-8'), result[0].encode('utf-8')):
-                return False, "Current password is incorrect"
-            
-            # Hash the new password
-            password_hash = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-            
-            # Update password
-            cur.execute("""
-            UPDATE employee
-            SET password_hash = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-            """, (password_hash, employee_id))
-            
-            conn.commit()
-            cur.close()
-            return True, "Password updated successfully"
-        except Exception as e:
-            conn.rollback()
-            return False, f"Failed to update password: {e}"
-        finally:
-            conn.close()
-    return False, "Database connection failed"
+def delete_user_session(session_id):
+    """Delete a server-side session."""
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("DELETE FROM user_session WHERE id = %s", (session_id,))
+                conn.commit()
+                cur.close()
+                return True
+            except Exception as e:
+                conn.rollback()
+                st.error(f"Failed to delete session: {e}")
+                return False
+    return False
+
+def purge_expired_sessions():
+    """Delete expired server-side sessions and return how many were removed."""
+    with pooled_connection() as conn:
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("DELETE FROM user_session WHERE expires_at <= CURRENT_TIMESTAMP")
+                purged = cur.rowcount
+                conn.commit()
+                cur.close()
+                return purged
+            except Exception as e:
+                conn.rollback()
+                st.error(f"Failed to purge sessions: {e}")
+                return 0
+    return 0
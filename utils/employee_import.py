@@ -0,0 +1,180 @@
+# utils/employee_import.py
+"""Bulk employee onboarding from a CSV file.
+
+The CSV needs a header row with employee_name, username, password, role and branch
+(the branch's name) columns, and may have a profile_pic column. Every row is validated
+first; the passwords of the valid rows are then hashed across the password process pool
+and the employees created with batched inserts in one transaction. The result is a
+report with one entry per CSV row saying whether it was created and, if not, why.
+
+    python -m utils.employee_import employees.csv --company-id 3 [--dry-run]
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.db import connection_released, get_branches, get_existing_usernames, bulk_create_employees
+from utils.passwords import hash_passwords
+from utils.urls import clean_url
+
+REQUIRED_COLUMNS = ("employee_name", "username", "password", "role", "branch")
+EMPLOYEE_ROLES = ("manager", "asst_manager", "employee")
+IMPORT_MAX_ROWS = 5000  # rows accepted in one file from the command line
+IMPORT_MAX_ROWS_PAGE = 500  # rows accepted from the web page, whose hashing shares the login pool
+# Column limits of the employee table
+MAX_NAME_LENGTH = 100
+MAX_USERNAME_LENGTH = 50
+MAX_PROFILE_PIC_LENGTH = 255
+
+def read_employee_csv(text, max_rows=IMPORT_MAX_ROWS):
+    """Parse CSV text into a list of rows (dicts with a "line" number); raise ValueError if unusable."""
+    reader = csv.DictReader(io.StringIO(text.lstrip("\ufeff")))
+    columns = [column.strip().lower() for column in reader.fieldnames or []]
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+    reader.fieldnames = columns
+
+    rows = []
+    for row in reader:
+        if not any((value or "").strip() for value in row.values() if isinstance(value, str)):
+            continue  # Skip blank lines
+        if len(rows) >= max_rows:
+            raise ValueError(f"Too many rows; import at most {max_rows} employees at a time")
+        rows.append(dict(row, line=reader.line_num))
+    return rows
+
+def _validate_row(row, branches_by_name, seen_usernames):
+    """Return an error message for a row, or None if it can be imported."""
+    name = (row.get("employee_name") or "").strip()
+    username = (row.get("username") or "").strip()
+    role = (row.get("role") or "").strip().lower()
+    branch_name = (row.get("branch") or "").strip()
+    profile_pic = (row.get("profile_pic") or "").strip()
+
+    if not name or not username or not row.get("password") or not role or not branch_name:
+        return "Please fill all required fields"
+    if len(name) > MAX_NAME_LENGTH:
+        return f"Employee name is longer than {MAX_NAME_LENGTH} characters"
+    if len(username) > MAX_USERNAME_LENGTH:
+        return f"Username is longer than {MAX_USERNAME_LENGTH} characters"
+    if username in seen_usernames:
+        return "Username appears more than once in the file"
+    if role not in EMPLOYEE_ROLES:
+        return f"Role must be one of: {', '.join(EMPLOYEE_ROLES)}"
+    branch = branches_by_name.get(branch_name.lower())
+    if branch is None:
+        return f"Branch '{branch_name}' not found"
+    if not branch[3]:
+        return f"Branch '{branch_name}' is inactive"
+    if len(profile_pic) > MAX_PROFILE_PIC_LENGTH:
+        return f"Profile picture URL is longer than {MAX_PROFILE_PIC_LENGTH} characters"
+    return None
+
+def import_employees(text, company_id, created_by, created_by_id, dry_run=False, pool=None, workers=None,
+                     max_rows=IMPORT_MAX_ROWS):
+    """Validate and import the employees in a CSV file.
+
+    Returns (report, created count); report has one {"line", "username", "status", "message"}
+    dict per row, with status "created", "valid" (dry run) or "error". pool and workers
+    replace the shared password pool, e.g. for a command-line run that may use every core.
+    Raises ValueError if the file itself cannot be used or has more than max_rows rows.
+    """
+    rows = read_employee_csv(text, max_rows)
+    branches = get_branches(company_id)
+    branches_by_name = {branch[1].strip().lower(): branch for branch in branches}
+
+    report = []
+    valid = []
+    seen_usernames = set()
+    for row in rows:
+        username = (row.get("username") or "").strip()
+        error = _validate_row(row, branches_by_name, seen_usernames)
+        if username:
+            # Case-sensitive, like the unique constraint and the login lookup
+            seen_usernames.add(username)
+        entry = {"line": row["line"], "username": username, "status": "error", "message": error}
+        report.append(entry)
+        if error is None:
+            valid.append((row, entry))
+
+    # Usernames are unique across companies, so check them all in one query
+    taken = get_existing_usernames([entry["username"] for row, entry in valid])
+    if taken is None:
+        raise ValueError("Could not check usernames against the database")
+    for row, entry in valid:
+        if entry["username"] in taken:
+            entry["message"] = "Username already exists"
+    valid = [(row, entry) for row, entry in valid if entry["message"] is None]
+
+    if dry_run or not valid:
+        for row, entry in valid:
+            entry["status"], entry["message"] = "valid", "Ready to import"
+        return report, 0
+
+    with connection_released():
+        password_hashes = hash_passwords([row["password"] for row, entry in valid], pool=pool, workers=workers)
+    employees = []
+    for (row, entry), password_hash in zip(valid, password_hashes):
+        name = row["employee_name"].strip()
+        profile_pic = (row.get("profile_pic") or "").strip()
+        employees.append((
+            name, entry["username"], password_hash,
+            clean_url(profile_pic) if profile_pic else f"https://ui-avatars.com/api/?name={name}&background=random",
+            row["role"].strip().lower(), branches_by_name[row["branch"].strip().lower()][0]
+        ))
+
+    created = bulk_create_employees(employees, company_id, created_by, created_by_id)
+    for row, entry in valid:
+        if created is None:
+            entry["message"] = "Import failed; no employees were created"
+        elif entry["username"] in created:
+            entry["status"], entry["message"] = "created", f"Employee ID {created[entry['username']]}"
+        else:
+            # Taken by another session between the check and the insert
+            entry["message"] = "Username already exists"
+    return report, len(created or {})
+
+def report_to_csv(report):
+    """Render an import report as CSV text for download."""
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=["line", "username", "status", "message"])
+    writer.writeheader()
+    writer.writerows(report)
+    return output.getvalue()
+
+def main():
+    """Import employees for a company from a CSV file using the app's secrets."""
+    parser = argparse.ArgumentParser(description="Bulk-import employees from a CSV file.")
+    parser.add_argument("csv_file", help="CSV with employee_name, username, password, role, branch[, profile_pic]")
+    parser.add_argument("--company-id", type=int, required=True, help="company the employees join")
+    parser.add_argument("--dry-run", action="store_true", help="validate only, create nothing")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes hashing passwords")
+    args = parser.parse_args()
+
+    with open(args.csv_file, encoding="utf-8") as f:
+        text = f.read()
+
+    # Nothing else is waiting on the hashing here, so it can use every core
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        try:
+            report, created = import_employees(text, args.company_id, "company", args.company_id,
+                                               dry_run=args.dry_run, pool=pool, workers=args.workers)
+        except ValueError as e:
+            print(f"Import failed: {e}")
+            sys.exit(1)
+
+    errors = [entry for entry in report if entry["status"] == "error"]
+    for entry in errors:
+        print(f"line {entry['line']:>5}  {entry['username'] or '-'}: {entry['message']}")
+    if args.dry_run:
+        print(f"{len(report) - len(errors)} of {len(report)} rows are ready to import.")
+    else:
+        print(f"Created {created} of {len(report)} employees.")
+    sys.exit(1 if errors else 0)
+
+if __name__ == "__main__":
+    main()
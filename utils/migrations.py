@@ -0,0 +1,468 @@
+# utils/migrations.py
+"""Versioned schema migrations.
+
+Each migration is applied at most once and recorded in the schema_version table.
+Migrations run in order, each in its own transaction, under an advisory lock so
+several app processes booting at the same time cannot apply the same step twice.
+
+Run pending migrations before boot with:
+
+    python -m utils.migrations
+"""
+
+# Arbitrary constant used as the advisory lock key for the migration runner
+MIGRATION_LOCK_ID = 4_815_162_342
+
+# Longest pause between the copies of one legacy branch broadcast (see migration 4)
+BROADCAST_GAP = "5 seconds"
+
+# Ordered list of (version, description, [statements]). Never edit a migration that has
+# shipped; append a new one instead.
+MIGRATIONS = [
+    (1, "Initial schema", [
+        # Admin table
+        """
+        CREATE TABLE IF NOT EXISTS admin (
+            id SERIAL PRIMARY KEY,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            profile_name VARCHAR(100) NOT NULL,
+            profile_pic VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Company table
+        """
+        CREATE TABLE IF NOT EXISTS company (
+            id SERIAL PRIMARY KEY,
+            company_name VARCHAR(100) NOT NULL,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            profile_pic VARCHAR(255),
+            is_active BOOLEAN DEFAULT TRUE,
+            created_by INTEGER REFERENCES admin(id),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Branch table
+        """
+        CREATE TABLE IF NOT EXISTS branch (
+            id SERIAL PRIMARY KEY,
+            branch_name VARCHAR(100) NOT NULL,
+            company_id INTEGER REFERENCES company(id),
+            is_main_branch BOOLEAN DEFAULT FALSE,
+            is_active BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(branch_name, company_id)
+        )
+        """,
+        # Employee table
+        """
+        CREATE TABLE IF NOT EXISTS employee (
+            id SERIAL PRIMARY KEY,
+            employee_name VARCHAR(100) NOT NULL,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            profile_pic VARCHAR(255),
+            role VARCHAR(20) CHECK (role IN ('manager', 'asst_manager', 'employee')),
+            company_id INTEGER REFERENCES company(id),
+            branch_id INTEGER REFERENCES branch(id),
+            is_active BOOLEAN DEFAULT TRUE,
+            created_by VARCHAR(20) NOT NULL,
+            created_by_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Task table
+        """
+        CREATE TABLE IF NOT EXISTS task (
+            id SERIAL PRIMARY KEY,
+            title VARCHAR(100) NOT NULL,
+            description TEXT,
+            assigned_to VARCHAR(20) NOT NULL, -- 'branch' or 'employee'
+            assigned_id INTEGER NOT NULL,
+            assigned_by VARCHAR(20) NOT NULL, -- 'company', 'manager', or 'asst_manager'
+            assigned_by_id INTEGER NOT NULL,
+            is_completed BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Employee task completion table
+        """
+        CREATE TABLE IF NOT EXISTS task_completion (
+            id SERIAL PRIMARY KEY,
+            task_id INTEGER REFERENCES task(id),
+            employee_id INTEGER REFERENCES employee(id),
+            is_completed BOOLEAN DEFAULT FALSE,
+            completed_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Report table
+        """
+        CREATE TABLE IF NOT EXISTS report (
+            id SERIAL PRIMARY KEY,
+            employee_id INTEGER REFERENCES employee(id),
+            report_date DATE NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Message table
+        """
+        CREATE TABLE IF NOT EXISTS message (
+            id SERIAL PRIMARY KEY,
+            sender_type VARCHAR(20) NOT NULL, -- 'admin', 'company', 'manager', 'asst_manager', 'employee'
+            sender_id INTEGER NOT NULL,
+            receiver_type VARCHAR(20) NOT NULL, -- 'company', 'branch', 'employee'
+            receiver_id INTEGER NOT NULL,
+            message_text TEXT,
+            attachment_link VARCHAR(255),
+            is_deleted BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Default admin
+        """
+        INSERT INTO admin (username, profile_name, profile_pic)
+        SELECT 'admin', 'System Administrator', 'https://ui-avatars.com/api/?name=Admin&background=random'
+        WHERE NOT EXISTS (SELECT 1 FROM admin WHERE username = 'admin')
+        """,
+    ]),
+    (2, "Indexes for task, report, message and employee lookups", [
+        # get_tasks(branch_id / assigned_to + assigned_id) ORDER BY created_at DESC
+        """
+        CREATE INDEX IF NOT EXISTS idx_task_assignee
+        ON task (assigned_to, assigned_id, created_at DESC)
+        """,
+        # get_tasks(company_id / assigned_by + assigned_by_id) ORDER BY created_at DESC
+        """
+        CREATE INDEX IF NOT EXISTS idx_task_assigner
+        ON task (assigned_by, assigned_by_id, created_at DESC)
+        """,
+        # complete_task and per-task progress lookups
+        """
+        CREATE INDEX IF NOT EXISTS idx_task_completion_task_employee
+        ON task_completion (task_id, employee_id)
+        """,
+        # get_tasks(employee_id) joins task_completion on the employee first
+        """
+        CREATE INDEX IF NOT EXISTS idx_task_completion_employee
+        ON task_completion (employee_id, task_id)
+        """,
+        # get_employees(branch_id), branch task fan-out and completion checks
+        """
+        CREATE INDEX IF NOT EXISTS idx_employee_branch_active
+        ON employee (branch_id, is_active)
+        """,
+        # get_employees(company_id), get_reports(company_id)
+        """
+        CREATE INDEX IF NOT EXISTS idx_employee_company
+        ON employee (company_id)
+        """,
+        # get_branches(company_id); UNIQUE(branch_name, company_id) leads with the name
+        """
+        CREATE INDEX IF NOT EXISTS idx_branch_company
+        ON branch (company_id)
+        """,
+        # get_reports(employee_id, start_date, end_date) and submit_report lookups
+        """
+        CREATE INDEX IF NOT EXISTS idx_report_employee_date
+        ON report (employee_id, report_date DESC)
+        """,
+        # Inbox: get_messages(receiver_type, receiver_id) on live messages
+        """
+        CREATE INDEX IF NOT EXISTS idx_message_receiver
+        ON message (receiver_type, receiver_id, created_at DESC)
+        WHERE is_deleted = FALSE
+        """,
+        # Sent history: get_messages(sender_type, sender_id) on live messages
+        """
+        CREATE INDEX IF NOT EXISTS idx_message_sender
+        ON message (sender_type, sender_id, created_at DESC)
+        WHERE is_deleted = FALSE
+        """,
+    ]),
+    (3, "One report per employee per day", [
+        # Keep the most recently updated report when a day was submitted more than once
+        """
+        DELETE FROM report r
+        USING report newer
+        WHERE r.employee_id = newer.employee_id
+          AND r.report_date = newer.report_date
+          AND (COALESCE(r.updated_at, r.created_at), r.id)
+              < (COALESCE(newer.updated_at, newer.created_at), newer.id)
+        """,
+        """
+        ALTER TABLE report
+        ADD CONSTRAINT report_employee_date_key UNIQUE (employee_id, report_date)
+        """,
+        # The unique constraint's index serves the same lookups
+        """
+        DROP INDEX IF EXISTS idx_report_employee_date
+        """,
+    ]),
+    (4, "Store branch broadcasts once with a recipients table", [
+        # A broadcast is one message row (receiver_type 'branch') plus one recipient row per employee
+        """
+        CREATE TABLE IF NOT EXISTS message_recipient (
+            message_id INTEGER NOT NULL REFERENCES message(id) ON DELETE CASCADE,
+            employee_id INTEGER NOT NULL REFERENCES employee(id),
+            PRIMARY KEY (message_id, employee_id)
+        )
+        """,
+        # Employee inbox lookups
+        """
+        CREATE INDEX IF NOT EXISTS idx_message_recipient_employee
+        ON message_recipient (employee_id, message_id)
+        """,
+        # Company "Send to Branch" used to store a broadcast as identical rows, one per employee,
+        # written back to back. A burst is a run of identical rows from one company whose
+        # consecutive send times are at most BROADCAST_GAP apart. Only bursts to more than one
+        # employee, all currently in the same branch, are collapsed. Direct messages from
+        # managers are never touched, and neither are bursts spanning several branches (e.g.
+        # after a transfer). Those stay as direct messages, so nothing is lost.
+        f"""
+        CREATE TEMP TABLE broadcast_copy ON COMMIT DROP AS
+        WITH copies AS (
+            SELECT m.id, m.receiver_id, e.branch_id, m.sender_id,
+                   COALESCE(m.message_text, '') AS message_text,
+                   COALESCE(m.attachment_link, '') AS attachment_link,
+                   m.is_deleted, m.created_at
+            FROM message m
+            JOIN employee e ON e.id = m.receiver_id
+            WHERE m.receiver_type = 'employee' AND m.sender_type = 'company'
+        ), gaps AS (
+            SELECT c.*,
+                   CASE WHEN c.created_at - LAG(c.created_at) OVER same_message <= INTERVAL '{BROADCAST_GAP}'
+                        THEN 0 ELSE 1 END AS starts_burst
+            FROM copies c
+            WINDOW same_message AS (
+                PARTITION BY sender_id, message_text, attachment_link, is_deleted ORDER BY created_at, id
+            )
+        ), bursts AS (
+            SELECT g.*,
+                   SUM(starts_burst) OVER (
+                       PARTITION BY sender_id, message_text, attachment_link, is_deleted ORDER BY created_at, id
+                   ) AS burst
+            FROM gaps g
+        ), broadcasts AS (
+            SELECT sender_id, message_text, attachment_link, is_deleted, burst,
+                   MIN(id) AS keep_id, MIN(branch_id) AS branch_id
+            FROM bursts
+            GROUP BY sender_id, message_text, attachment_link, is_deleted, burst
+            HAVING COUNT(DISTINCT receiver_id) > 1 AND COUNT(DISTINCT branch_id) = 1
+        )
+        SELECT b.id, bc.branch_id, b.receiver_id, bc.keep_id
+        FROM bursts b
+        JOIN broadcasts bc USING (sender_id, message_text, attachment_link, is_deleted, burst)
+        """,
+        """
+        INSERT INTO message_recipient (message_id, employee_id)
+        SELECT keep_id, receiver_id FROM broadcast_copy
+        ON CONFLICT DO NOTHING
+        """,
+        """
+        UPDATE message m
+        SET receiver_type = 'branch', receiver_id = bc.branch_id
+        FROM broadcast_copy bc
+        WHERE m.id = bc.id AND bc.id = bc.keep_id
+        """,
+        """
+        DELETE FROM message m
+        USING broadcast_copy bc
+        WHERE m.id = bc.id AND bc.id <> bc.keep_id
+        """,
+    ]),
+    (5, "Keyset-ordered message indexes for conversation views", [
+        # Add id as a tie-breaker so (created_at, id) cursors are served straight from the index.
+        # Each replacement is built under a new name while the old index keeps serving reads;
+        # writes to message wait for the builds (a few seconds per million rows) and the swap
+        # itself only holds its exclusive lock until the migration commits.
+        """
+        CREATE INDEX idx_message_receiver_keyset
+        ON message (receiver_type, receiver_id, created_at DESC, id DESC)
+        WHERE is_deleted = FALSE
+        """,
+        """
+        CREATE INDEX idx_message_sender_keyset
+        ON message (sender_type, sender_id, created_at DESC, id DESC)
+        WHERE is_deleted = FALSE
+        """,
+        """
+        DROP INDEX IF EXISTS idx_message_receiver
+        """,
+        """
+        ALTER INDEX idx_message_receiver_keyset RENAME TO idx_message_receiver
+        """,
+        """
+        DROP INDEX IF EXISTS idx_message_sender
+        """,
+        """
+        ALTER INDEX idx_message_sender_keyset RENAME TO idx_message_sender
+        """,
+    ]),
+    (6, "Keyset-ordered task and employee indexes for paginated lists", [
+        # Built under new names and swapped in, as in migration 5: reads keep the old indexes
+        # during the builds, writes to task and employee wait for them.
+        # get_tasks pages on (created_at, id)
+        """
+        CREATE INDEX idx_task_assignee_keyset
+        ON task (assigned_to, assigned_id, created_at DESC, id DESC)
+        """,
+        """
+        CREATE INDEX idx_task_assigner_keyset
+        ON task (assigned_by, assigned_by_id, created_at DESC, id DESC)
+        """,
+        # get_employees(company_id) pages on (role, created_at, id)
+        """
+        CREATE INDEX idx_employee_company_keyset
+        ON employee (company_id, role, created_at DESC, id DESC)
+        """,
+        """
+        DROP INDEX IF EXISTS idx_task_assignee
+        """,
+        """
+        ALTER INDEX idx_task_assignee_keyset RENAME TO idx_task_assignee
+        """,
+        """
+        DROP INDEX IF EXISTS idx_task_assigner
+        """,
+        """
+        ALTER INDEX idx_task_assigner_keyset RENAME TO idx_task_assigner
+        """,
+        """
+        DROP INDEX IF EXISTS idx_employee_company
+        """,
+        """
+        ALTER INDEX idx_employee_company_keyset RENAME TO idx_employee_company
+        """,
+    ]),
+    (7, "Server-side session store", [
+        # Written by utils/sessions when [session] store = "postgres"
+        """
+        CREATE TABLE IF NOT EXISTS user_session (
+            id VARCHAR(64) PRIMARY KEY,
+            data JSONB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_user_session_expires
+        ON user_session (expires_at)
+        """,
+    ]),
+    (8, "One completion row per task and employee", [
+        # Keep the completed row, then the most recently completed or updated one
+        """
+        DELETE FROM task_completion tc
+        USING (
+            SELECT id,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY task_id, employee_id
+                       ORDER BY is_completed DESC, completed_at DESC NULLS LAST,
+                                COALESCE(updated_at, created_at) DESC NULLS LAST, id DESC
+                   ) AS position
+            FROM task_completion
+        ) ranked
+        WHERE tc.id = ranked.id AND ranked.position > 1
+        """,
+        # Build the index first (SHARE lock: reads go on, writes wait for the build), then
+        # promote it, which only needs a brief exclusive lock
+        """
+        CREATE UNIQUE INDEX task_completion_task_employee_key
+        ON task_completion (task_id, employee_id)
+        """,
+        """
+        ALTER TABLE task_completion
+        ADD CONSTRAINT task_completion_task_employee_key
+        UNIQUE USING INDEX task_completion_task_employee_key
+        """,
+        # The unique constraint's index serves the same lookups
+        """
+        DROP INDEX IF EXISTS idx_task_completion_task_employee
+        """,
+    ]),
+]
+
+def get_schema_version(cur):
+    """Return the highest applied migration version (0 for an empty database)."""
+    cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cur.fetchone()[0]
+
+def run_migrations(conn):
+    """Apply every pending migration in order and return the list of versions applied."""
+    applied = []
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        conn.commit()
+
+        # Serialize concurrent runners; the lock is released when the session ends at the latest
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            current_version = get_schema_version(cur)
+            conn.commit()
+
+            for version, description, statements in MIGRATIONS:
+                if version <= current_version:
+                    continue
+                try:
+                    for statement in statements:
+                        cur.execute(statement)
+                    cur.execute("""
+                    INSERT INTO schema_version (version, description)
+                    VALUES (%s, %s)
+                    """, (version, description))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                applied.append(version)
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+            conn.commit()
+    finally:
+        cur.close()
+    return applied
+
+def main():
+    """Apply pending migrations from the command line using the app's secrets."""
+    import psycopg2
+    import streamlit as st
+
+    settings = st.secrets["postgres"]
+    conn = psycopg2.connect(
+        dbname=settings["dbname"],
+        user=settings["user"],
+        password=settings["password"],
+        host=settings["host"],
+        port=settings["port"]
+    )
+    try:
+        applied = run_migrations(conn)
+    finally:
+        conn.close()
+
+    if applied:
+        print(f"Applied migrations: {', '.join(str(v) for v in applied)}")
+    else:
+        print("Database schema is up to date.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# utils/passwords.py
+"""bcrypt hashing off the Streamlit script thread.
+
+bcrypt is deliberately slow, so hashing and checking passwords inline lets a burst of
+logins pin every server core and stall other sessions' reruns. Here the work runs in a
+small, bounded process pool instead: at most hash_workers passwords are processed at
+once and the rest queue, which keeps the server responsive however many users log in
+together.
+
+The work factor is set with bcrypt_rounds, and the pool size with hash_workers, in the
+[auth] section of the Streamlit secrets. Hashes made with a different work factor are
+reported by check_password() so the caller can rehash them on the next successful login.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+import streamlit as st
+
+BCRYPT_ROUNDS = 12  # bcrypt work factor for new hashes (each +1 doubles the cost)
+HASH_MAX_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))  # processes hashing at once
+HASH_WORKERS_KEPT_FOR_LOGINS = 1  # pool workers a bulk hash_passwords() call leaves free
+LOGIN_LATENCY_SAMPLES = 500  # recent logins kept for the latency percentiles
+
+# Worker functions (module level so the process pool can pickle them)
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+def _checkpw(password, password_hash):
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+def get_auth_setting(name, default):
+    """Numeric setting from the [auth] section of the secrets, or the default."""
+    try:
+        return int(st.secrets.get("auth", {}).get(name, default))
+    except Exception:
+        return default
+
+def get_bcrypt_rounds():
+    """Work factor for new password hashes, from secrets or the default."""
+    return get_auth_setting("bcrypt_rounds", BCRYPT_ROUNDS)
+
+@st.cache_resource(show_spinner=False)
+def get_hash_pool():
+    """Create the password hashing process pool once per Streamlit server process."""
+    # spawn rather than fork: forking the threaded Streamlit server can copy held locks
+    return ProcessPoolExecutor(
+        max_workers=get_auth_setting("hash_workers", HASH_MAX_WORKERS),
+        mp_context=multiprocessing.get_context("spawn")
+    )
+
+def _run(func, *args):
+    """Run func in the hashing pool, falling back to this thread if the pool has died."""
+    try:
+        return get_hash_pool().submit(func, *args).result()
+    except BrokenProcessPool:
+        # A worker was killed; start a fresh pool for the next call
+        get_hash_pool.clear()
+        return func(*args)
+
+def hash_password(password):
+    """Hash a password with the configured work factor."""
+    return _run(_hashpw, password, get_bcrypt_rounds())
+
+def hash_passwords(passwords, pool=None, workers=None):
+    """Hash many passwords, spread over the hashing pool or a pool of the given size.
+    
+    Work is submitted one batch at a time. On the shared pool a batch leaves
+    HASH_WORKERS_KEPT_FOR_LOGINS workers idle, so a login arriving meanwhile is picked up
+    at once instead of queueing behind the list (with a single worker it waits for one hash).
+    """
+    shared = pool is None
+    if shared:
+        pool = get_hash_pool()
+        workers = get_auth_setting("hash_workers", HASH_MAX_WORKERS) - HASH_WORKERS_KEPT_FOR_LOGINS
+    rounds = get_bcrypt_rounds()
+    batch_size = max(1, workers or 1)
+    hashes = []
+    for start in range(0, len(passwords), batch_size):
+        batch = passwords[start:start + batch_size]
+        try:
+            futures = [pool.submit(_hashpw, password, rounds) for password in batch]
+            hashes.extend([future.result() for future in futures])
+        except BrokenProcessPool:
+            if not shared:
+                raise
+            get_hash_pool.clear()
+            pool = get_hash_pool()
+            hashes.extend([_hashpw(password, rounds) for password in batch])
+    return hashes
+
+def needs_rehash(password_hash):
+    """Check if a hash was made with a different work factor than the configured one."""
+    try:
+        return int(password_hash.split("$")[2]) != get_bcrypt_rounds()
+    except (IndexError, ValueError):
+        return True
+
+def check_password(password, password_hash):
+    """Check a password against its hash.
+
+    Returns (matches, needs_rehash); needs_rehash is only True for a matching password
+    whose hash should be replaced with one made at the configured work factor.
+    """
+    if not password_hash:
+        return False, False
+    matches = _run(_checkpw, password, password_hash)
+    return matches, matches and needs_rehash(password_hash)
+
+class LoginMetrics:
+    """Process-wide login latency counters, used to size the hashing pool."""
+
+    def __init__(self, samples):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=samples)
+        self.logins = 0
+        self.failures = 0
+        self.max_latency = 0.0
+
+    def record(self, seconds, success):
+        with self._lock:
+            self._latencies.append(seconds)
+            self.logins += 1
+            if not success:
+                self.failures += 1
+            self.max_latency = max(self.max_latency, seconds)
+
+    def stats(self):
+        """Login counts and latencies (in milliseconds) since the server process started."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            logins, failures, max_latency = self.logins, self.failures, self.max_latency
+        if not latencies:
+            return {"logins": logins, "failures": failures, "avg_ms": 0, "p95_ms": 0, "max_ms": 0}
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return {"logins": logins, "failures": failures,
+                "avg_ms": round(sum(latencies) / len(latencies) * 1000),
+                "p95_ms": round(p95 * 1000), "max_ms": round(max_latency * 1000)}
+
+@st.cache_resource(show_spinner=False)
+def get_login_metrics():
+    """Create the shared login metrics once per Streamlit server process."""
+    return LoginMetrics(LOGIN_LATENCY_SAMPLES)
+
+def record_login(started, success):
+    """Record one login attempt that began at time.monotonic() value started."""
+    get_login_metrics().record(time.monotonic() - started, success)
+
+def get_login_stats():
+    """Get the login latency counters."""
+    return get_login_metrics().stats()
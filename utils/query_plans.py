@@ -0,0 +1,196 @@
+# utils/query_plans.py
+"""Check that the hot queries in utils/db.py are served by their indexes.
+
+Builds the full schema in a scratch Postgres schema, seeds it with a realistic
+volume of rows, runs EXPLAIN on the query shape each db function issues and
+fails if an expected index does not appear in the plan. Everything runs in one
+transaction that is rolled back, so it is safe to point at a shared database.
+
+    python -m utils.query_plans
+"""
+import json
+import sys
+from datetime import datetime
+
+from utils.db import (
+    BRANCHES_SQL, EMPLOYEE_TASK_STATS_SQL, TASK_PROGRESS_SQL, COMPLETE_TASK_MARK_SQL, COMPLETE_TASK_CLOSE_SQL,
+    employees_query, tasks_query, task_counts_query, task_inbox_query, reports_query, report_count_query,
+    messages_query, conversation_query
+)
+from utils.migrations import MIGRATIONS
+
+SCRATCH_SCHEMA = "query_plan_check"
+
+# Row volumes roughly matching a large tenant mix
+SEED_STATEMENTS = [
+    """
+    INSERT INTO company (company_name, username, password_hash, created_by)
+    SELECT 'Company ' || g, 'company' || g, 'x', 1
+    FROM generate_series(1, 50) g
+    """,
+    """
+    INSERT INTO branch (branch_name, company_id, is_main_branch)
+    SELECT 'Branch ' || g, (g % 50) + 1, g <= 50
+    FROM generate_series(1, 500) g
+    """,
+    """
+    INSERT INTO employee (employee_name, username, password_hash, role, company_id, branch_id,
+                          is_active, created_by, created_by_id)
+    SELECT 'Employee ' || g, 'employee' || g, 'x',
+           CASE g % 10 WHEN 0 THEN 'manager' WHEN 1 THEN 'asst_manager' ELSE 'employee' END,
+           (((g % 500) + 1) % 50) + 1, (g % 500) + 1, g % 25 <> 0, 'company', 1
+    FROM generate_series(1, 25000) g
+    """,
+    """
+    INSERT INTO task (title, description, assigned_to, assigned_id, assigned_by, assigned_by_id,
+                      is_completed, created_at)
+    SELECT 'Task ' || g, repeat('details ', 50),
+           CASE WHEN g % 4 = 0 THEN 'branch' ELSE 'employee' END,
+           CASE WHEN g % 4 = 0 THEN (g % 500) + 1 ELSE (g % 25000) + 1 END,
+           CASE g % 3 WHEN 0 THEN 'company' WHEN 1 THEN 'manager' ELSE 'asst_manager' END,
+           CASE WHEN g % 3 = 0 THEN (g % 50) + 1 ELSE (g % 25000) + 1 END,
+           g % 2 = 0, CURRENT_TIMESTAMP - g * INTERVAL '1 minute'
+    FROM generate_series(1, 40000) g
+    """,
+    """
+    INSERT INTO task_completion (task_id, employee_id, is_completed)
+    SELECT (g % 40000) + 1, (g % 25000) + 1, g % 3 = 0
+    FROM generate_series(1, 150000) g
+    """,
+    """
+    INSERT INTO report (employee_id, report_date, content)
+    SELECT (g % 25000) + 1, CURRENT_DATE - (g / 25000), repeat('report ', 100)
+    FROM generate_series(0, 99999) g
+    """,
+    """
+    INSERT INTO message (sender_type, sender_id, receiver_type, receiver_id, message_text,
+                         is_deleted, created_at)
+    SELECT CASE WHEN g % 5 = 0 THEN 'company' ELSE 'employee' END,
+           CASE WHEN g % 5 = 0 THEN (g % 50) + 1 ELSE (g % 25000) + 1 END,
+           'employee', ((g * 7) % 25000) + 1, repeat('hello ', 20),
+           g % 20 = 0, CURRENT_TIMESTAMP - g * INTERVAL '1 second'
+    FROM generate_series(1, 200000) g
+    """,
+    """
+    INSERT INTO message (sender_type, sender_id, receiver_type, receiver_id, message_text)
+    SELECT 'company', (g % 50) + 1, 'branch', (g % 500) + 1, repeat('broadcast ', 20)
+    FROM generate_series(1, 5000) g
+    """,
+    """
+    INSERT INTO message_recipient (message_id, employee_id)
+    SELECT m.id, e.id
+    FROM message m
+    JOIN employee e ON e.branch_id = m.receiver_id AND e.is_active = TRUE
+    WHERE m.receiver_type = 'branch'
+    """,
+]
+
+# A fixed point in time for keyset cursors, so every run explains the same query
+CURSOR_TIME = datetime(2024, 1, 1)
+
+# (db function, query, params, index or indexes that must appear in the plan). The queries
+# come straight from the builders and statements in utils/db.py, so a check always explains
+# what the app actually runs.
+PLAN_CHECKS = [
+    ("get_branches(company_id)", BRANCHES_SQL, (7,), "idx_branch_company"),
+    ("get_employees(branch_id)", *employees_query(branch_id=7), "idx_employee_branch_active"),
+    ("get_employees(company_id)", *employees_query(company_id=7), "idx_employee_company"),
+    ("get_employees(company_id, page)",
+     *employees_query(company_id=7, limit=21, after=("asst_manager", CURSOR_TIME, 0)), "idx_employee_company"),
+    ("get_tasks(employee_id)", *tasks_query(employee_id=7), "idx_task_completion_employee"),
+    ("get_task_inbox(employee_id, pending)",
+     *task_inbox_query(7, is_completed=False, limit=5, summary=True), "idx_task_completion_employee"),
+    ("get_tasks(company_id)", *tasks_query(company_id=7), "idx_task_assigner"),
+    ("get_tasks(company_id, page)",
+     *tasks_query(company_id=7, limit=21, after=(CURSOR_TIME, 0), summary=True), "idx_task_assigner"),
+    ("get_tasks(branch_id)", *tasks_query(branch_id=8), "idx_task_assignee"),
+    ("get_task_counts(branch_id)", *task_counts_query(branch_id=8), "idx_task_assignee"),
+    ("get_task_counts(employee_id)", *task_counts_query(employee_id=7), "idx_task_completion_employee"),
+    ("get_employee_task_stats(branch_id)", EMPLOYEE_TASK_STATS_SQL, (8,), "idx_task_completion_employee"),
+    ("complete_task(mark completion)", COMPLETE_TASK_MARK_SQL,
+     {"task_id": 8, "employee_id": 7}, "task_completion_task_employee_key"),
+    ("complete_task(close branch task)", COMPLETE_TASK_CLOSE_SQL,
+     {"task_id": 8, "employee_id": 7}, "task_completion_task_employee_key"),
+    ("get_task_progress(task_ids)", TASK_PROGRESS_SQL, ([4, 8, 12, 16],), "task_completion_task_employee_key"),
+    ("get_reports(employee_id)", *reports_query(employee_id=7), "report_employee_date_key"),
+    ("get_report_count(employee_id)", *report_count_query(employee_id=7), "report_employee_date_key"),
+    ("get_messages(receiver, with broadcasts)", *messages_query("employee", 7),
+     ("idx_message_receiver", "idx_message_recipient_employee")),
+    ("get_messages(sender)", *messages_query(sender_type="employee", sender_id=7), "idx_message_sender"),
+    ("get_messages(sender, any branch, limit)",
+     *messages_query(receiver_type="branch", sender_type="company", sender_id=7, limit=5), "idx_message_sender"),
+    ("get_conversation(thread, cursor)",
+     *conversation_query("employee", 7, "employee", limit=10, after=(CURSOR_TIME, 0)),
+     ("idx_message_sender", "idx_message_receiver")),
+]
+
+def _index_names(plan):
+    """Collect every index referenced anywhere in an EXPLAIN (FORMAT JSON) plan node."""
+    names = set()
+    if "Index Name" in plan:
+        names.add(plan["Index Name"])
+    # INSERT ... ON CONFLICT probes its arbiter index without a scan node of its own
+    names.update(plan.get("Conflict Arbiter Indexes", []))
+    for child in plan.get("Plans", []):
+        names |= _index_names(child)
+    return names
+
+def build_scratch_schema(cur):
+    """Create the schema, apply every migration and seed it with test rows."""
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCRATCH_SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {SCRATCH_SCHEMA}")
+    cur.execute(f"SET search_path TO {SCRATCH_SCHEMA}")
+    for _version, _description, statements in MIGRATIONS:
+        for statement in statements:
+            cur.execute(statement)
+    for statement in SEED_STATEMENTS:
+        cur.execute(statement)
+    cur.execute("ANALYZE company, branch, employee, task, task_completion, report, message, message_recipient")
+
+def check_query_plans(conn):
+    """Run every plan check and return a list of (name, passed, indexes used)."""
+    results = []
+    cur = conn.cursor()
+    try:
+        build_scratch_schema(cur)
+        for name, query, params, expected in PLAN_CHECKS:
+            expected = (expected,) if isinstance(expected, str) else expected
+            cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+            plan = cur.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            used = _index_names(plan[0]["Plan"])
+            results.append((name, all(index in used for index in expected), used))
+    finally:
+        # Nothing seeded here is ever committed
+        conn.rollback()
+        cur.close()
+    return results
+
+def main():
+    """Run the plan checks against the database configured in the app's secrets."""
+    import psycopg2
+    import streamlit as st
+
+    settings = st.secrets["postgres"]
+    conn = psycopg2.connect(
+        dbname=settings["dbname"],
+        user=settings["user"],
+        password=settings["password"],
+        host=settings["host"],
+        port=settings["port"]
+    )
+    try:
+        results = check_query_plans(conn)
+    finally:
+        conn.close()
+
+    failures = 0
+    for name, passed, used in results:
+        status = "ok" if passed else "MISSING INDEX"
+        print(f"{status:>13}  {name}  (indexes used: {', '.join(sorted(used)) or 'none'})")
+        failures += not passed
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# utils/sessions.py
+"""Optional server-side store for login and navigation state.
+
+st.session_state only lives in the Streamlit process serving the browser, so without a
+shared store every replica behind a load balancer would need sticky sessions. With a
+store configured, utils/auth saves the session's auth and navigation keys under a random
+session id kept in a browser cookie, and any replica can pick the session up from there.
+
+Set store = "postgres" (the user_session table) or store = "file" (JSON files under
+path, for a single host or a shared volume) in the [session] section of the Streamlit
+secrets; ttl_hours sets how long an idle session lasts. Without a store, sessions stay
+in memory as before.
+"""
+import json
+import os
+import re
+import secrets
+import threading
+import time
+
+import streamlit as st
+
+from utils.db import load_user_session, save_user_session, delete_user_session, purge_expired_sessions
+
+SESSION_TTL_HOURS = 12  # hours an idle server-side session is kept
+SESSION_FILE_PATH = ".sessions"  # directory of the file-backed store
+SESSION_PURGE_INTERVAL = 900  # seconds between sweeps for expired sessions, per server process
+SESSION_TEMP_FILE_AGE = 300  # seconds before the sweep removes a file store's unfinished save
+# Session state keys saved to the store
+SESSION_KEYS = ("authenticated", "user_id", "username", "user_role", "company_id", "branch_id",
+                "profile_pic", "current_page")
+
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{32,64}$")
+
+def new_session_id():
+    """Random, unguessable id for a new server-side session."""
+    return secrets.token_urlsafe(32)
+
+def is_valid_session_id(session_id):
+    """Check a session id from a cookie before it reaches the store (and the file system)."""
+    return bool(session_id) and bool(_SESSION_ID.match(session_id))
+
+class SessionStore:
+    """Base of the session stores: load/save/delete sessions and sweep out expired ones."""
+
+    def __init__(self):
+        self._purge_lock = threading.Lock()
+        self._purged_at = 0.0
+
+    def purge_if_due(self):
+        """Sweep expired sessions on a background thread, at most once per SESSION_PURGE_INTERVAL.
+        
+        Called on every login, so the sweep (a scan of every file for the file store) must
+        neither run each time nor make the login wait. Each server process keeps its own
+        timer, so with several replicas the table or directory is swept once per interval
+        by each of them.
+        """
+        with self._purge_lock:
+            now = time.monotonic()
+            if now - self._purged_at < SESSION_PURGE_INTERVAL:
+                return False
+            self._purged_at = now
+        threading.Thread(target=self.purge_expired, daemon=True).start()
+        return True
+
+class PostgresSessionStore(SessionStore):
+    """Sessions in the user_session table, shared by every replica using the database."""
+
+    def load(self, session_id):
+        return load_user_session(session_id)
+
+    def save(self, session_id, data, ttl):
+        return save_user_session(session_id, data, ttl)
+
+    def delete(self, session_id):
+        return delete_user_session(session_id)
+
+    def purge_expired(self):
+        return purge_expired_sessions()
+
+class FileSessionStore(SessionStore):
+    """Sessions as JSON files in one directory, a stand-in for the database store."""
+
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, session_id):
+        return os.path.join(self.directory, f"{session_id}.json")
+
+    def load(self, session_id):
+        try:
+            with open(self._path(session_id)) as f:
+                entry = json.load(f)
+            # A file that is not a session entry (e.g. written by hand) reads as no session
+            return entry.get("data") if entry.get("expires_at", 0) > time.time() else None
+        except (OSError, ValueError, TypeError, AttributeError):
+            return None
+
+    def save(self, session_id, data, ttl):
+        path = self._path(session_id)
+        temp_path = f"{path}.{secrets.token_hex(4)}.tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump({"data": data, "expires_at": time.time() + ttl}, f)
+            # Atomic, so another replica never reads a half-written session
+            os.replace(temp_path, path)
+            return True
+        except OSError as e:
+            st.error(f"Failed to save session: {e}")
+            return False
+
+    def delete(self, session_id):
+        try:
+            os.remove(self._path(session_id))
+        except FileNotFoundError:
+            pass
+        return True
+
+    def purge_expired(self):
+        purged = 0
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                # Left behind by a save that died before its rename
+                purged += self._remove_stale_temp_file(os.path.join(self.directory, name))
+                continue
+            if not name.endswith(".json"):
+                continue
+            session_id = name[:-len(".json")]
+            if self.load(session_id) is None:
+                self.delete(session_id)
+                purged += 1
+        return purged
+
+    def _remove_stale_temp_file(self, path):
+        try:
+            if time.time() - os.path.getmtime(path) < SESSION_TEMP_FILE_AGE:
+                return 0  # Possibly a save still in progress
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
+
+def _session_settings():
+    try:
+        return st.secrets.get("session", {})
+    except Exception:
+        return {}
+
+@st.cache_resource(show_spinner=False)
+def get_session_store():
+    """Create the configured session store once per Streamlit server process, or None."""
+    settings = _session_settings()
+    store = settings.get("store")
+    if store == "postgres":
+        return PostgresSessionStore()
+    if store == "file":
+        return FileSessionStore(settings.get("path", SESSION_FILE_PATH))
+    return None
+
+def get_session_ttl():
+    """Seconds an idle server-side session is kept, from secrets or the default."""
+    try:
+        return float(_session_settings().get("ttl_hours", SESSION_TTL_HOURS)) * 3600
+    except (TypeError, ValueError):
+        return SESSION_TTL_HOURS * 3600
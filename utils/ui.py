@@ -5,6 +5,7 @@ import base64
 from PIL import Image
 import io
 from utils.auth import login_user, logout_user
+from utils.urls import clean_url  # Re-exported for the pages
 
 def set_page_config(title="Company Management System"):
     """Set page configuration."""
@@ -94,12 +95,12 @@ def render_login_form():
                 if not username or not password:
                     st.error("Please enter both username and password")
                 else:
-                    success = login_user(username, password, role)
+                    success, message = login_user(username, password, role, remember=remember_me)
                     if success:
                         st.success("Login successful!")
                         st.rerun()
                     else:
-                        st.error("Invalid username or password")
+                        st.error(message)
 
 def render_navigation(current_page, navigation_items):
     """Render navigation menu."""
@@ -265,6 +266,65 @@ def render_message_card(message, sender_info=None, receiver_info=None, can_delet
         
         st.divider()
 
+def render_freshness(dashboard, on_refresh, args=()):
+    """Render how old the figures of a stale-while-revalidate dashboard are, with a refresh button."""
+    col1, col2 = st.columns([4, 1])
+    
+    with col1:
+        if dashboard.loaded_at:
+            age = int(datetime.now().timestamp() - dashboard.loaded_at)
+            freshness = "just now" if age < 5 else f"{age // 60} min ago" if age >= 120 else f"{age}s ago"
+            status = " · refreshing…" if dashboard.refreshing else ""
+            st.caption(f"🕒 Updated {freshness}{status}")
+        if dashboard.error:
+            loaded = datetime.fromtimestamp(dashboard.loaded_at).strftime("%H:%M:%S") if dashboard.loaded_at else None
+            if loaded:
+                st.warning(f"Couldn't refresh ({dashboard.error}); showing figures from {loaded}.")
+            else:
+                st.error(f"Dashboard data is unavailable: {dashboard.error}")
+    
+    with col2:
+        st.button("↻ Refresh", key="dashboard_refresh", on_click=on_refresh, args=args, use_container_width=True)
+
+# Number of rows shown per page in paginated lists
+PAGE_SIZE = 20
+
+def get_page_cursor(key):
+    """Get the keyset cursor of the page currently shown in the list identified by key."""
+    cursors = st.session_state.setdefault(f"{key}_cursors", [])
+    return cursors[-1] if cursors else None
+
+def _next_page(key, cursor):
+    """Helper function to move a paginated list one page further."""
+    st.session_state[f"{key}_cursors"].append(cursor)
+
+def _previous_page(key):
+    """Helper function to move a paginated list one page back."""
+    st.session_state[f"{key}_cursors"].pop()
+
+def render_pagination(key, has_more, next_cursor, previous_label="← Previous", next_label="Next →"):
+    """Render previous/next buttons below a paginated list.
+    
+    The cursors of the pages already visited are kept in session state so going back a
+    page is just as cheap as moving forward.
+    """
+    cursors = st.session_state.setdefault(f"{key}_cursors", [])
+    if not cursors and not has_more:
+        return
+    
+    col1, col2, col3 = st.columns([1, 2, 1])
+    
+    with col1:
+        st.button(previous_label, key=f"{key}_previous", disabled=not cursors,
+                  on_click=_previous_page, args=(key,), use_container_width=True)
+    
+    with col2:
+        st.caption(f"Page {len(cursors) + 1}")
+    
+    with col3:
+        st.button(next_label, key=f"{key}_next", disabled=not has_more,
+                  on_click=_next_page, args=(key, next_cursor), use_container_width=True)
+
 def get_initials(name):
     """Get initials from name."""
     if not name:
@@ -304,14 +364,3 @@ def generate_placeholder_image(name, size=100):
     img_str = base64.b64encode(buffer.getvalue()).decode()
     
     return f"data:image/png;base64,{img_str}"
-
-def clean_url(url):
-    """Clean URL to ensure it's valid."""
-    if not url:
-        return None
-    
-    url = url.strip()
-    if not url.startswith(('http://', 'https://')):
-        url = 'https://' + url
-    
-    return url
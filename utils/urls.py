@@ -0,0 +1,13 @@
+# utils/urls.py
+"""URL helpers shared by the pages and the command-line tools (no Streamlit needed)."""
+
+def clean_url(url):
+    """Clean URL to ensure it's valid."""
+    if not url:
+        return None
+    
+    url = url.strip()
+    if not url.startswith(('http://', 'https://')):
+        url = 'https://' + url
+    
+    return url